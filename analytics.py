@@ -0,0 +1,219 @@
+# analytics.py
+"""Registration and payment analytics for the admin panel.
+
+For a period (last 24 hours by hour, last 7/30 days by day) the report has
+registrations, proofs submitted, approvals/rejections, proof review latency
+percentiles and the registration funnel. The chart is drawn by
+`charts.render_analytics` in a separate process, so matplotlib neither blocks
+the event loop nor holds the GIL while other updates are handled.
+
+Reports are cached per period for `ANALYTICS_CACHE_MINUTES`: every request in
+the same time bucket gets the same PNG, and concurrent requests share one
+render.
+
+`registration_steps` reports the FSM registration funnel recorded by
+`storage.SQLiteStorage`: users per step and how long they stay in it.
+"""
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import async_db
+from charts import render_analytics
+from config import ANALYTICS_CACHE_MINUTES, ANALYTICS_UTC_OFFSET_HOURS, ANALYTICS_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# kalit -> (sarlavha, davr, soatlikmi)
+PERIODS: Dict[str, Tuple[str, timedelta, bool]] = {
+    "24h": ("Oxirgi 24 soat", timedelta(hours=24), True),
+    "7d": ("Oxirgi 7 kun", timedelta(days=7), False),
+    "30d": ("Oxirgi 30 kun", timedelta(days=30), False),
+}
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending sequence."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{int(seconds)} son"
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes} daq"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours} soat {minutes} daq"
+    days, hours = divmod(hours, 24)
+    return f"{days} kun {hours} soat"
+
+
+def _bucket_labels(since_local: datetime, until_local: datetime, hourly: bool) -> List[str]:
+    if hourly:
+        step, fmt = timedelta(hours=1), "%Y-%m-%d %H:00"
+        current = since_local.replace(minute=0, second=0, microsecond=0)
+    else:
+        step, fmt = timedelta(days=1), "%Y-%m-%d"
+        current = since_local.replace(hour=0, minute=0, second=0, microsecond=0)
+    labels = []
+    while current <= until_local:
+        labels.append(current.strftime(fmt))
+        current += step
+    return labels
+
+
+def _fill(labels: List[str], series: List[Tuple[str, int]]) -> List[int]:
+    counts = dict(series)
+    return [counts.get(label, 0) for label in labels]
+
+
+def _caption(title: str, totals: Dict[str, int], latencies: List[float], funnel: Dict[str, int]) -> str:
+    registered = funnel["registered"]
+
+    def share(n: int) -> str:
+        return f"{n * 100 / registered:.0f}%" if registered else "-"
+
+    lines = [
+        f"📈 {title}",
+        f"🎯 Ro'yxatdan o'tganlar: {totals['registrations']}",
+        f"🧾 Cheklar: {totals['proofs']} yuborilgan, {totals['approved']} tasdiqlangan, "
+        f"{totals['rejected']} rad etilgan",
+        "⏱ Chekni ko'rib chiqish: " + ", ".join(
+            f"p{p} {format_duration(percentile(latencies, p))}" for p in LATENCY_PERCENTILES
+        ) + f" ({len(latencies)} ta)",
+        f"🔻 Voronka: {registered} → kurs {funnel['chose_course']} ({share(funnel['chose_course'])}) → "
+        f"chek {funnel['sent_proof']} ({share(funnel['sent_proof'])}) → "
+        f"to'lov {funnel['paid']} ({share(funnel['paid'])})",
+    ]
+    return "\n".join(lines)
+
+
+async def registration_steps(states: Sequence[str], days: int) -> Dict[str, Any]:
+    """{"steps": [...], "finished": n}. Per FSM state, in flow order: users who entered it,
+    share of the first step, share of the previous step, users whose last recorded state
+    it is, dwell p50/p95. `finished` - users whose state was cleared (done or cancelled)."""
+    since = time.time() - days * 86400
+    entries, last_states = await asyncio.gather(
+        async_db.funnel_dwell(states, since),
+        async_db.funnel_last_states(since),
+    )
+    users: Dict[str, set] = {s: set() for s in states}
+    dwell: Dict[str, List[float]] = {s: [] for s in states}
+    for state, user_id, seconds in entries:
+        users[state].add(user_id)
+        if seconds is not None:
+            dwell[state].append(seconds)
+
+    steps = []
+    first = prev = None
+    for state in states:
+        count = len(users[state])
+        first = count if first is None else first
+        values = sorted(dwell[state])
+        steps.append({
+            "state": state,
+            "users": count,
+            "of_first": count / first if first else None,
+            "of_prev": count / prev if prev else None,
+            "stuck": last_states.get(state, 0),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+        })
+        prev = count
+    return {"steps": steps, "finished": last_states.get(None, 0)}
+
+
+class Analytics:
+    def __init__(self, cache_minutes: int = 10, workers: int = 1,
+                 utc_offset_hours: int = 0) -> None:
+        self.cache_seconds = max(1, cache_minutes) * 60
+        self.workers = workers
+        self.utc_offset_hours = utc_offset_hours
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # davr -> (vaqt bo'lagi, tayyorlanayotgan yoki tayyor hisobot)
+        self._cache: Dict[str, Tuple[int, asyncio.Future]] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: bot jarayonidagi DB/HTTP threadlari bolaga nusxalanmaydi
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def report(self, period: str) -> Dict[str, Any]:
+        """{"caption": str, "png": bytes} for one of PERIODS."""
+        if period not in PERIODS:
+            raise ValueError(f"Unknown analytics period: {period}")
+        bucket = int(time.time() // self.cache_seconds)
+        cached = self._cache.get(period)
+        if cached is None or cached[0] != bucket:
+            future = asyncio.ensure_future(self._build(period))
+            self._cache[period] = (bucket, future)
+            future.add_done_callback(lambda f: self._forget_failed(period, f))
+        else:
+            future = cached[1]
+        # Bitta admin kutishni bekor qilsa, boshqalar uchun chizish davom etadi
+        return await asyncio.shield(future)
+
+    def _forget_failed(self, period: str, future: asyncio.Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            cached = self._cache.get(period)
+            if cached is not None and cached[1] is future:
+                del self._cache[period]
+
+    async def _build(self, period: str) -> Dict[str, Any]:
+        title, span, hourly = PERIODS[period]
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        since = now - span
+        series, latencies, funnel = await asyncio.gather(
+            async_db.analytics_series(since, hourly, self.utc_offset_hours),
+            async_db.review_latencies(since),
+            async_db.registration_funnel(since),
+        )
+
+        offset = timedelta(hours=self.utc_offset_hours)
+        labels = _bucket_labels(since + offset, now + offset, hourly)
+        payload = {
+            "title": title,
+            "labels": [label[11:] if hourly else label[5:] for label in labels],
+            "funnel": [funnel["registered"], funnel["chose_course"], funnel["sent_proof"], funnel["paid"]],
+        }
+        totals = {}
+        for name in ("registrations", "proofs", "approved", "rejected"):
+            payload[name] = _fill(labels, series[name])
+            totals[name] = sum(payload[name])
+
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(self._executor(), render_analytics, payload)
+        logger.info(f"Rendered analytics {period} in {time.perf_counter() - started:.2f}s")
+        return {"caption": _caption(title, totals, latencies, funnel), "png": png}
+
+    def shutdown(self) -> None:
+        for _, future in self._cache.values():
+            future.cancel()
+        self._cache.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+analytics = Analytics(
+    cache_minutes=ANALYTICS_CACHE_MINUTES,
+    workers=ANALYTICS_WORKERS,
+    utc_offset_hours=ANALYTICS_UTC_OFFSET_HOURS,
+)
@@ -0,0 +1,122 @@
+# async_db.py
+"""Awaitable mirror of `database.py` for use inside aiogram handlers.
+
+Every function here has the same name and signature as its counterpart in
+`database.py`, but runs the blocking sqlite3 call on a dedicated thread pool so
+the event loop keeps processing updates. Scripts should keep using the sync
+`database` module directly.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import database
+from config import DB_WORKERS
+from metrics import metrics
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+def _timed(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    # Navbatda kutish emas, faqat chaqiruvning o'zi o'lchanadi
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        metrics.observe("bot_db_seconds", getattr(func, "__name__", "call"), time.perf_counter() - started)
+
+
+async def run(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run any blocking DB callable on the DB thread pool (timed in `bot_db_seconds`)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(_timed, func, *args, **kwargs))
+
+
+def _awaitable(func: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown() -> None:
+    """Stop the DB thread pool and close pooled connections (called once on bot shutdown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    database.close_pool()
+
+
+# Courses
+add_course = _awaitable(database.add_course)
+list_courses = _awaitable(database.list_courses)
+delete_course = _awaitable(database.delete_course)
+get_course_by_id = _awaitable(database.get_course_by_id)
+get_course_name = _awaitable(database.get_course_name)
+list_available_courses = _awaitable(database.list_available_courses)
+list_full_courses = _awaitable(database.list_full_courses)
+count_course_users = _awaitable(database.count_course_users)
+
+# Users
+save_user = _awaitable(database.save_user)
+get_user_by_tg = _awaitable(database.get_user_by_tg)
+get_user_by_tg_id = _awaitable(database.get_user_by_tg_id)
+get_user_by_internal_id = _awaitable(database.get_user_by_internal_id)
+update_user_field = _awaitable(database.update_user_field)
+update_user_field_by_tg_id = _awaitable(database.update_user_field_by_tg_id)
+update_user_field_by_internal_id = _awaitable(database.update_user_field_by_internal_id)
+get_user_by_id = _awaitable(database.get_user_by_id)
+get_all_users = _awaitable(database.get_all_users)
+get_users_by_gender = _awaitable(database.get_users_by_gender)
+count_users = _awaitable(database.count_users)
+user_cache_stats = _awaitable(database.user_cache_stats)
+
+# Payments
+create_payment = _awaitable(database.create_payment)
+list_pending_payments = _awaitable(database.list_pending_payments)
+pending_payments_page = _awaitable(database.pending_payments_page)
+set_payment_status = _awaitable(database.set_payment_status)
+get_payment_user_tg_id = _awaitable(database.get_payment_user_tg_id)
+get_payment = _awaitable(database.get_payment)
+
+# Joy band qilish
+reserve_course = _awaitable(database.reserve_course)
+get_seat_hold = _awaitable(database.get_seat_hold)
+release_expired_holds = _awaitable(database.release_expired_holds)
+next_hold_expiry = _awaitable(database.next_hold_expiry)
+set_course_limit = _awaitable(database.set_course_limit)
+
+# Kutish navbati
+join_waitlist = _awaitable(database.join_waitlist)
+leave_waitlist = _awaitable(database.leave_waitlist)
+promote_waitlist = _awaitable(database.promote_waitlist)
+
+# Statistika
+get_stats = _awaitable(database.get_stats)
+reconcile_stats = _awaitable(database.reconcile_stats)
+get_user_with_course = _awaitable(database.get_user_with_course)
+
+# Analitika
+analytics_series = _awaitable(database.analytics_series)
+review_latencies = _awaitable(database.review_latencies)
+registration_funnel = _awaitable(database.registration_funnel)
+funnel_dwell = _awaitable(database.funnel_dwell)
+funnel_last_states = _awaitable(database.funnel_last_states)
+
+# Broadcasts
+create_broadcast = _awaitable(database.create_broadcast)
+get_broadcast = _awaitable(database.get_broadcast)
+list_running_broadcasts = _awaitable(database.list_running_broadcasts)
+count_broadcast_recipients = _awaitable(database.count_broadcast_recipients)
+fetch_broadcast_recipients = _awaitable(database.fetch_broadcast_recipients)
+save_broadcast_progress = _awaitable(database.save_broadcast_progress)
@@ -0,0 +1,290 @@
+# bench.py
+"""End-to-end load benchmark for the bot.
+
+Feeds fabricated `Update` objects through a real `Dispatcher` wired exactly
+like `main.py` (SQLite FSM storage, concurrency limit, timing middlewares and
+all three `register_*` functions). The Telegram API is replaced by an
+in-process session that answers every request after `--api-latency-ms`, and
+the database is a fresh `users.db` in a temp directory.
+
+Every simulated user does the full flow: /start, language, registration
+(name, birth date, gender, phone, address, two passport photos, confirm),
+course choice, "pay now" and a payment proof photo. Users run concurrently;
+each user's updates are sequential, as in a real chat.
+
+Reports updates/s, update latency percentiles, time spent in DB calls and
+Bot API calls, the slowest routes, and how many users finished the flow:
+
+    python bench.py [--users 2000] [--concurrency 500] [--api-latency-ms 20]
+                    [--max-p99-ms 250] [--json]
+
+Exits with status 1 when not every user completed the flow or p99 exceeds
+`--max-p99-ms`.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+FIRST_TG_ID = 7_000_000_000
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Simulation:
+    def __init__(self, bot, dp, course_ids: List[int]) -> None:
+        self.bot = bot
+        self.dp = dp
+        self.course_ids = course_ids
+        self.latencies: List[float] = []
+        self.update_id = 0
+        self.errors = 0
+
+    def _next_id(self) -> int:
+        self.update_id += 1
+        return self.update_id
+
+    def _user(self, tg_id: int) -> Dict[str, Any]:
+        return {"id": tg_id, "is_bot": False, "first_name": "Bench"}
+
+    def _chat(self, tg_id: int) -> Dict[str, Any]:
+        return {"id": tg_id, "type": "private"}
+
+    async def _feed(self, payload: Dict[str, Any]) -> None:
+        from aiogram.types import Update
+
+        update = Update.model_validate({"update_id": self._next_id(), **payload})
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            self.errors += 1
+            logging.getLogger(__name__).error(f"Update failed: {str(e)}")
+        self.latencies.append(time.perf_counter() - started)
+
+    async def message(self, tg_id: int, **content: Any) -> None:
+        await self._feed({"message": {
+            "message_id": self.update_id, "date": int(time.time()),
+            "chat": self._chat(tg_id), "from": self._user(tg_id), **content,
+        }})
+
+    async def callback(self, tg_id: int, data: str) -> None:
+        await self._feed({"callback_query": {
+            "id": str(self.update_id), "from": self._user(tg_id), "chat_instance": str(tg_id),
+            "data": data,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": self._chat(tg_id), "text": "."},
+        }})
+
+    def _photo(self, tg_id: int, kind: str) -> List[Dict[str, Any]]:
+        return [{"file_id": f"{kind}-{tg_id}", "file_unique_id": f"{kind}-u{tg_id}", "width": 800, "height": 600}]
+
+    async def user_flow(self, n: int) -> None:
+        tg_id = FIRST_TG_ID + n
+        course_id = self.course_ids[n % len(self.course_ids)]
+        await self.message(tg_id, text="/start")
+        await self.callback(tg_id, "lang_uz")
+        await self.callback(tg_id, "reg_yes")
+        await self.message(tg_id, text="Abdulloh")
+        await self.message(tg_id, text="Karimov")
+        await self.message(tg_id, text="2000.05.17")
+        await self.callback(tg_id, "gender_erkak" if n % 2 else "gender_ayol")
+        await self.message(tg_id, text=f"+99890{n % 10_000_000:07d}")
+        await self.message(tg_id, text="Buxoro shahri, Mustaqillik ko'chasi 1")
+        await self.message(tg_id, photo=self._photo(tg_id, "front"))
+        await self.message(tg_id, photo=self._photo(tg_id, "back"))
+        await self.callback(tg_id, "data_yes")
+        await self.callback(tg_id, f"course_{course_id}")
+        await self.callback(tg_id, f"pay_now:{course_id}")
+        await self.message(tg_id, photo=self._photo(tg_id, "proof"))
+
+
+def create_mock_session(api_latency: float):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Chat, Message
+
+    class MockSession(BaseSession):
+        """Answers every Bot API request locally after a fixed delay."""
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.calls = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls += 1
+            if api_latency:
+                await asyncio.sleep(api_latency)
+            chat_id = getattr(method, "chat_id", None)
+            if chat_id is None:
+                return True
+            return Message(
+                message_id=self.calls, date=datetime.now(),
+                chat=Chat(id=chat_id, type="private" if chat_id > 0 else "supergroup"),
+            )
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            if False:
+                yield b""
+
+        async def close(self) -> None:
+            pass
+
+    return MockSession()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # Modullar import qilinishidan oldin: DB_PATH nisbiy yo'l, baza vaqtinchalik papkada yaratiladi
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+    from aiogram import Bot, Dispatcher
+
+    import async_db
+    import database
+    from config import FSM_FLUSH_INTERVAL, UPDATE_CONCURRENCY
+    from handlers.admin import register_admin_handlers
+    from handlers.payment import register_payment_handlers
+    from handlers.registration import register_handlers
+    from metrics import metrics
+    from middlewares import ApiTimingMiddleware, ConcurrencyLimitMiddleware, HandlerTimingMiddleware
+    from outbox import outbox
+    from storage import SQLiteStorage
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    database.init_db()
+    per_course = -(-args.users // args.courses)
+    course_ids = [
+        database.add_course(f"Bench kurs {i + 1}", "benchmark", "hammasi", "2026-01-01", per_course, 500000)
+        for i in range(args.courses)
+    ]
+
+    session = create_mock_session(args.api_latency_ms / 1000)
+    session.middleware(ApiTimingMiddleware())
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    dp = Dispatcher(storage=SQLiteStorage(flush_interval=FSM_FLUSH_INTERVAL, track_states=("Registration",)))
+    limiter = ConcurrencyLimitMiddleware(UPDATE_CONCURRENCY)
+    dp.update.outer_middleware(limiter)
+    timing = HandlerTimingMiddleware()
+    dp.message.middleware(timing)
+    dp.callback_query.middleware(timing)
+    register_admin_handlers(dp)
+    register_handlers(dp)
+    await register_payment_handlers(dp)
+    outbox.start(bot)
+
+    sim = Simulation(bot, dp, course_ids)
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def one(n: int) -> None:
+        async with gate:
+            await sim.user_flow(n)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    backlog = outbox._pending
+    await outbox.stop(0)
+    await dp.storage.close()
+
+    with database.connection() as conn:
+        completed = conn.execute(
+            "SELECT COUNT(DISTINCT p.user_id) FROM payments p JOIN users u ON u.id = p.user_id "
+            "WHERE u.tg_id >= ?", (FIRST_TG_ID,)
+        ).fetchone()[0]
+    db_rows = metrics.top("bot_db_seconds", limit=1000)
+    api_rows = metrics.top("bot_telegram_api_seconds", limit=1000)
+    async_db.shutdown()
+
+    latencies = sorted(sim.latencies)
+    updates = len(latencies)
+    db_time = sum(r["total"] for r in db_rows)
+    return {
+        "users": args.users,
+        "completed": completed,
+        "updates": updates,
+        "errors": sim.errors,
+        "elapsed_s": elapsed,
+        "updates_per_s": updates / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50) * 1000,
+            "p95": _percentile(latencies, 95) * 1000,
+            "p99": _percentile(latencies, 99) * 1000,
+            "max": (latencies[-1] if latencies else 0.0) * 1000,
+        },
+        "db": {
+            "calls": sum(r["count"] for r in db_rows),
+            "total_s": db_time,
+            "per_update_ms": db_time / updates * 1000 if updates else 0.0,
+            "top": [{"func": r["label"], "calls": r["count"], "total_s": r["total"]} for r in db_rows[:5]],
+        },
+        "api": {
+            "calls": sum(r["count"] for r in api_rows),
+            "total_s": sum(r["total"] for r in api_rows),
+            "outbox_backlog": backlog,
+        },
+        "routes": [
+            {"route": r["label"], "count": r["count"], "avg_ms": r["avg"] * 1000, "p95_ms": r["p95"] * 1000}
+            for r in metrics.top("bot_handler_seconds", limit=8)
+        ],
+        "workdir": workdir,
+    }
+
+
+def print_report(r: Dict[str, Any]) -> None:
+    lat = r["latency_ms"]
+    print(f"users:       {r['completed']}/{r['users']} completed the flow, {r['errors']} failed updates")
+    print(f"throughput:  {r['updates']} updates in {r['elapsed_s']:.2f} s = {r['updates_per_s']:.0f} updates/s")
+    print(f"latency ms:  p50 {lat['p50']:.1f}  p95 {lat['p95']:.1f}  p99 {lat['p99']:.1f}  max {lat['max']:.1f}")
+    print(f"db:          {r['db']['calls']} calls, {r['db']['total_s']:.2f} s, "
+          f"{r['db']['per_update_ms']:.2f} ms/update")
+    for row in r["db"]["top"]:
+        print(f"  {row['func']:<32} {row['calls']:>7} calls {row['total_s']:8.3f} s")
+    print(f"bot api:     {r['api']['calls']} calls, {r['api']['total_s']:.2f} s "
+          f"(outbox backlog at end: {r['api']['outbox_backlog']})")
+    print("routes (by total time):")
+    for row in r["routes"]:
+        print(f"  {row['route']:<32} {row['count']:>7}  avg {row['avg_ms']:6.1f} ms  p95 {row['p95_ms']:6.1f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500, help="users in flight at once")
+    parser.add_argument("--courses", type=int, default=3)
+    parser.add_argument("--api-latency-ms", type=float, default=20.0)
+    parser.add_argument("--max-p99-ms", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    ok = report["completed"] == report["users"] and not report["errors"]
+    if args.max_p99_ms is not None and report["latency_ms"]["p99"] > args.max_p99_ms:
+        print(f"p99 {report['latency_ms']['p99']:.1f} ms exceeds {args.max_p99_ms} ms", file=sys.stderr)
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# broadcast.py
+"""Resumable mass messaging on top of the outbound dispatcher.
+
+Recipients are read from `users` in keyset pages (`id > last_user_id`). Each
+page is queued through `outbox`, so sending stays within Telegram's limits,
+and the page is awaited before the next one is read: interactive replies
+queued in the meantime are not stuck behind the whole broadcast. Progress is
+stored after every page, and `resume_all()` picks running broadcasts up again
+after a restart. A page interrupted by a restart is sent again, so a few users
+may get the message twice, but nobody is skipped.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from aiogram.exceptions import TelegramForbiddenError
+
+import async_db
+from config import BROADCAST_CHUNK_SIZE
+from outbox import outbox
+
+logger = logging.getLogger(__name__)
+
+FILTER_FIELDS = ("course_id", "gender", "is_paid", "lang")
+
+
+def filters_of(broadcast: Dict[str, Any]) -> Dict[str, Any]:
+    return {f: broadcast.get(f) for f in FILTER_FIELDS}
+
+
+class BroadcastEngine:
+    def __init__(self, chunk_size: int = 50) -> None:
+        self.chunk_size = chunk_size
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def is_running(self, broadcast_id: int) -> bool:
+        task = self._tasks.get(broadcast_id)
+        return task is not None and not task.done()
+
+    async def start(self, text: str, filters: Dict[str, Any], created_by: Optional[int] = None) -> int:
+        broadcast_id = await async_db.create_broadcast(text, filters, created_by)
+        self._spawn(broadcast_id)
+        return broadcast_id
+
+    async def resume_all(self) -> None:
+        for broadcast in await async_db.list_running_broadcasts():
+            if not self.is_running(broadcast["id"]):
+                logger.info(f"Resuming broadcast {broadcast['id']} after user {broadcast['last_user_id']}")
+                self._spawn(broadcast["id"])
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        task = self._tasks.get(broadcast_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        broadcast = await async_db.get_broadcast(broadcast_id)
+        await async_db.save_broadcast_progress(
+            broadcast_id, broadcast["last_user_id"], broadcast["delivered"],
+            broadcast["blocked"], broadcast["failed"], status="cancelled",
+        )
+        return True
+
+    async def stop(self) -> None:
+        """Stop sending without changing the status, so the broadcasts resume on next start."""
+        tasks = [t for t in self._tasks.values() if not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def _spawn(self, broadcast_id: int) -> None:
+        self._tasks[broadcast_id] = asyncio.create_task(self._run(broadcast_id))
+
+    async def _run(self, broadcast_id: int) -> None:
+        broadcast = await async_db.get_broadcast(broadcast_id)
+        if not broadcast or broadcast["status"] != "running":
+            return
+        filters = filters_of(broadcast)
+        last_user_id = broadcast["last_user_id"]
+        counts = {k: broadcast[k] for k in ("delivered", "blocked", "failed")}
+
+        try:
+            while True:
+                recipients = await async_db.fetch_broadcast_recipients(filters, last_user_id, self.chunk_size)
+                if not recipients:
+                    break
+                futures = [outbox.submit(tg_id, "send_message", text=broadcast["text"]) for _, tg_id in recipients]
+                for result in await asyncio.gather(*futures, return_exceptions=True):
+                    if not isinstance(result, BaseException):
+                        counts["delivered"] += 1
+                    elif isinstance(result, TelegramForbiddenError):
+                        counts["blocked"] += 1
+                    else:
+                        counts["failed"] += 1
+                last_user_id = recipients[-1][0]
+                await async_db.save_broadcast_progress(broadcast_id, last_user_id, **counts)
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} stopped: {str(e)}")
+            return
+
+        await async_db.save_broadcast_progress(broadcast_id, last_user_id, **counts, status="done")
+        logger.info(f"Broadcast {broadcast_id} finished: {counts}")
+        if broadcast["created_by"]:
+            outbox.submit(
+                broadcast["created_by"], "send_message",
+                text=(
+                    f"📢 Xabar #{broadcast_id} yuborildi.\n\n"
+                    f"✅ Yetkazildi: {counts['delivered']}\n"
+                    f"🚫 Bloklagan: {counts['blocked']}\n"
+                    f"❌ Xato: {counts['failed']}"
+                ),
+            )
+
+
+broadcasts = BroadcastEngine(chunk_size=BROADCAST_CHUNK_SIZE)
@@ -0,0 +1,156 @@
+# cache.py
+"""In-process caches that sit in front of `database.py` reads.
+
+The caches are shared by the DB thread pool, so every public method is
+thread-safe. Writers in `database.py` invalidate them after their transaction
+commits.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+class _CatalogSnapshot:
+    __slots__ = ("courses", "by_id", "available", "full")
+
+    def __init__(self, courses: List[Dict[str, Any]]) -> None:
+        self.courses = courses
+        self.by_id = {c["id"]: c for c in courses}
+        self.available: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        self.full: Dict[Optional[str], List[Dict[str, Any]]] = {}
+
+
+class CourseCatalog:
+    """Snapshot of the `courses` table, keyed by id.
+
+    The snapshot is loaded on first use and kept until `invalidate()` is called.
+    A generation counter makes sure a load that raced with an invalidation is
+    not stored as the current snapshot.
+    """
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]]) -> None:
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._snap: Optional[_CatalogSnapshot] = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._snap = None
+
+    def _snapshot(self) -> _CatalogSnapshot:
+        with self._lock:
+            if self._snap is not None:
+                return self._snap
+            generation = self._generation
+        snap = _CatalogSnapshot(self._loader())
+        with self._lock:
+            if generation == self._generation:
+                self._snap = snap
+        return snap
+
+    def all(self) -> List[Dict[str, Any]]:
+        return [dict(c) for c in self._snapshot().courses]
+
+    def get(self, course_id: Optional[int]) -> Optional[Dict[str, Any]]:
+        course = self._snapshot().by_id.get(course_id)
+        return dict(course) if course else None
+
+    def available_for(self, gender: Optional[str]) -> List[Dict[str, Any]]:
+        """Courses open to `gender` ('hammasi' courses included) that still have free (not held) seats."""
+        snap = self._snapshot()
+        view = snap.available.get(gender)
+        if view is None:
+            view = [
+                c for c in snap.courses
+                if (c["gender"] == "hammasi" or c["gender"] == gender)
+                and c["joylar_soni"] + (c.get("held") or 0) < c["limit_count"]
+            ]
+            snap.available[gender] = view
+        return [dict(c) for c in view]
+
+    def full_for(self, gender: Optional[str]) -> List[Dict[str, Any]]:
+        """Courses open to `gender` with every seat taken or held (waitlist candidates)."""
+        snap = self._snapshot()
+        view = snap.full.get(gender)
+        if view is None:
+            view = [
+                c for c in snap.courses
+                if (c["gender"] == "hammasi" or c["gender"] == gender)
+                and c["joylar_soni"] + (c.get("held") or 0) >= c["limit_count"]
+            ]
+            snap.full[gender] = view
+        return [dict(c) for c in view]
+
+
+class LRUCache:
+    """Bounded LRU cache with a per-entry TTL and hit/miss counters.
+
+    `generation()` returns a token to take before reading from the database;
+    `set()` ignores the value if any invalidation happened in between, so a slow
+    reader cannot put a row back that a writer has just invalidated.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys: Hashable) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
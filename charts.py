@@ -0,0 +1,56 @@
+# charts.py
+"""Chart rendering for the admin analytics (runs in a worker process).
+
+Only plain data goes in and PNG bytes come out, so `render_analytics` can be
+sent to a `ProcessPoolExecutor`. matplotlib is imported inside the function:
+the bot process itself never loads it.
+"""
+import io
+from typing import Any, Dict
+
+FUNNEL_LABELS = ("Ro'yxatdan o'tgan", "Kurs tanlagan", "Chek yuborgan", "To'lagan")
+
+
+def render_analytics(payload: Dict[str, Any]) -> bytes:
+    """payload: title, labels, registrations, proofs, approved, rejected (labels bilan bir xil
+    uzunlikdagi ro'yxatlar) va funnel (4 ta son). Qaytaradi: PNG."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    labels = payload["labels"]
+    x = range(len(labels))
+    # Ko'p bo'lakda har bir yorliq sig'maydi
+    step = max(1, len(labels) // 12)
+
+    fig, (ax_reg, ax_pay, ax_funnel) = plt.subplots(3, 1, figsize=(10, 11))
+    try:
+        fig.suptitle(payload["title"], fontsize=14)
+
+        ax_reg.bar(x, payload["registrations"], color="#4c72b0")
+        ax_reg.set_title("Ro'yxatdan o'tganlar")
+
+        ax_pay.plot(x, payload["proofs"], marker="o", label="Yuborilgan cheklar")
+        ax_pay.plot(x, payload["approved"], marker="o", label="Tasdiqlangan")
+        ax_pay.plot(x, payload["rejected"], marker="o", label="Rad etilgan")
+        ax_pay.set_title("To'lov cheklari")
+        ax_pay.legend(loc="upper left")
+
+        for ax in (ax_reg, ax_pay):
+            ax.set_xticks(list(x)[::step])
+            ax.set_xticklabels(labels[::step], rotation=45, ha="right", fontsize=8)
+            ax.yaxis.get_major_locator().set_params(integer=True)
+            ax.grid(axis="y", alpha=0.3)
+
+        funnel = payload["funnel"]
+        bars = ax_funnel.barh(FUNNEL_LABELS[::-1], funnel[::-1], color="#55a868")
+        ax_funnel.bar_label(bars, padding=3)
+        ax_funnel.set_title("Konversiya voronkasi")
+        ax_funnel.xaxis.get_major_locator().set_params(integer=True)
+
+        fig.tight_layout()
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", dpi=100)
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
@@ -0,0 +1,110 @@
+# check_queries.py
+"""Query plan check for the hot user lookups.
+
+Runs the real `database` functions against a fresh database in a temp
+directory, records every SQL statement they execute (sqlite3 trace callback)
+and runs `EXPLAIN QUERY PLAN` on each statement that touches `users`. Every
+such statement must reach `users` with exactly one
+`SEARCH users USING (COVERING) INDEX ...` or `USING INTEGER PRIMARY KEY`,
+never `SCAN users`.
+
+Checked paths: get_user_by_tg_id, get_user_by_internal_id,
+update_user_field_by_tg_id, update_user_field_by_internal_id,
+count_course_users. Exits with status 1 if any plan regresses:
+
+    python check_queries.py [--verbose]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+USERS_ROW = re.compile(r"^(SCAN|SEARCH) users\b")
+GOOD_ROW = re.compile(r"^SEARCH users USING (COVERING INDEX|INDEX|INTEGER PRIMARY KEY)\b")
+DML = ("SELECT", "UPDATE", "INSERT", "DELETE", "WITH")
+
+
+def _trace(database) -> List[str]:
+    """Make every new pooled connection append executed SQL to the returned list."""
+    statements: List[str] = []
+    connect = database._connect
+
+    def traced_connect():
+        conn = connect()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    database._connect = traced_connect
+    return statements
+
+
+def _users_plan(conn, sql: str) -> List[str]:
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [r[3] for r in rows if USERS_ROW.match(r[3])]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--verbose", action="store_true", help="print every checked plan")
+    args = parser.parse_args()
+
+    # DB_PATH nisbiy yo'l: baza vaqtinchalik papkada yaratiladi
+    os.chdir(tempfile.mkdtemp(prefix="bot-query-check-"))
+    import database
+
+    database.init_db()
+    course_id = database.add_course("Plan kurs", limit_count=10)
+    user_id = database.save_user({"tg_id": 555000111, "first_name": "Plan", "lang": "uz"})
+    tg_id = 555000111
+
+    statements = _trace(database)
+    database.close_pool()
+
+    paths: Dict[str, Callable[[], object]] = {
+        "get_user_by_tg_id": lambda: database.get_user_by_tg_id(tg_id),
+        "get_user_by_internal_id": lambda: database.get_user_by_internal_id(user_id),
+        "update_user_field_by_tg_id": lambda: database.update_user_field_by_tg_id(tg_id, "phone", "+998901112233"),
+        "update_user_field_by_internal_id": lambda: database.update_user_field_by_internal_id(user_id, "gender", "ayol"),
+        "count_course_users": lambda: database.count_course_users(course_id),
+    }
+
+    failures: List[Tuple[str, str, List[str]]] = []
+    with database.connection() as conn:
+        # EXPLAIN so'rovlarining o'zi ro'yxatga tushmasin
+        conn.set_trace_callback(None)
+        for name, call in paths.items():
+            # Kesh urilsa SQL bajarilmaydi
+            database._user_cache.clear()
+            del statements[:]
+            call()
+            checked = 0
+            for sql in statements:
+                if not sql.lstrip().upper().startswith(DML) or not re.search(r"\busers\b", sql):
+                    continue
+                plan = _users_plan(conn, sql)
+                checked += 1
+                ok = len(plan) == 1 and all(GOOD_ROW.match(p) for p in plan)
+                if args.verbose or not ok:
+                    print(f"{name}: {' '.join(sql.split())}\n    -> {plan}")
+                if not ok:
+                    failures.append((name, sql, plan))
+            if not checked:
+                failures.append((name, "", ["no statement on users was executed"]))
+            print(f"{name:<34} {checked} statement(s) {'OK' if checked else 'FAIL'}")
+    database.close_pool()
+
+    if failures:
+        print(f"FAIL: {len(failures)} statement(s) do not use an index on users")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# check_startup.py
+"""Import-time budget check for the bot's cold start.
+
+Runs `python -X importtime -c "import main"` a few times in a fresh
+interpreter and reports:
+
+* total time to import `main`;
+* the bot's own share: everything except the framework it cannot start
+  without (aiogram, aiohttp, pydantic, ...), checked against
+  `STARTUP_IMPORT_BUDGET_MS` from config;
+* heavy optional libraries that got imported at startup although they are
+  only needed on first use (exports, analytics, input sanitizing).
+
+Exits with status 1 when the budget is exceeded or a lazy dependency leaks
+into startup:
+
+    python check_startup.py [--runs N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from config import STARTUP_IMPORT_BUDGET_MS
+
+# Bularsiz bot ishga tushmaydi: ularning vaqti byudjetga kirmaydi
+BASELINE = {
+    "aiogram", "aiohttp", "aiohappyeyeballs", "aiosignal", "frozenlist", "multidict",
+    "yarl", "propcache", "pydantic", "pydantic_core", "annotated_types", "typing_inspection",
+    "typing_extensions", "magic_filter", "certifi", "ssl", "_ssl", "asyncio", "dotenv",
+}
+
+# Faqat birinchi ishlatilganda yuklanishi kerak
+LAZY = {"bleach", "html5lib", "xlsxwriter", "matplotlib", "numpy", "pandas", "PIL"}
+
+
+def _parse(stderr: str) -> List[Tuple[int, int, int, str]]:
+    """(self_us, cumulative_us, depth, name) for every `-X importtime` line."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return rows
+
+
+def measure() -> Dict[str, object]:
+    env = dict(os.environ, BOT_TOKEN=os.environ.get("BOT_TOKEN") or "0:startup-check")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = _parse(proc.stderr)
+
+    # -X importtime bolalarni otasidan oldin chiqaradi; teskari tartibda otasi birinchi keladi
+    own_us = 0
+    stack: List[Tuple[int, bool]] = []
+    for self_us, _, depth, name in reversed(rows):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        in_baseline = (stack and stack[-1][1]) or name.split(".")[0] in BASELINE
+        stack.append((depth, in_baseline))
+        if not in_baseline:
+            own_us += self_us
+
+    total_us = next((cum for _, cum, _, name in rows if name == "main"), 0)
+    return {
+        "total_ms": total_us / 1000,
+        "own_ms": own_us / 1000,
+        "lazy_leaks": sorted({name.split(".")[0] for *_, name in rows} & LAZY),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = [measure() for _ in range(args.runs)]
+    best = min(results, key=lambda r: r["own_ms"])
+    leaks = sorted({m for r in results for m in r["lazy_leaks"]})
+
+    print(f"import main (total):  {min(r['total_ms'] for r in results):8.1f} ms")
+    print(f"bot modules (own):    {best['own_ms']:8.1f} ms  (budget {STARTUP_IMPORT_BUDGET_MS} ms)")
+    ok = best["own_ms"] <= STARTUP_IMPORT_BUDGET_MS
+    if leaks:
+        print(f"lazy dependencies imported at startup: {', '.join(leaks)}")
+        ok = False
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,3 +6,71 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DB_PATH = "users.db"
 ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS","").split(",") if x]  # misol: "12345678,87654321"
+
+# Async DB qatlami uchun alohida thread pool hajmi
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+
+# SQLite ulanish puli sozlamalari (bir marta, start paytida qo'llanadi)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(DB_WORKERS)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "10000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+
+# Foydalanuvchi profili keshi (LRU + TTL)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# Admin eksportlari: bir vaqtda ishlaydigan fon vazifalari soni
+EXPORT_MAX_CONCURRENCY = int(os.getenv("EXPORT_MAX_CONCURRENCY", "2"))
+
+# FSM holatlari SQLite da saqlanadi: yozuvlar to'plab yoziladi, tashlab ketilganlari o'chiriladi
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+FSM_TTL_HOURS = float(os.getenv("FSM_TTL_HOURS", "72"))
+
+# Ishga tushirish rejimi: "polling" yoki "webhook"
+RUN_MODE = os.getenv("RUN_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # misol: "https://bot.example.uz"
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "127.0.0.1")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+# Bir vaqtda ishlanadigan update lar soni va to'xtashda kutish vaqti (soniya)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+# Chiquvchi xabarlar navbati (Telegram flood limitlari ichida)
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "8"))
+OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+
+# Ommaviy xabar: bir partiyadagi qabul qiluvchilar soni (progress shu qadamda saqlanadi)
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "50"))
+
+# Telegram API ulanishlari: bitta umumiy aiohttp connector sozlamalari
+TELEGRAM_CONN_LIMIT = int(os.getenv("TELEGRAM_CONN_LIMIT", "100"))
+TELEGRAM_KEEPALIVE = float(os.getenv("TELEGRAM_KEEPALIVE", "60"))
+TELEGRAM_DNS_TTL = int(os.getenv("TELEGRAM_DNS_TTL", "3600"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "60"))
+
+# Kursda joy band qilish muddati (daqiqa) va muddati o'tganlarni tozalash oralig'i (soniya)
+SEAT_HOLD_MINUTES = int(os.getenv("SEAT_HOLD_MINUTES", "30"))
+SEAT_SWEEP_INTERVAL = float(os.getenv("SEAT_SWEEP_INTERVAL", "60"))
+
+# Analitika: grafiklar alohida jarayonda chiziladi va shu oraliq (daqiqa) davomida keshlanadi.
+# Vaqt bo'laklari mahalliy vaqtda (UTC + soat, Toshkent uchun 5)
+ANALYTICS_CACHE_MINUTES = int(os.getenv("ANALYTICS_CACHE_MINUTES", "10"))
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "1"))
+ANALYTICS_UTC_OFFSET_HOURS = int(os.getenv("ANALYTICS_UTC_OFFSET_HOURS", "5"))
+
+# Ro'yxatdan o'tish voronkasi: holat o'tishlari necha kun saqlanadi va hisobot davri (kun)
+FUNNEL_RETENTION_DAYS = int(os.getenv("FUNNEL_RETENTION_DAYS", "90"))
+FUNNEL_REPORT_DAYS = int(os.getenv("FUNNEL_REPORT_DAYS", "30"))
+
+# /metrics (Prometheus formati): webhook rejimida WEBAPP_PORT da; polling rejimida
+# METRICS_PORT > 0 bo'lsa alohida kichik HTTP server ochiladi
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Ishga tushish vaqti maqsadi: botning o'z modullari (aiogram/aiohttp dan tashqari) importi, ms.
+# Og'ir kutubxonalar (bleach, xlsxwriter, matplotlib) faqat birinchi ishlatilganda yuklanadi.
+# Tekshirish: python check_startup.py
+STARTUP_IMPORT_BUDGET_MS = int(os.getenv("STARTUP_IMPORT_BUDGET_MS", "150"))
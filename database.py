@@ -1,9 +1,27 @@
 # database.py
+import logging
+import queue
 import sqlite3
-from datetime import datetime
-from typing import Any, Dict, Iterable, List, Optional, Tuple
-
-from config import DB_PATH
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from cache import CourseCatalog, LRUCache
+from migrations import STATS_SOURCE_SQL, migrate
+from config import (
+    DB_BUSY_TIMEOUT_MS,
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+    DB_PATH,
+    DB_POOL_SIZE,
+    SEAT_HOLD_MINUTES,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
 
 # -----------------------------
 # Ichki util funksiyalar
@@ -13,115 +31,150 @@ def _dict_from_row(row: sqlite3.Row) -> Dict[str, Any]:
     return {k: row[k] for k in row.keys()}
 
 
-def get_conn() -> sqlite3.Connection:
-    """SQLite ulanishi: FK ON, WAL rejimi, Row factory.
-    Har bir ulanish ustida PRAGMA lar yoqiladi.
+def _connect() -> sqlite3.Connection:
+    """Yangi, sozlangan SQLite ulanishi.
+    PRAGMA lar faqat ulanish ochilganda bir marta qo'llanadi; autocommit rejimida
+    ishlaydi, tranzaksiyalar `transaction()` orqali ochiladi.
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False,
+    )
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
-    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{int(DB_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
 
-def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
-    cur = conn.execute(f"PRAGMA table_info({table})")
-    return any(r[1] == column for r in cur.fetchall())
+class ConnectionPool:
+    """Uzoq yashovchi ulanishlar puli.
+    Ulanishlar kerak bo'lganda `size` tagacha ochiladi va qayta ishlatiladi;
+    bo'sh ulanish bo'lmasa, chaqiruvchi navbatda kutadi.
+    """
 
+    def __init__(self, size: int) -> None:
+        self._size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self._size:
+                self._created += 1
+                try:
+                    return _connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("database is locked: connection pool exhausted")
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
 
-# -----------------------------
-# Dastlabki sxema va migratsiyalar
-# -----------------------------
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
 
-def init_db() -> None:
-    """Jadval(lar)ni yaratadi va eng zarur indekslarni qo'yadi.
-    Shuningdek mayda migratsiyalarni ham bajaradi (age -> birth_date o'zgarishi).
-    """
-    conn = get_conn()
-    c = conn.cursor()
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE ... COMMIT; xato bo'lsa ROLLBACK."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
 
-    # courses
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS courses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT UNIQUE,
-            description TEXT,
-            gender TEXT CHECK(gender IN ('erkak', 'ayol', 'hammasi')) DEFAULT 'hammasi',
-            boshlanish_sanasi TEXT,
-            limit_count INTEGER DEFAULT 0,
-            joylar_soni INTEGER DEFAULT 0,
-            narx REAL DEFAULT 0.0,
-            created_at TEXT DEFAULT (datetime('now'))
-        )
-        """
-    )
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
 
-    # users
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_id INTEGER UNIQUE,
-            lang TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            birth_date TEXT,             -- YYYY-MM-DD
-            gender TEXT,
-            phone TEXT,
-            address TEXT,                -- manzil
-            passport_front TEXT,         -- passport oldi rasmi
-            passport_back TEXT,          -- passport orqa rasmi
-            course_id INTEGER,
-            registered_at TEXT DEFAULT (datetime('now')),
-            is_paid INTEGER DEFAULT 0,   -- 0 yoki 1
-            paid_at TEXT,
-            registration_message_id INTEGER,
-            FOREIGN KEY(course_id) REFERENCES courses(id)
-        )
-        """
-    )
 
-    # payments
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            amount REAL,
-            method TEXT,
-            proof_file_id TEXT,
-            status TEXT CHECK(status IN ('pending','approved','rejected')) DEFAULT 'pending',
-            created_at TEXT DEFAULT (datetime('now')),
-            reviewed_by INTEGER,
-            reviewed_at TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-        """
-    )
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_POOL_SIZE)
+    return _pool
 
-    # Indekslar (agar yo'q bo'lsa yaratiladi)
-    c.execute("CREATE INDEX IF NOT EXISTS idx_users_course_id ON users(course_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status)")
 
-    # ---- Kichik migratsiyalar ----
-    # 1) Eski kodda age bo'lgan: endi birth_date ishlatiladi.
-    # Agar mavjud bazada birth_date ustuni bo'lmasa, qo'shib qo'yamiz.
-    if not _column_exists(conn, "users", "birth_date"):
-        c.execute("ALTER TABLE users ADD COLUMN birth_date TEXT")
+def connection():
+    """Puldan ulanish oladi: `with connection() as conn: ...`"""
+    return get_pool().connection()
 
-    if not _column_exists(conn, "users", "registration_message_id"):
-        c.execute("ALTER TABLE users ADD COLUMN registration_message_id INTEGER")
 
-    # registered_at, created_at defaultlari yo'q bo'lishi mumkin bo'lgan eski bazalar uchun
-    # (SQLite da DEFAULT ni ALTER bilan qo'yib bo'lmaydi, shu bois bu yerda faqat mavjud yozuvlar bo'sh bo'lsa to'ldiriladi)
-    c.execute("UPDATE users SET registered_at = COALESCE(registered_at, datetime('now'))")
-    c.execute("UPDATE payments SET created_at = COALESCE(created_at, datetime('now'))")
-    c.execute("UPDATE courses SET created_at = COALESCE(created_at, datetime('now'))")
+def transaction():
+    """Puldagi ulanishda yozish tranzaksiyasi: `with transaction() as conn: ...`"""
+    return get_pool().transaction()
 
-    conn.commit()
-    conn.close()
+
+def close_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def get_conn() -> sqlite3.Connection:
+    """Skriptlar uchun alohida (puldan tashqari) ulanish.
+    Chaqiruvchi uni o'zi yopishi kerak.
+    """
+    return _connect()
+
+
+# -----------------------------
+# Dastlabki sxema va migratsiyalar
+# -----------------------------
+
+def init_db() -> None:
+    """Bazani oxirgi sxema versiyasigacha yangilaydi (qarang: migrations.py).
+    Odatiy qayta ishga tushishda faqat schema_version tekshiriladi.
+    """
+    conn = _connect()
+    try:
+        # WAL rejimi bazaga doimiy yoziladi, shuning uchun start paytida bir marta yetadi
+        conn.execute("PRAGMA journal_mode = WAL")
+        migrate(conn)
+    finally:
+        conn.close()
 
 
 # -----------------------------
@@ -136,69 +189,106 @@ def add_course(
     limit_count: int = 0,
     narx: float = 0.0,
 ) -> int:
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute(
-        """
-        INSERT INTO courses (
-            name, description, gender, boshlanish_sanasi, limit_count, joylar_soni, narx
+    with transaction() as conn:
+        c = conn.execute(
+            """
+            INSERT INTO courses (
+                name, description, gender, boshlanish_sanasi, limit_count, joylar_soni, narx
+            )
+            VALUES (?, ?, ?, ?, ?, 0, ?)
+            """,
+            (name, description, gender, boshlanish_sanasi, limit_count, narx),
         )
-        VALUES (?, ?, ?, ?, ?, 0, ?)
-        """,
-        (name, description, gender, boshlanish_sanasi, limit_count, narx),
-    )
-    course_id = c.lastrowid
-    conn.commit()
-    conn.close()
+        course_id = c.lastrowid
+    _course_catalog.invalidate()
     return course_id
 
 
-def list_courses() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    rows = conn.execute(
-        """
-        SELECT id, name, description, gender, boshlanish_sanasi, limit_count, joylar_soni, narx, created_at
-        FROM courses
-        ORDER BY id DESC
-        """
-    ).fetchall()
-    conn.close()
+def _load_courses() -> List[Dict[str, Any]]:
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, name, description, gender, boshlanish_sanasi, limit_count, joylar_soni, held, narx, created_at
+            FROM courses
+            ORDER BY id DESC
+            """
+        ).fetchall()
     return [_dict_from_row(r) for r in rows]
 
 
+# Kurslar katalogi keshi: add_course / delete_course / set_payment_status va joy band qilish bekor qiladi
+_course_catalog = CourseCatalog(_load_courses)
+
+
+def invalidate_course_cache() -> None:
+    _course_catalog.invalidate()
+
+
+def list_courses() -> List[Dict[str, Any]]:
+    return _course_catalog.all()
+
+
+def list_available_courses(gender: Optional[str]) -> List[Dict[str, Any]]:
+    """`gender` uchun ochiq va bo'sh joyi bor kurslar."""
+    return _course_catalog.available_for(gender)
+
+
+def list_full_courses(gender: Optional[str]) -> List[Dict[str, Any]]:
+    """`gender` uchun ochiq, lekin joyi qolmagan kurslar (kutish navbati uchun)."""
+    return _course_catalog.full_for(gender)
+
+
 def delete_course(course_id: int) -> None:
-    conn = get_conn()
-    conn.execute("DELETE FROM courses WHERE id = ?", (course_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM courses WHERE id = ?", (course_id,))
+    _course_catalog.invalidate()
 
 
 def get_course_by_id(course_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    row = conn.execute("SELECT * FROM courses WHERE id = ?", (course_id,)).fetchone()
-    conn.close()
-    return _dict_from_row(row) if row else None
+    return _course_catalog.get(course_id)
+
+
+def get_course_name(course_id: Optional[int], default: Optional[str] = None) -> Optional[str]:
+    course = _course_catalog.get(course_id)
+    return course["name"] if course else default
+
+
+def count_course_users(course_id: int) -> int:
+    """Kursga bog'langan foydalanuvchilar soni."""
+    with connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM users WHERE course_id = ?", (course_id,)
+        ).fetchone()[0]
 
 
 # -----------------------------
 # Users CRUD
 # -----------------------------
 
+# Profil keshi: ("tg", tg_id) va ("id", users.id) kalitlari bo'yicha.
+# save_user / update_user_field_* / set_payment_status yozuvdan keyin bekor qiladi.
+_user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+_USER_COLUMNS = (
+    "id, tg_id, lang, first_name, last_name, birth_date, gender, phone, "
+    "address, course_id, registered_at, is_paid, paid_at, passport_front, passport_back, registration_message_id"
+)
+
+
+def _invalidate_user(user_id: Optional[int], tg_id: Optional[int]) -> None:
+    _user_cache.invalidate(("id", user_id), ("tg", tg_id))
+
+
+def user_cache_stats() -> Dict[str, Any]:
+    """Profil keshining hit/miss hisoblagichlari."""
+    return _user_cache.stats()
+
+
 def save_user(data: Dict[str, Any]) -> int:
     """Foydalanuvchini saqlaydi. `data` dan mavjud ustunlar olinadi.
     Qo'llab-quvvatlanadigan kalitlar: tg_id, lang, first_name, last_name, birth_date,
     gender, phone, address, passport_front, passport_back, course_id, is_paid, paid_at
     """
-    conn = get_conn()
-    c = conn.cursor()
-
-    course_id = data.get("course_id")
-    if course_id is not None:
-        row = c.execute("SELECT id FROM courses WHERE id = ?", (course_id,)).fetchone()
-        if not row:
-            conn.close()
-            raise ValueError(f"Course ID {course_id} does not exist")
-
     fields = [
         "tg_id",
         "lang",
@@ -226,228 +316,986 @@ def save_user(data: Dict[str, Any]) -> int:
     # registered_at default bilan to'ladi, alohida berish shart emas
     placeholders = ", ".join(["?" for _ in cols])
     sql = f"INSERT INTO users ({', '.join(cols)}) VALUES ({placeholders})"
-    c.execute(sql, vals)
-    user_id = c.lastrowid
-    conn.commit()
-    conn.close()
+
+    with transaction() as conn:
+        course_id = data.get("course_id")
+        if course_id is not None:
+            row = conn.execute("SELECT id FROM courses WHERE id = ?", (course_id,)).fetchone()
+            if not row:
+                raise ValueError(f"Course ID {course_id} does not exist")
+
+        user_id = conn.execute(sql, vals).lastrowid
+        _move_user_counters(conn, None, _stat_row(conn, user_id))
+    _invalidate_user(user_id, data.get("tg_id"))
     return user_id
 
 
-def get_user_by_tg(identifier: int) -> Optional[Dict[str, Any]]:
-    """identifier: id yoki tg_id (ikkalasidan biri ham bo'lishi mumkin)."""
-    conn = get_conn()
-    row = conn.execute(
-        """
-        SELECT id, tg_id, lang, first_name, last_name, birth_date, gender, phone,
-               address, course_id, registered_at, is_paid, paid_at, passport_front, passport_back, registration_message_id
-        FROM users
-        WHERE id = ? OR tg_id = ?
-        """,
-        (identifier, identifier),
-    ).fetchone()
-    conn.close()
-    return _dict_from_row(row) if row else None
+def _get_user(key_kind: str, column: str, value: int) -> Optional[Dict[str, Any]]:
+    cached = _user_cache.get((key_kind, value))
+    if cached is not None:
+        return dict(cached)
+    generation = _user_cache.generation()
+    with connection() as conn:
+        row = conn.execute(
+            f"SELECT {_USER_COLUMNS} FROM users WHERE {column} = ?", (value,)
+        ).fetchone()
+    if not row:
+        return None
+    user = _dict_from_row(row)
+    _user_cache.set((key_kind, value), user, generation)
+    return dict(user)
 
 
-def update_user_field(user_identifier: int, field: str, value: Any) -> None:
-    """
-    user_identifier: tg_id yoki id (int)
-    field: yangilanadigan ustun nomi
-    value: yangi qiymat
+def get_user_by_tg_id(tg_id: int) -> Optional[Dict[str, Any]]:
+    """Telegram ID bo'yicha (tg_id UNIQUE indeksi orqali)."""
+    return _get_user("tg", "tg_id", tg_id)
+
+
+def get_user_by_internal_id(user_id: int) -> Optional[Dict[str, Any]]:
+    """users.id (rowid) bo'yicha."""
+    return _get_user("id", "id", user_id)
+
+
+def get_user_by_tg(identifier: int) -> Optional[Dict[str, Any]]:
+    """identifier: tg_id yoki id. Eski skriptlar uchun qoldirilgan: avval tg_id,
+    topilmasa users.id bo'yicha qidiradi. Yangi kodda get_user_by_tg_id /
+    get_user_by_internal_id ishlatilsin.
     """
-    allowed_fields = {
-        "lang",
-        "first_name",
-        "last_name",
-        "birth_date",
-        "gender",
-        "phone",
-        "address",
-        "passport_front",
-        "passport_back",
-        "course_id",
-        "registered_at",
-        "is_paid",
-        "paid_at",
-        "registration_message_id",
-    }
-    if field not in allowed_fields:
+    return get_user_by_tg_id(identifier) or get_user_by_internal_id(identifier)
+
+
+_UPDATABLE_USER_FIELDS = {
+    "lang",
+    "first_name",
+    "last_name",
+    "birth_date",
+    "gender",
+    "phone",
+    "address",
+    "passport_front",
+    "passport_back",
+    "registered_at",
+    "is_paid",
+    "paid_at",
+    "registration_message_id",
+}
+
+
+def _update_user_field(column: str, identifier: int, field: str, value: Any) -> None:
+    if field == "course_id":
+        # Kurs joylari (seat_holds, joylar_soni) bilan birga o'zgarishi kerak
+        raise ValueError("course_id faqat reserve_course orqali o'zgartiriladi")
+    if field not in _UPDATABLE_USER_FIELDS:
         raise ValueError("Invalid field")
 
-    conn = get_conn()
-    c = conn.cursor()
-
-    # course_id tekshiruvi
-    if field == "course_id" and value is not None:
-        row = c.execute("SELECT id FROM courses WHERE id = ?", (value,)).fetchone()
+    with transaction() as conn:
+        # Foydalanuvchi mavjudligini tekshirish
+        row = conn.execute(
+            f"SELECT id, tg_id FROM users WHERE {column} = ?", (identifier,)
+        ).fetchone()
         if not row:
-            conn.close()
-            raise ValueError(f"Course ID {value} does not exist")
+            raise ValueError(f"User with identifier {identifier} not found")
 
-    # Foydalanuvchi mavjudligini tekshirish
-    row = c.execute(
-        "SELECT id FROM users WHERE tg_id = ? OR id = ?",
-        (user_identifier, user_identifier),
-    ).fetchone()
-    if not row:
-        conn.close()
-        raise ValueError(f"User with identifier {user_identifier} not found")
+        # Yangilash (rowid bo'yicha)
+        counted = field in _STAT_USER_COLUMNS
+        before = _stat_row(conn, row["id"]) if counted else None
+        conn.execute(f"UPDATE users SET {field} = ? WHERE id = ?", (value, row["id"]))
+        if counted:
+            _move_user_counters(conn, before, _stat_row(conn, row["id"]))
+    _invalidate_user(row["id"], row["tg_id"])
+
+
+def update_user_field_by_tg_id(tg_id: int, field: str, value: Any) -> None:
+    _update_user_field("tg_id", tg_id, field, value)
+
+
+def update_user_field_by_internal_id(user_id: int, field: str, value: Any) -> None:
+    _update_user_field("id", user_id, field, value)
 
-    # Yangilash
-    c.execute(
-        f"UPDATE users SET {field} = ? WHERE tg_id = ? OR id = ?",
-        (value, user_identifier, user_identifier),
-    )
 
-    conn.commit()
-    conn.close()
+def update_user_field(user_identifier: int, field: str, value: Any) -> None:
+    """
+    user_identifier: tg_id yoki id (int) -- avval tg_id, keyin id bo'yicha
+    field: yangilanadigan ustun nomi
+    value: yangi qiymat
+    Yangi kodda update_user_field_by_tg_id / update_user_field_by_internal_id ishlatilsin.
+    """
+    if get_user_by_tg_id(user_identifier):
+        update_user_field_by_tg_id(user_identifier, field, value)
+    else:
+        update_user_field_by_internal_id(user_identifier, field, value)
 
 
 # -----------------------------
 # Payments
 # -----------------------------
 
-def create_payment(user_id: int, amount: float, method: str, proof_file_id: str) -> int:
-    conn = get_conn()
-    c = conn.cursor()
+class DuplicateProofError(ValueError):
+    """Xuddi shu chek (Telegram file_unique_id) avval yuborilgan."""
 
-    # Foydalanuvchi borligini tekshirish
-    row = c.execute("SELECT id FROM users WHERE id = ?", (user_id,)).fetchone()
-    if not row:
-        conn.close()
-        raise ValueError(f"User {user_id} does not exist")
+    def __init__(self, payment_id: int) -> None:
+        super().__init__(f"Proof already submitted with payment {payment_id}")
+        self.payment_id = payment_id
 
-    c.execute(
-        "INSERT INTO payments (user_id, amount, method, proof_file_id) VALUES (?, ?, ?, ?)",
-        (user_id, amount, method, proof_file_id),
-    )
-    payment_id = c.lastrowid
-    conn.commit()
-    conn.close()
+
+def create_payment(
+    user_id: int,
+    amount: float,
+    method: str,
+    proof_file_id: str,
+    proof_unique_id: Optional[str] = None,
+) -> int:
+    with transaction() as conn:
+        # Foydalanuvchi borligini tekshirish
+        row = conn.execute("SELECT id FROM users WHERE id = ?", (user_id,)).fetchone()
+        if not row:
+            raise ValueError(f"User {user_id} does not exist")
+
+        try:
+            payment_id = conn.execute(
+                """
+                INSERT INTO payments (user_id, amount, method, proof_file_id, proof_unique_id)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (user_id, amount, method, proof_file_id, proof_unique_id),
+            ).lastrowid
+        except sqlite3.IntegrityError:
+            # Qisman unikal indeks: bir xil chek ikkinchi marta yozilmaydi
+            dup = conn.execute(
+                "SELECT id FROM payments WHERE proof_unique_id = ?", (proof_unique_id,)
+            ).fetchone()
+            if dup is None:
+                raise
+            raise DuplicateProofError(dup[0]) from None
+        _bump_counters(conn, {("payments", "pending"): 1})
+        # Chek ko'rib chiqilguncha band qilingan joy muddati tugamaydi
+        conn.execute("UPDATE seat_holds SET expires_at = NULL WHERE user_id = ?", (user_id,))
     return payment_id
 
 
 def list_pending_payments() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    rows = conn.execute(
-        """
-        SELECT p.id, p.user_id, u.first_name, u.last_name, p.amount, p.proof_file_id, p.created_at
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT p.id, p.user_id, u.first_name, u.last_name, p.amount, p.proof_file_id, p.created_at
+            FROM payments p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.status = 'pending'
+            ORDER BY p.id DESC
+            """
+        ).fetchall()
+    return [_dict_from_row(r) for r in rows]
+
+
+def pending_payments_page(
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    limit: int = 10,
+) -> Tuple[List[Dict[str, Any]], bool, bool]:
+    """Kutilayotgan to'lovlarning bir sahifasi (yangilari birinchi), id bo'yicha keyset.
+
+    before_id - shu id dan eskilari (keyingi sahifa), after_id - yangilari (oldingi sahifa).
+    Qaytaradi: (qatorlar, eskilari bormi, yangilari bormi).
+    """
+    select = """
+        SELECT p.id, p.user_id, u.first_name, u.last_name, p.amount, p.created_at
         FROM payments p
         JOIN users u ON p.user_id = u.id
-        WHERE p.status = 'pending'
-        ORDER BY p.id DESC
-        """
-    ).fetchall()
-    conn.close()
-    return [_dict_from_row(r) for r in rows]
+        WHERE p.status = 'pending' AND {cond}
+        ORDER BY p.id {order}
+        LIMIT ?
+    """
+    exists = "SELECT EXISTS (SELECT 1 FROM payments WHERE status = 'pending' AND id {op} ?)"
+    with connection() as conn:
+        if after_id is not None:
+            rows = conn.execute(select.format(cond="p.id > ?", order="ASC"), (after_id, limit)).fetchall()
+            rows.reverse()
+        else:
+            cursor = before_id if before_id is not None else -1
+            cond = "p.id < ?" if before_id is not None else "p.id > ?"
+            rows = conn.execute(select.format(cond=cond, order="DESC"), (cursor, limit)).fetchall()
+        if not rows:
+            return [], False, False
+        has_older = conn.execute(exists.format(op="<"), (rows[-1]["id"],)).fetchone()[0]
+        has_newer = conn.execute(exists.format(op=">"), (rows[0]["id"],)).fetchone()[0]
+    return [_dict_from_row(r) for r in rows], bool(has_older), bool(has_newer)
+
+
+def get_payment(payment_id: int) -> Optional[Dict[str, Any]]:
+    """To'lov va uning egasi (tg_id, lang, ism) - ko'rib chiqish va bildirishnoma uchun."""
+    with connection() as conn:
+        row = conn.execute(
+            """
+            SELECT p.*, u.tg_id, u.lang, u.first_name, u.last_name
+            FROM payments p
+            LEFT JOIN users u ON u.id = p.user_id
+            WHERE p.id = ?
+            """,
+            (payment_id,),
+        ).fetchone()
+    return _dict_from_row(row) if row else None
 
 
-def set_payment_status(payment_id: int, status: str, reviewed_by: Optional[int] = None) -> None:
-    if status not in {"pending", "approved", "rejected"}:
-        raise ValueError("status must be one of: pending | approved | rejected")
+def get_payment_user_tg_id(payment_id: int) -> Optional[int]:
+    """To'lov egasining Telegram ID si."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT u.tg_id FROM payments p JOIN users u ON p.user_id = u.id WHERE p.id = ?",
+            (payment_id,),
+        ).fetchone()
+    return row[0] if row else None
 
-    conn = get_conn()
-    c = conn.cursor()
 
-    # To'lov mavjudmi
-    pay = c.execute("SELECT user_id FROM payments WHERE id = ?", (payment_id,)).fetchone()
-    if not pay:
-        conn.close()
-        raise ValueError(f"Payment {payment_id} not found")
+def set_payment_status(payment_id: int, status: str, reviewed_by: Optional[int] = None) -> bool:
+    """Kutilayotgan to'lovni tasdiqlaydi yoki rad etadi.
+
+    Faqat 'pending' holatidagi to'lov o'zgaradi, shuning uchun takroriy bosish joyni
+    ikki marta qo'shmaydi. Qaytaradi: holat o'zgardimi (False - avval ko'rib chiqilgan).
+    """
+    if status not in {"approved", "rejected"}:
+        raise ValueError("status must be one of: approved | rejected")
+
+    with transaction() as conn:
+        # To'lov mavjudmi
+        pay = conn.execute(
+            "SELECT p.user_id, u.tg_id FROM payments p LEFT JOIN users u ON u.id = p.user_id WHERE p.id = ?",
+            (payment_id,),
+        ).fetchone()
+        if not pay:
+            raise ValueError(f"Payment {payment_id} not found")
+
+        now = datetime.utcnow().isoformat()
+        cur = conn.execute(
+            """
+            UPDATE payments SET status = ?, reviewed_by = ?, reviewed_at = ?
+            WHERE id = ? AND status = 'pending'
+            """,
+            (status, reviewed_by, now, payment_id),
+        )
+        if cur.rowcount == 0:
+            return False
+        _bump_counters(conn, {("payments", "pending"): -1, ("payments", status): 1})
+
+        # Agar tasdiqlansa, foydalanuvchini ham is_paid=1 qilish (agar kerak bo'lsa)
+        user_id = pay["user_id"]
+        if status == "approved":
+            before = _stat_row(conn, user_id)
+            cur = conn.execute(
+                "UPDATE users SET is_paid = 1, paid_at = COALESCE(paid_at, ?) WHERE id = ? AND COALESCE(is_paid, 0) = 0",
+                (now, user_id),
+            )
+            # Ikkinchi chek tasdiqlansa ham joy faqat bir marta hisoblanadi
+            if cur.rowcount:
+                _move_user_counters(conn, before, dict(before, is_paid=1))
+                _confirm_seat(conn, user_id)
+        elif status == "rejected":
+            # Foydalanuvchi yangi chek yuborishi uchun joy yana muddat bilan saqlanadi
+            conn.execute(
+                "UPDATE seat_holds SET expires_at = ? WHERE user_id = ? AND expires_at IS NULL",
+                (time.time() + SEAT_HOLD_MINUTES * 60, user_id),
+            )
+    if status == "approved":
+        _invalidate_user(user_id, pay["tg_id"])
+        _course_catalog.invalidate()
+    return True
 
-    now = datetime.utcnow().isoformat()
-    c.execute(
-        "UPDATE payments SET status = ?, reviewed_by = ?, reviewed_at = ? WHERE id = ?",
-        (status, reviewed_by, now, payment_id),
+
+# -----------------------------
+# Joy band qilish (seat holds)
+# -----------------------------
+
+class SeatUnavailableError(ValueError):
+    """Kursda bo'sh joy qolmagan."""
+
+
+class NoCourseError(ValueError):
+    """Foydalanuvchi hali kurs tanlamagan."""
+
+
+def _release_hold(conn: sqlite3.Connection, user_id: int) -> Optional[int]:
+    row = conn.execute(
+        "DELETE FROM seat_holds WHERE user_id = ? RETURNING course_id", (user_id,)
+    ).fetchone()
+    if row:
+        conn.execute("UPDATE courses SET held = held - 1 WHERE id = ? AND held > 0", (row[0],))
+        return row[0]
+    return None
+
+
+def _confirm_seat(conn: sqlite3.Connection, user_id: int) -> None:
+    """Tasdiqlangan to'lov: users.course_id dagi joy haqiqiy joyga aylanadi.
+
+    Shu kursdagi band qilingan joy ishlatiladi; boshqa kursdagi joy (bo'lsa) bo'shatiladi.
+    Kurs tanlanmagan bo'lsa NoCourseError, joy qolmagan bo'lsa SeatUnavailableError.
+    """
+    row = conn.execute("SELECT course_id FROM users WHERE id = ?", (user_id,)).fetchone()
+    course_id = row[0] if row else None
+    if course_id is None:
+        raise NoCourseError("Foydalanuvchi kurs tanlamagan")
+    if _release_hold(conn, user_id) == course_id:
+        conn.execute("UPDATE courses SET joylar_soni = joylar_soni + 1 WHERE id = ?", (course_id,))
+        return
+    # Band qilinmagan (eski) foydalanuvchi: joy bo'lsagina qo'shiladi
+    cur = conn.execute(
+        """
+        UPDATE courses
+        SET joylar_soni = joylar_soni + 1
+        WHERE id = ? AND joylar_soni + held < limit_count
+        """,
+        (course_id,),
     )
+    if cur.rowcount == 0:
+        raise SeatUnavailableError("Kursda bo'sh joy qolmagan")
 
-    # Agar tasdiqlansa, foydalanuvchini ham is_paid=1 qilish (agar kerak bo'lsa)
-    user_id = pay["user_id"] if isinstance(pay, sqlite3.Row) else pay[0]
-    if status == "approved":
-        c.execute(
-            "UPDATE users SET is_paid = 1, paid_at = COALESCE(paid_at, ?) WHERE id = ?",
-            (now, user_id),
+
+def _hold_seat(conn: sqlite3.Connection, user_id: int, course_id: int, expires_at: float) -> bool:
+    """Joy band qiladi (yoki mavjudini uzaytiradi). Joy qolmagan bo'lsa False."""
+    cur = conn.execute(
+        """
+        UPDATE seat_holds SET expires_at = CASE WHEN expires_at IS NULL THEN NULL ELSE ? END
+        WHERE user_id = ? AND course_id = ?
+        """,
+        (expires_at, user_id, course_id),
+    )
+    if cur.rowcount:
+        return True
+    cur = conn.execute(
+        "UPDATE courses SET held = held + 1 WHERE id = ? AND joylar_soni + held < limit_count",
+        (course_id,),
+    )
+    if cur.rowcount == 0:
+        return False
+    _release_hold(conn, user_id)
+    conn.execute(
+        "INSERT INTO seat_holds (user_id, course_id, expires_at) VALUES (?, ?, ?)",
+        (user_id, course_id, expires_at),
+    )
+    return True
+
+
+def _move_paid_seat(conn: sqlite3.Connection, old_course_id: Optional[int], course_id: int) -> None:
+    cur = conn.execute(
+        "UPDATE courses SET joylar_soni = joylar_soni + 1 WHERE id = ? AND joylar_soni + held < limit_count",
+        (course_id,),
+    )
+    if cur.rowcount == 0:
+        raise SeatUnavailableError("Kursda bo'sh joy qolmagan")
+    if old_course_id is not None:
+        conn.execute(
+            "UPDATE courses SET joylar_soni = joylar_soni - 1 WHERE id = ? AND joylar_soni > 0",
+            (old_course_id,),
         )
-        # Kurs joylar_soni ni oshirish
-        c.execute(
-            """
-            UPDATE courses 
-            SET joylar_soni = joylar_soni + 1 
-            WHERE id = (SELECT course_id FROM users WHERE id = ?)
-            """,
-            (user_id,)
+
+
+def _set_user_course(conn: sqlite3.Connection, user_id: int, course_id: int) -> None:
+    before = _stat_row(conn, user_id)
+    conn.execute("UPDATE users SET course_id = ? WHERE id = ?", (course_id, user_id))
+    _move_user_counters(conn, before, dict(before, course_id=course_id))
+
+
+def reserve_course(user_id: int, course_id: int, ttl: Optional[float] = None) -> float:
+    """Foydalanuvchi uchun kursda joy band qiladi va users.course_id ni o'rnatadi.
+
+    Shu kursda band qilingan joy bo'lsa, muddati uzaytiriladi; boshqa kursdagi joy
+    bo'shatiladi, kutish navbatidan chiqariladi. To'lagan foydalanuvchining tasdiqlangan
+    joyi (joylar_soni) yangi kursga ko'chiriladi. Joy qolmagan bo'lsa SeatUnavailableError.
+    users.course_id faqat shu yerda o'zgaradi. Qaytaradi: expires_at.
+    """
+    expires_at = time.time() + (SEAT_HOLD_MINUTES * 60 if ttl is None else ttl)
+    with transaction() as conn:
+        user = conn.execute(
+            "SELECT tg_id, course_id, COALESCE(is_paid, 0) FROM users WHERE id = ?", (user_id,)
+        ).fetchone()
+        if not user:
+            raise ValueError(f"User {user_id} does not exist")
+        if not conn.execute("SELECT 1 FROM courses WHERE id = ?", (course_id,)).fetchone():
+            raise ValueError(f"Course ID {course_id} does not exist")
+        if user[2] == 1:
+            if user[1] != course_id:
+                _move_paid_seat(conn, user[1], course_id)
+        elif not _hold_seat(conn, user_id, course_id, expires_at):
+            raise SeatUnavailableError("Kursda bo'sh joy qolmagan")
+        _set_user_course(conn, user_id, course_id)
+        conn.execute("DELETE FROM waitlist WHERE user_id = ?", (user_id,))
+    _invalidate_user(user_id, user[0])
+    _course_catalog.invalidate()
+    return expires_at
+
+
+def get_seat_hold(user_id: int) -> Optional[Dict[str, Any]]:
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT user_id, course_id, expires_at FROM seat_holds WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    return _dict_from_row(row) if row else None
+
+
+def set_course_limit(course_id: int, limit_count: int) -> None:
+    """Kurs limitini o'zgartiradi; band va tasdiqlangan joylardan kam bo'lishi mumkin emas."""
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT joylar_soni + held FROM courses WHERE id = ?", (course_id,)
+        ).fetchone()
+        if not row:
+            raise ValueError(f"Course {course_id} not found")
+        if limit_count < row[0]:
+            raise ValueError(f"Limit band qilingan joylar sonidan ({row[0]}) kam bo'lishi mumkin emas")
+        conn.execute("UPDATE courses SET limit_count = ? WHERE id = ?", (limit_count, course_id))
+    _course_catalog.invalidate()
+
+
+def release_expired_holds(now: Optional[float] = None) -> List[Tuple[int, int]]:
+    """Muddati o'tgan band qilishlarni bo'shatadi. Qaytaradi: [(user_id, course_id), ...]."""
+    with transaction() as conn:
+        rows = conn.execute(
+            "DELETE FROM seat_holds WHERE expires_at < ? RETURNING user_id, course_id",
+            (time.time() if now is None else now,),
+        ).fetchall()
+        per_course: Dict[int, int] = {}
+        for _, course_id in rows:
+            per_course[course_id] = per_course.get(course_id, 0) + 1
+        conn.executemany(
+            "UPDATE courses SET held = MAX(held - ?, 0) WHERE id = ?",
+            [(n, course_id) for course_id, n in per_course.items()],
         )
+    if rows:
+        _course_catalog.invalidate()
+    return [(r[0], r[1]) for r in rows]
+
 
-    conn.commit()
-    conn.close()
+def next_hold_expiry() -> Optional[float]:
+    """Eng yaqin tugaydigan band qilish vaqti (to'langanlar hisobga olinmaydi) yoki None."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT MIN(expires_at) FROM seat_holds WHERE expires_at IS NOT NULL"
+        ).fetchone()
+    return row[0] if row else None
 
 
 # -----------------------------
 # Statistika / Query yordamchilari
 # -----------------------------
 
-def get_stats() -> Dict[str, Any]:
-    conn = get_conn()
-    c = conn.cursor()
+# Hisoblagichlar (stats_counters) foydalanuvchi/to'lov yozuvlari bilan bir tranzaksiyada
+# yangilanadi, shuning uchun statistika paneli users jadvalini skanerlamaydi.
+# reconcile_stats() ularni jadvallardan qayta hisoblaydi.
+_STAT_USER_COLUMNS = ("course_id", "is_paid", "gender", "lang", "registered_at")
+_STATS_DAYS = 7
+
+
+def _stat_row(conn: sqlite3.Connection, user_id: int) -> Optional[Dict[str, Any]]:
+    row = conn.execute(
+        f"SELECT {', '.join(_STAT_USER_COLUMNS)} FROM users WHERE id = ?", (user_id,)
+    ).fetchone()
+    return _dict_from_row(row) if row else None
 
-    total = c.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-    paid = c.execute("SELECT COUNT(*) FROM users WHERE is_paid = 1").fetchone()[0]
-    per_course = c.execute(
-        """
-        SELECT c.id AS course_id, c.name AS course_name, COUNT(u.id) AS users_count
-        FROM courses c
-        LEFT JOIN users u ON u.course_id = c.id
-        GROUP BY c.id, c.name
-        ORDER BY c.id
-        """
-    ).fetchall()
 
-    conn.close()
+def _user_counter_keys(user: Dict[str, Any]) -> List[Tuple[str, str]]:
+    paid = user["is_paid"] == 1
+    keys = [
+        ("users", "total"),
+        ("gender", user["gender"] or ""),
+        ("lang", user["lang"] or ""),
+        ("day", (user["registered_at"] or "")[:10]),
+    ]
+    if paid:
+        keys.append(("users", "paid"))
+    if user["course_id"] is not None:
+        keys.append(("course", str(user["course_id"])))
+        if paid:
+            keys.append(("course_paid", str(user["course_id"])))
+    return keys
+
+
+def _bump_counters(conn: sqlite3.Connection, deltas: Dict[Tuple[str, str], int]) -> None:
+    rows = [(metric, key, delta) for (metric, key), delta in deltas.items() if delta]
+    if rows:
+        conn.executemany(
+            """
+            INSERT INTO stats_counters (metric, key, value) VALUES (?, ?, ?)
+            ON CONFLICT(metric, key) DO UPDATE SET value = value + excluded.value
+            """,
+            rows,
+        )
+
+
+def _move_user_counters(
+    conn: sqlite3.Connection, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]
+) -> None:
+    """Foydalanuvchi yozuvi `before` dan `after` ga o'zgarganda hisoblagichlarni to'g'rilaydi."""
+    deltas: Dict[Tuple[str, str], int] = {}
+    for user, sign in ((before, -1), (after, 1)):
+        if user is not None:
+            for k in _user_counter_keys(user):
+                deltas[k] = deltas.get(k, 0) + sign
+    _bump_counters(conn, deltas)
+
+
+def reconcile_stats() -> Dict[str, int]:
+    """Hisoblagichlarni users/payments jadvallaridan qayta quradi.
+    Qaytaradi: {"counters": jami soni, "corrected": farq qilgan hisoblagichlar}.
+    """
+    with transaction() as conn:
+        current = {
+            (r[0], r[1]): r[2]
+            for r in conn.execute("SELECT metric, key, value FROM stats_counters WHERE value != 0")
+        }
+        expected = {(r[0], r[1]): r[2] for r in conn.execute(STATS_SOURCE_SQL) if r[2]}
+        corrected = sum(
+            1 for k in current.keys() | expected.keys() if current.get(k, 0) != expected.get(k, 0)
+        )
+        conn.execute("DELETE FROM stats_counters")
+        conn.executemany(
+            "INSERT INTO stats_counters (metric, key, value) VALUES (?, ?, ?)",
+            [(metric, key, value) for (metric, key), value in expected.items()],
+        )
+    return {"counters": len(expected), "corrected": corrected}
+
+
+def get_stats() -> Dict[str, Any]:
+    """Umumiy, to'langan/to'lanmagan, kurs, jins, til va oxirgi kunlar bo'yicha sonlar.
+    Hisoblagichlardan o'qiladi: narxi foydalanuvchilar soniga emas, kurslar soniga bog'liq.
+    """
+    since = (datetime.utcnow() - timedelta(days=_STATS_DAYS - 1)).strftime("%Y-%m-%d")
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT metric, key, value FROM stats_counters
+            WHERE metric IN ('users', 'payments', 'course', 'course_paid', 'gender', 'lang')
+               OR (metric = 'day' AND key >= ?)
+            """,
+            (since,),
+        ).fetchall()
+
+    counters: Dict[str, Dict[str, int]] = {}
+    for metric, key, value in rows:
+        counters.setdefault(metric, {})[key] = value
+    users = counters.get("users", {})
+    per_course_users = counters.get("course", {})
+    per_course_paid = counters.get("course_paid", {})
+    total, paid = users.get("total", 0), users.get("paid", 0)
+
+    per_course = []
+    for c in sorted(_course_catalog.all(), key=lambda c: c["id"]):
+        users_count = per_course_users.get(str(c["id"]), 0)
+        paid_count = per_course_paid.get(str(c["id"]), 0)
+        per_course.append({
+            "course_id": c["id"],
+            "course_name": c["name"],
+            "limit_count": c["limit_count"],
+            "joylar_soni": c["joylar_soni"],
+            "users_count": users_count,
+            "paid_count": paid_count,
+            "unpaid_count": users_count - paid_count,
+        })
+
     return {
         "total": total,
         "paid": paid,
-        "per_course": [
-            {
-                "course_id": r[0],
-                "course_name": r[1],
-                "users_count": r[2],
-            }
-            for r in per_course
-        ],
+        "unpaid": total - paid,
+        "payments": counters.get("payments", {}),
+        "by_gender": counters.get("gender", {}),
+        "by_lang": counters.get("lang", {}),
+        "by_day": dict(sorted(counters.get("day", {}).items())),
+        "per_course": per_course,
     }
 
 
+def get_user_with_course(user_id: int) -> Optional[Dict[str, Any]]:
+    """users.id bo'yicha foydalanuvchi va uning kurs nomi (bitta so'rov)."""
+    with connection() as conn:
+        row = conn.execute(
+            f"""
+            SELECT {", ".join("u." + c.strip() for c in _USER_COLUMNS.split(","))},
+                   c.name AS course_name
+            FROM users u
+            LEFT JOIN courses c ON c.id = u.course_id
+            WHERE u.id = ?
+            """,
+            (user_id,),
+        ).fetchone()
+    return _dict_from_row(row) if row else None
+
+
 def get_all_users() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    rows = conn.execute("SELECT * FROM users ORDER BY id DESC").fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute("SELECT * FROM users ORDER BY id DESC").fetchall()
     return [_dict_from_row(r) for r in rows]
 
 
+def count_users(gender: Optional[str] = None) -> int:
+    """Hisoblagichlardan o'qiladi (qarang: get_stats)."""
+    metric, key = ("users", "total") if gender is None else ("gender", gender)
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT value FROM stats_counters WHERE metric = ? AND key = ?", (metric, key)
+        ).fetchone()
+    return row[0] if row else 0
+
+
+def iter_users_for_export(
+    gender: Optional[str] = None, chunk_size: int = 500
+) -> Iterator[List[sqlite3.Row]]:
+    """Eksport uchun foydalanuvchilarni kurs nomi bilan bo'laklab qaytaradi.
+    Ulanish iteratsiya tugaguncha band bo'ladi, shuning uchun uni faqat
+    alohida thread ichida to'liq o'qib chiqish kerak.
+    """
+    sql = """
+        SELECT u.*, c.name AS course_name
+        FROM users u
+        LEFT JOIN courses c ON c.id = u.course_id
+    """
+    params: Tuple[Any, ...] = ()
+    if gender is not None:
+        sql += " WHERE u.gender = ?"
+        params = (gender,)
+    sql += " ORDER BY u.id DESC"
+    with connection() as conn:
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
 def get_users_by_gender(gender: str) -> List[Dict[str, Any]]:
-    conn = get_conn()
-    rows = conn.execute(
-        """
-        SELECT id, tg_id, lang, first_name, last_name, birth_date, gender, phone, address, course_id
-        FROM users
-        WHERE gender = ?
-        ORDER BY id DESC
-        """,
-        (gender,),
-    ).fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, tg_id, lang, first_name, last_name, birth_date, gender, phone, address, course_id
+            FROM users
+            WHERE gender = ?
+            ORDER BY id DESC
+            """,
+            (gender,),
+        ).fetchall()
     return [_dict_from_row(r) for r in rows]
 
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    row = conn.execute(
-        """
-        SELECT id, tg_id, lang, first_name, last_name, birth_date, gender, phone, address, course_id
-        FROM users
-        WHERE id = ?
-        """,
-        (user_id,),
-    ).fetchone()
-    conn.close()
-    return _dict_from_row(row) if row else None
\ No newline at end of file
+    return get_user_by_internal_id(user_id)
+
+
+# -----------------------------
+# Analitika (vaqt qatorlari)
+# -----------------------------
+
+def analytics_series(since: datetime, hourly: bool, utc_offset_hours: int = 0) -> Dict[str, List[Tuple[str, int]]]:
+    """`since` (UTC) dan beri soatlik yoki kunlik sonlar: ro'yxatdan o'tish, yuborilgan
+    cheklar (created_at bo'yicha), tasdiqlangan/rad etilgan cheklar (reviewed_at bo'yicha).
+    Bo'lak nomlari mahalliy vaqtda: '%Y-%m-%d %H:00' yoki '%Y-%m-%d'.
+    """
+    fmt = "%Y-%m-%d %H:00" if hourly else "%Y-%m-%d"
+    shift = f"{int(utc_offset_hours):+d} hours"
+    # registered_at/created_at: datetime('now') formati; reviewed_at: isoformat()
+    since_sql = since.strftime("%Y-%m-%d %H:%M:%S")
+    since_iso = since.isoformat()
+    queries = {
+        "registrations": (
+            "SELECT strftime(?, registered_at, ?) AS b, COUNT(*) FROM users "
+            "WHERE registered_at >= ? GROUP BY b ORDER BY b", since_sql),
+        "proofs": (
+            "SELECT strftime(?, created_at, ?) AS b, COUNT(*) FROM payments "
+            "WHERE created_at >= ? GROUP BY b ORDER BY b", since_sql),
+        "approved": (
+            "SELECT strftime(?, reviewed_at, ?) AS b, COUNT(*) FROM payments "
+            "WHERE reviewed_at >= ? AND status = 'approved' GROUP BY b ORDER BY b", since_iso),
+        "rejected": (
+            "SELECT strftime(?, reviewed_at, ?) AS b, COUNT(*) FROM payments "
+            "WHERE reviewed_at >= ? AND status = 'rejected' GROUP BY b ORDER BY b", since_iso),
+    }
+    with connection() as conn:
+        return {
+            name: [(r[0], r[1]) for r in conn.execute(sql, (fmt, shift, bound)) if r[0]]
+            for name, (sql, bound) in queries.items()
+        }
+
+
+def review_latencies(since: datetime) -> List[float]:
+    """`since` dan beri ko'rib chiqilgan cheklar uchun chek yuborilgandan
+    admin qaroriga qadar o'tgan vaqt (soniya), o'sish tartibida."""
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT (julianday(reviewed_at) - julianday(created_at)) * 86400.0 AS s
+            FROM payments
+            WHERE reviewed_at >= ? AND created_at IS NOT NULL
+            ORDER BY s
+            """,
+            (since.isoformat(),),
+        ).fetchall()
+    return [max(r[0], 0.0) for r in rows if r[0] is not None]
+
+
+def registration_funnel(since: datetime) -> Dict[str, int]:
+    """`since` dan beri ro'yxatdan o'tganlar: kurs tanlagan, chek yuborgan, to'lovi tasdiqlangan."""
+    with connection() as conn:
+        row = conn.execute(
+            """
+            SELECT COUNT(*) AS registered,
+                   COALESCE(SUM(u.course_id IS NOT NULL), 0) AS chose_course,
+                   COALESCE(SUM(EXISTS (SELECT 1 FROM payments p WHERE p.user_id = u.id)), 0) AS sent_proof,
+                   COALESCE(SUM(u.is_paid = 1), 0) AS paid
+            FROM users u
+            WHERE u.registered_at >= ?
+            """,
+            (since.strftime("%Y-%m-%d %H:%M:%S"),),
+        ).fetchone()
+    return _dict_from_row(row)
+
+
+# -----------------------------
+# FSM storage
+# -----------------------------
+
+def fsm_load(key: str) -> Optional[Tuple[Optional[str], Optional[str], float]]:
+    """(state, data_json, updated_at) yoki None."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT state, data, updated_at FROM fsm_storage WHERE key = ?", (key,)
+        ).fetchone()
+    return (row[0], row[1], row[2]) if row else None
+
+
+def fsm_save_many(
+    rows: Iterable[Tuple[str, Optional[str], Optional[str], float]],
+    deleted: Iterable[str] = (),
+    events: Iterable[Tuple[int, Optional[str], Optional[str], float]] = (),
+) -> None:
+    """Bir tranzaksiyada bir nechta FSM yozuvini saqlaydi / o'chiradi.
+    rows: (key, state, data_json, updated_at)
+    events: holat o'tishlari (user_id, prev_state, state, at) -> funnel_events
+    """
+    with transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+        conn.executemany("DELETE FROM fsm_storage WHERE key = ?", ((k,) for k in deleted))
+        conn.executemany(
+            "INSERT INTO funnel_events (user_id, prev_state, state, at) VALUES (?, ?, ?, ?)",
+            events,
+        )
+
+
+def fsm_purge_expired(before: float) -> int:
+    """`before` dan oldin yangilangan (tashlab ketilgan) FSM yozuvlarini o'chiradi."""
+    with transaction() as conn:
+        return conn.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (before,)).rowcount
+
+
+def funnel_purge(before: float) -> int:
+    """`before` dan eski holat o'tishlarini o'chiradi."""
+    with transaction() as conn:
+        return conn.execute("DELETE FROM funnel_events WHERE at < ?", (before,)).rowcount
+
+
+def funnel_dwell(states: Sequence[str], since: float) -> List[Tuple[str, int, Optional[float]]]:
+    """`since` dan beri `states` ga har bir kirish: (state, user_id, dwell_s).
+    dwell_s - foydalanuvchining keyingi o'tishigacha vaqt (hali chiqmagan bo'lsa None).
+    """
+    placeholders = ", ".join("?" for _ in states)
+    with connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT state, user_id, next_at - at FROM (
+                SELECT state, user_id, at,
+                       LEAD(at) OVER (PARTITION BY user_id ORDER BY id) AS next_at
+                FROM funnel_events
+                WHERE at >= ?
+            )
+            WHERE state IN ({placeholders})
+            """,
+            (since, *states),
+        ).fetchall()
+    return [(r[0], r[1], r[2]) for r in rows]
+
+
+def funnel_last_states(since: float) -> Dict[Optional[str], int]:
+    """`since` dan beri faol bo'lgan foydalanuvchilar oxirgi holati bo'yicha soni
+    (None - holat tozalangan: ro'yxatdan o'tish tugagan yoki bekor qilingan)."""
+    with connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT state, COUNT(*) FROM (
+                SELECT state, MAX(id) FROM funnel_events WHERE at >= ? GROUP BY user_id
+            )
+            GROUP BY state
+            """,
+            (since,),
+        ).fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+# -----------------------------
+# Broadcasts
+# -----------------------------
+
+_BROADCAST_FILTERS = ("course_id", "gender", "is_paid", "lang")
+
+
+def _recipient_filter_sql(filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    clauses, params = [], []
+    for f in _BROADCAST_FILTERS:
+        if filters.get(f) is not None:
+            clauses.append(f"{f} = ?")
+            params.append(filters[f])
+    return "".join(f" AND {c}" for c in clauses), params
+
+
+def create_broadcast(text: str, filters: Dict[str, Any], created_by: Optional[int] = None) -> int:
+    """filters: course_id, gender, is_paid, lang (None - filtrsiz)."""
+    with transaction() as conn:
+        return conn.execute(
+            """
+            INSERT INTO broadcasts (text, course_id, gender, is_paid, lang, created_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (text, *(filters.get(f) for f in _BROADCAST_FILTERS), created_by),
+        ).lastrowid
+
+
+def get_broadcast(broadcast_id: int) -> Optional[Dict[str, Any]]:
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+    return _dict_from_row(row) if row else None
+
+
+def list_running_broadcasts() -> List[Dict[str, Any]]:
+    with connection() as conn:
+        rows = conn.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id").fetchall()
+    return [_dict_from_row(r) for r in rows]
+
+
+def count_broadcast_recipients(filters: Dict[str, Any]) -> int:
+    where, params = _recipient_filter_sql(filters)
+    with connection() as conn:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM users WHERE tg_id IS NOT NULL{where}", params
+        ).fetchone()[0]
+
+
+def fetch_broadcast_recipients(filters: Dict[str, Any], after_user_id: int, limit: int) -> List[Tuple[int, int]]:
+    """Keyset sahifalash: (users.id, tg_id) ro'yxati, users.id > after_user_id."""
+    where, params = _recipient_filter_sql(filters)
+    with connection() as conn:
+        rows = conn.execute(
+            f"""
+            SELECT id, tg_id FROM users
+            WHERE id > ? AND tg_id IS NOT NULL{where}
+            ORDER BY id
+            LIMIT ?
+            """,
+            (after_user_id, *params, limit),
+        ).fetchall()
+    return [(r[0], r[1]) for r in rows]
+
+
+def save_broadcast_progress(
+    broadcast_id: int,
+    last_user_id: int,
+    delivered: int,
+    blocked: int,
+    failed: int,
+    status: Optional[str] = None,
+) -> None:
+    with transaction() as conn:
+        conn.execute(
+            """
+            UPDATE broadcasts
+            SET last_user_id = ?, delivered = ?, blocked = ?, failed = ?,
+                status = COALESCE(?, status),
+                finished_at = CASE WHEN ? IN ('done', 'cancelled') THEN datetime('now') ELSE finished_at END
+            WHERE id = ?
+            """,
+            (last_user_id, delivered, blocked, failed, status, status, broadcast_id),
+        )
+
+
+# -----------------------------
+# Kutish navbati (waitlist)
+# -----------------------------
+
+def join_waitlist(user_id: int, course_id: int) -> int:
+    """Foydalanuvchini kurs navbatiga qo'yadi (boshqa kurs navbatidan chiqariladi). Qaytaradi: o'rni."""
+    with transaction() as conn:
+        if not conn.execute("SELECT 1 FROM courses WHERE id = ?", (course_id,)).fetchone():
+            raise ValueError(f"Course {course_id} not found")
+        row = conn.execute(
+            "SELECT id, course_id FROM waitlist WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row and row[1] == course_id:
+            entry_id = row[0]
+        else:
+            conn.execute("DELETE FROM waitlist WHERE user_id = ?", (user_id,))
+            entry_id = conn.execute(
+                "INSERT INTO waitlist (user_id, course_id) VALUES (?, ?)", (user_id, course_id)
+            ).lastrowid
+        return conn.execute(
+            "SELECT COUNT(*) FROM waitlist WHERE course_id = ? AND id <= ?", (course_id, entry_id)
+        ).fetchone()[0]
+
+
+def leave_waitlist(user_id: int) -> None:
+    with transaction() as conn:
+        conn.execute("DELETE FROM waitlist WHERE user_id = ?", (user_id,))
+
+
+def promote_waitlist(batch_size: int = 50) -> List[Dict[str, Any]]:
+    """Bo'sh joyi bor kurslar navbatidagi birinchi foydalanuvchilarga joy band qiladi.
+
+    Qaytaradi: [{"user_id", "tg_id", "lang", "course_id", "expires_at"}, ...] (navbat tartibida).
+    """
+    expires_at = time.time() + SEAT_HOLD_MINUTES * 60
+    promoted: List[Dict[str, Any]] = []
+    with transaction() as conn:
+        courses = conn.execute(
+            """
+            SELECT c.id, c.limit_count - c.joylar_soni - c.held AS free
+            FROM courses c
+            WHERE c.limit_count - c.joylar_soni - c.held > 0
+              AND EXISTS (SELECT 1 FROM waitlist w WHERE w.course_id = c.id)
+            """
+        ).fetchall()
+        for course_id, free in courses:
+            if len(promoted) >= batch_size:
+                break
+            rows = conn.execute(
+                """
+                SELECT w.id, w.user_id, u.tg_id, u.lang, u.is_paid
+                FROM waitlist w
+                JOIN users u ON u.id = w.user_id
+                WHERE w.course_id = ?
+                ORDER BY w.id
+                LIMIT ?
+                """,
+                (course_id, batch_size - len(promoted)),
+            ).fetchall()
+            for entry_id, user_id, tg_id, lang, is_paid in rows:
+                if not free:
+                    break
+                if is_paid:
+                    # To'lagan foydalanuvchining joyi bor: navbatdan ataylab chiqariladi
+                    conn.execute("DELETE FROM waitlist WHERE id = ?", (entry_id,))
+                    logger.info(f"Removed paid user {user_id} from the course {course_id} waitlist")
+                    continue
+                if not _hold_seat(conn, user_id, course_id, expires_at):
+                    # Navbatda qoladi: keyingi o'tishda qayta uriniladi
+                    continue
+                conn.execute("DELETE FROM waitlist WHERE id = ?", (entry_id,))
+                free -= 1
+                _set_user_course(conn, user_id, course_id)
+                promoted.append({
+                    "user_id": user_id, "tg_id": tg_id, "lang": lang,
+                    "course_id": course_id, "expires_at": expires_at,
+                })
+    if promoted:
+        for p in promoted:
+            _invalidate_user(p["user_id"], p["tg_id"])
+        _course_catalog.invalidate()
+    return promoted
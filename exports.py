@@ -0,0 +1,179 @@
+# exports.py
+"""Streaming user exports (xlsx / csv) for the admin panel.
+
+Rows are read from a cursor in chunks and written straight to a temp file, so
+memory stays flat no matter how many applicants there are. xlsx files are
+written with xlsxwriter's constant_memory mode. The blocking part runs in a
+worker thread; handlers only await `export_users()` and upload the file.
+If the awaiting task is cancelled, the thread stops at the next chunk, removes
+its temp file and `export_users()` returns only after the thread has finished.
+"""
+import asyncio
+import csv
+import functools
+import os
+import tempfile
+import threading
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from database import iter_users_for_export
+
+# (sarlavha, ustun nomi)
+Column = Tuple[str, str]
+
+FULL_COLUMNS: List[Column] = [
+    ("ID", "id"),
+    ("TG ID", "tg_id"),
+    ("Til", "lang"),
+    ("Ism", "first_name"),
+    ("Familiya", "last_name"),
+    ("Tug'ilgan sana", "birth_date"),
+    ("Jins", "gender"),
+    ("Telefon", "phone"),
+    ("Manzil", "address"),
+    ("Pasport oldi", "passport_front"),
+    ("Pasport orqa", "passport_back"),
+    ("Kurs ID", "course_id"),
+    ("Ro‘yxatdan o‘tgan vaqt", "registered_at"),
+    ("To‘lov qilinganmi", "is_paid"),
+    ("To‘lov vaqti", "paid_at"),
+    ("Guruh xabari ID", "registration_message_id"),
+    ("Kurs nomi", "course_name"),
+]
+
+SHORT_COLUMNS: List[Column] = [
+    ("ID", "id"),
+    ("TG ID", "tg_id"),
+    ("Til", "lang"),
+    ("Ism", "first_name"),
+    ("Familiya", "last_name"),
+    ("Tug'ilgan sana", "birth_date"),
+    ("Jins", "gender"),
+    ("Telefon", "phone"),
+    ("Manzil", "address"),
+    ("Kurs ID", "course_id"),
+    ("Kurs nomi", "course_name"),
+]
+
+UNKNOWN_COURSE = "Noma'lum"
+MAX_COLUMN_WIDTH = 60
+CHUNK_SIZE = 500
+
+ProgressCallback = Callable[[int], None]
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def _chunks(gender: Optional[str], cancel: Optional[threading.Event]) -> Iterator[list]:
+    chunks = iter_users_for_export(gender, CHUNK_SIZE)
+    try:
+        for chunk in chunks:
+            # Har bo'lakda tekshiriladi: to'xtatilsa ulanish darhol poolga qaytadi
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _row_values(row, keys: Sequence[str]) -> list:
+    values = [row[k] for k in keys]
+    if "course_name" in keys:
+        i = keys.index("course_name")
+        if values[i] is None:
+            values[i] = UNKNOWN_COURSE
+    return values
+
+
+def _write_xlsx(path: str, columns: Sequence[Column], gender: Optional[str],
+                progress: Optional[ProgressCallback], cancel: Optional[threading.Event]) -> int:
+    import xlsxwriter
+
+    headers = [h for h, _ in columns]
+    keys = [k for _, k in columns]
+    widths = [len(h) for h in headers]
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    try:
+        worksheet = workbook.add_worksheet("Users")
+        worksheet.write_row(0, 0, headers)
+        written = 0
+        for chunk in _chunks(gender, cancel):
+            for row in chunk:
+                values = _row_values(row, keys)
+                written += 1
+                worksheet.write_row(written, 0, values)
+                for i, v in enumerate(values):
+                    n = len(str(v)) if v is not None else 0
+                    if n > widths[i]:
+                        widths[i] = n
+            if progress:
+                progress(written)
+        for i, w in enumerate(widths):
+            worksheet.set_column(i, i, min(w + 2, MAX_COLUMN_WIDTH))
+    finally:
+        workbook.close()
+    return written
+
+
+def _write_csv(path: str, columns: Sequence[Column], gender: Optional[str],
+               progress: Optional[ProgressCallback], cancel: Optional[threading.Event]) -> int:
+    keys = [k for _, k in columns]
+    written = 0
+    # utf-8-sig: Excel kirill/lotin harflarini to'g'ri ochishi uchun
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow([h for h, _ in columns])
+        for chunk in _chunks(gender, cancel):
+            writer.writerows(_row_values(row, keys) for row in chunk)
+            written += len(chunk)
+            if progress:
+                progress(written)
+    return written
+
+
+_WRITERS = {"xlsx": _write_xlsx, "csv": _write_csv}
+
+
+def write_users_export(fmt: str, columns: Sequence[Column], gender: Optional[str] = None,
+                       progress: Optional[ProgressCallback] = None,
+                       cancel: Optional[threading.Event] = None) -> Tuple[str, int]:
+    """Eksportni vaqtinchalik faylga yozadi va (fayl yo'li, qatorlar soni) ni qaytaradi.
+    Fayl bilan ish tugagach chaqiruvchi uni o'chirishi kerak. `cancel` o'rnatilsa yoki
+    xato bo'lsa, fayl o'chiriladi va ExportCancelled / xato ko'tariladi.
+    """
+    writer = _WRITERS.get(fmt)
+    if writer is None:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    fd, path = tempfile.mkstemp(prefix="users_", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        count = writer(path, columns, gender, progress, cancel)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
+
+
+async def export_users(fmt: str, columns: Sequence[Column], gender: Optional[str] = None,
+                       progress: Optional[ProgressCallback] = None) -> Tuple[str, int]:
+    """`write_users_export` ni event loopni bloklamasdan bajaradi."""
+    loop = asyncio.get_running_loop()
+    cancel = threading.Event()
+    future = loop.run_in_executor(
+        None, functools.partial(write_users_export, fmt, columns, gender, progress, cancel)
+    )
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # Thread to'xtab, faylini o'chirmaguncha qaytmaymiz (shutdown pooldan oldin kutadi)
+        cancel.set()
+        try:
+            path, _ = await future
+        except Exception:
+            pass
+        else:
+            # cancel kelguncha yozib ulgurgan
+            os.remove(path)
+        raise
@@ -1,20 +1,31 @@
 import re
 from aiogram import F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import (
-    list_pending_payments, set_payment_status, get_user_by_tg,
-    list_courses, add_course, get_stats, update_user_field, get_all_users,
-    get_users_by_gender, get_user_by_id, delete_course
+from async_db import (
+    pending_payments_page, get_payment,
+    list_courses, add_course, get_stats, update_user_field_by_internal_id,
+    get_user_with_course, delete_course, get_course_by_id,
+    count_course_users, count_users, count_broadcast_recipients, set_course_limit,
+    reconcile_stats, reserve_course
 )
-from config import ADMIN_IDS, DB_PATH
+from analytics import PERIODS, analytics, format_duration, registration_steps
+from broadcast import broadcasts
+from metrics import metrics
+from seats import seat_sweeper
+from config import ADMIN_IDS, EXPORT_MAX_CONCURRENCY, FUNNEL_REPORT_DAYS
+from handlers.payment import review_keyboard
+from handlers.registration import Registration
+from exports import FULL_COLUMNS, SHORT_COLUMNS, export_users
+from jobs import Job, JobQueue
+from database import SeatUnavailableError
 import logging
+import os
 from datetime import datetime
 import sqlite3
-import pandas as pd
-from io import BytesIO
 from aiogram import types
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -28,6 +39,10 @@ class AddCourseStates(StatesGroup):
     limit_count = State()
     narx = State()
 
+class BroadcastStates(StatesGroup):
+    text = State()
+    confirm = State()
+
 def create_inline_keyboard(buttons: list, row_width: int = 2) -> InlineKeyboardMarkup:
     """Create an inline keyboard from a list of (text, callback_data) tuples."""
     keyboard = [
@@ -52,19 +67,23 @@ def admin_only(func):
         return await func(message_or_callback, *args, **kwargs)
     return wrapper
 
-async def generate_users_excel(users_data, columns) -> BytesIO:
-    df = pd.DataFrame(users_data, columns=columns)
-    buf = BytesIO()
-    with pd.ExcelWriter(buf, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Users')
-        worksheet = writer.sheets['Users']
-        for idx, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-            worksheet.set_column(idx, idx, max_len)
-    buf.seek(0)
-    return buf
+# Kutilayotgan to'lovlar sahifasidagi yozuvlar soni
+PENDING_PAGE_SIZE = 10
+
+# callback_data -> (ustunlar, jins filtri, fayl nomi, format, bo'sh bo'lsa matn)
+USER_EXPORTS = {
+    "view_all_users": (FULL_COLUMNS, None, "all_users.xlsx", "xlsx", "Foydalanuvchilar yo'q."),
+    "view_males": (SHORT_COLUMNS, "erkak", "males.xlsx", "xlsx", "Erkak foydalanuvchilar yo'q."),
+    "view_females": (SHORT_COLUMNS, "ayol", "females.xlsx", "xlsx", "Ayol foydalanuvchilar yo'q."),
+    "export_all_excel": (SHORT_COLUMNS, None, "all_users_export.xlsx", "xlsx", "Foydalanuvchilar yo'q."),
+    "export_all_csv": (FULL_COLUMNS, None, "all_users.csv", "csv", "Foydalanuvchilar yo'q."),
+}
+
+# Eksport ishlari navbati; main() to'xtashda close() qiladi
+export_jobs = JobQueue(EXPORT_MAX_CONCURRENCY)
 
 def register_admin_handlers(dp):
+
     @dp.message(Command("admin"))
     @admin_only
     async def admin_panel(message: types.Message, *args, **kwargs):
@@ -73,7 +92,9 @@ def register_admin_handlers(dp):
             ("💳 To'lovlar (pending)", "adm_pending"),
             ("📋 Kurslar", "adm_courses"),
             ("👥 Foydalanuvchilar", "adm_users"),
-            ("📊 Statistika", "adm_stats")
+            ("📊 Statistika", "adm_stats"),
+            ("📈 Analitika", "adm_analytics"),
+            ("🔻 Ro'yxatdan o'tish bosqichlari", "adm_funnel")
         ]
         kb = create_inline_keyboard(buttons)
         await message.answer("Admin panel:", reply_markup=kb)
@@ -88,194 +109,76 @@ def register_admin_handlers(dp):
             ("♂ Erkaklar", "view_males"),
             ("♀ Ayollar", "view_females"),
             ("🔍 Muayyan foydalanuvchi", "view_specific_user"),
-            ("📥 Excel yuklab olish (hammasi)", "export_all_excel")
+            ("📥 Excel yuklab olish (hammasi)", "export_all_excel"),
+            ("📄 CSV yuklab olish (hammasi)", "export_all_csv")
         ]
         kb = create_inline_keyboard(buttons)
         await callback.message.answer("Foydalanuvchilar bo'limi:", reply_markup=kb)
         await callback.answer()
 
-    @dp.callback_query(F.data == "view_all_users")
-    @admin_only
-    async def view_all_users(callback: CallbackQuery, **kwargs):
-        """View all users as an Excel file."""
-        try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            users = get_all_users()
-            logger.info(f"Fetched {len(users)} users for view_all_users")
-            if not users:
-                await callback.message.answer("Foydalanuvchilar yo'q.")
-                await callback.answer()
-                conn.close()
-                return
-            columns = [
-                'ID',
-                'TG ID',
-                'Til',
-                'Ism',
-                'Familiya',
-                'Tug\'ilgan sana',
-                'Jins',
-                'Telefon',
-                'Manzil',
-                'Pasport oldi',
-                'Pasport orqa',
-                'Kurs ID',
-                'Ro‘yxatdan o‘tgan vaqt',
-                'To‘lov qilinganmi',
-                'To‘lov vaqti',
-                'Guruh xabari ID',
-                'Kurs nomi'
-            ]
-            users_data = []
-            cur = conn.cursor()
-            for user in users:
-                cur.execute("SELECT name FROM courses WHERE id = ?", (user['course_id'],))
-                course_data = cur.fetchone()
-                course_name = course_data[0] if course_data else "Noma'lum"
-                users_data.append([
-                    user['id'],
-                    user['tg_id'],
-                    user['lang'],
-                    user['first_name'],
-                    user['last_name'],
-                    user['birth_date'],
-                    user['gender'],
-                    user['phone'],
-                    user['address'],
-                    user['passport_front'],
-                    user['passport_back'],
-                    user['course_id'],
-                    user['registered_at'],
-                    user['is_paid'],
-                    user['paid_at'],
-                    user['registration_message_id'],
-                    course_name
-                ])
-            conn.close()
-            buf = await generate_users_excel(users_data, columns)
-            await callback.message.answer_document(document=BufferedInputFile(buf.getvalue(), filename='all_users.xlsx'))
-            await callback.answer()
-            logger.info(f"Admin {callback.from_user.id} viewed all users as Excel.")
-        except Exception as e:
-            await callback.message.answer(f"Faylni yuborishda xato: {str(e)}")
-            await callback.answer("Xato", show_alert=True)
-            logger.error(f"Error in view_all_users for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+    def make_export_job(bot, export_key: str):
+        """Build the (run, on_progress) pair for one export job."""
+        columns, gender, filename, fmt, empty_text = USER_EXPORTS[export_key]
 
-    @dp.callback_query(F.data == "view_males")
-    @admin_only
-    async def view_males(callback: CallbackQuery, **kwargs):
-        """View male users as an Excel file."""
-        try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            users = get_users_by_gender('erkak')
-            logger.info(f"Fetched {len(users)} male users")
-            if not users:
-                await callback.message.answer("Erkak foydalanuvchilar yo'q.")
-                await callback.answer()
-                conn.close()
-                return
-            columns = [
-                'ID',
-                'TG ID',
-                'Til',
-                'Ism',
-                'Familiya',
-                'Tug\'ilgan sana',
-                'Jins',
-                'Telefon',
-                'Manzil',
-                'Kurs ID',
-                'Kurs nomi'
-            ]
-            users_data = []
-            cur = conn.cursor()
-            for user in users:
-                cur.execute("SELECT name FROM courses WHERE id = ?", (user['course_id'],))
-                course_data = cur.fetchone()
-                course_name = course_data[0] if course_data else "Noma'lum"
-                users_data.append([
-                    user['id'],
-                    user['tg_id'],
-                    user['lang'],
-                    user['first_name'],
-                    user['last_name'],
-                    user['birth_date'],
-                    user['gender'],
-                    user['phone'],
-                    user['address'],
-                    user['course_id'],
-                    course_name
-                ])
-            conn.close()
-            buf = await generate_users_excel(users_data, columns)
-            await callback.message.answer_document(document=BufferedInputFile(buf.getvalue(), filename='males.xlsx'))
-            await callback.answer()
-            logger.info(f"Admin {callback.from_user.id} viewed male users as Excel.")
-        except Exception as e:
-            await callback.message.answer(f"Faylni yuborishda xato: {str(e)}")
-            await callback.answer("Xato", show_alert=True)
-            logger.error(f"Error in view_males for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+        async def on_progress(job: Job):
+            total = f"/{job.total}" if job.total is not None else ""
+            text = f"⏳ Eksport tayyorlanmoqda: {job.done}{total} qator"
+            for chat_id, message_id in job.subscribers:
+                try:
+                    await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+                except Exception as e:
+                    logger.debug(f"Could not edit export progress in {chat_id}: {str(e)}")
 
-    @dp.callback_query(F.data == "view_females")
+        async def run(job: Job):
+            path = None
+            try:
+                job.report(0, await count_users(gender))
+                path, count = await export_users(fmt, columns, gender, progress=job.report)
+                await job.stop_progress()
+                logger.info(f"Exported {count} users for {export_key}")
+                for chat_id, message_id in job.subscribers:
+                    try:
+                        if not count:
+                            await bot.edit_message_text(text=empty_text, chat_id=chat_id, message_id=message_id)
+                            continue
+                        await bot.send_document(chat_id, document=FSInputFile(path, filename=filename))
+                        await bot.edit_message_text(
+                            text=f"✅ Eksport tayyor: {count} qator", chat_id=chat_id, message_id=message_id
+                        )
+                    except Exception as e:
+                        logger.error(f"Error delivering {filename} to {chat_id}: {str(e)}")
+            except Exception as e:
+                await job.stop_progress()
+                for chat_id, message_id in job.subscribers:
+                    try:
+                        await bot.edit_message_text(
+                            text=f"Faylni tayyorlashda xato: {str(e)}", chat_id=chat_id, message_id=message_id
+                        )
+                    except Exception:
+                        pass
+                raise
+            finally:
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+        return run, on_progress
+
+    @dp.callback_query(F.data.in_(set(USER_EXPORTS)))
     @admin_only
-    async def view_females(callback: CallbackQuery, **kwargs):
-        """View female users as an Excel file."""
-        try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            users = get_users_by_gender('ayol')
-            logger.info(f"Fetched {len(users)} female users")
-            if not users:
-                await callback.message.answer("Ayol foydalanuvchilar yo'q.")
-                await callback.answer()
-                conn.close()
-                return
-            columns = [
-                'ID',
-                'TG ID',
-                'Til',
-                'Ism',
-                'Familiya',
-                'Tug\'ilgan sana',
-                'Jins',
-                'Telefon',
-                'Manzil',
-                'Kurs ID',
-                'Kurs nomi'
-            ]
-            users_data = []
-            cur = conn.cursor()
-            for user in users:
-                cur.execute("SELECT name FROM courses WHERE id = ?", (user['course_id'],))
-                course_data = cur.fetchone()
-                course_name = course_data[0] if course_data else "Noma'lum"
-                users_data.append([
-                    user['id'],
-                    user['tg_id'],
-                    user['lang'],
-                    user['first_name'],
-                    user['last_name'],
-                    user['birth_date'],
-                    user['gender'],
-                    user['phone'],
-                    user['address'],
-                    user['course_id'],
-                    course_name
-                ])
-            conn.close()
-            buf = await generate_users_excel(users_data, columns)
-            await callback.message.answer_document(document=BufferedInputFile(buf.getvalue(), filename='females.xlsx'))
-            await callback.answer()
-            logger.info(f"Admin {callback.from_user.id} viewed female users as Excel.")
-        except Exception as e:
-            await callback.message.answer(f"Faylni yuborishda xato: {str(e)}")
-            await callback.answer("Xato", show_alert=True)
-            logger.error(f"Error in view_females for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+    async def users_export(callback: CallbackQuery, **kwargs):
+        """Queue an Excel/CSV export; the file is sent when the background job finishes."""
+        text = (
+            "⏳ Bu eksport allaqachon tayyorlanmoqda. Tayyor bo'lgach sizga ham yuboriladi."
+            if export_jobs.get(callback.data) else
+            "⏳ Eksport navbatga qo'yildi. Tayyor bo'lgach fayl yuboriladi."
+        )
+        msg = await callback.message.answer(text)
+        # submit + subscribe orasida await yo'q: job obunachisiz tugab qolmaydi
+        run, on_progress = make_export_job(callback.bot, callback.data)
+        job, created = export_jobs.submit(callback.data, run, on_progress=on_progress)
+        job.subscribe(msg.chat.id, msg.message_id)
+        await callback.answer()
+        logger.info(f"Admin {callback.from_user.id} requested export {callback.data} (new job: {created}).")
 
     @dp.callback_query(F.data == "view_specific_user")
     @admin_only
@@ -290,19 +193,13 @@ def register_admin_handlers(dp):
     async def view_specific_user(message: Message, state: FSMContext, **kwargs):
         """View details of a specific user by ID."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
             user_id = int(message.text.strip())
-            user = get_user_by_id(user_id)
+            user = await get_user_with_course(user_id)
             if not user:
                 await message.answer("Foydalanuvchi topilmadi.")
                 await state.clear()
-                conn.close()
                 return
-            cur = conn.cursor()
-            cur.execute("SELECT name FROM courses WHERE id = ?", (user['course_id'],))
-            course_data = cur.fetchone()
-            conn.close()
-            course_name = course_data[0] if course_data else "Noma'lum"
+            course_name = user['course_name'] or "Noma'lum"
             text = (
                 f"ID: {user['id']}\n"
                 f"TG ID: {user['tg_id']}\n"
@@ -323,175 +220,93 @@ def register_admin_handlers(dp):
         except Exception as e:
             await message.answer(f"Xato yuz berdi: {str(e)}")
             logger.error(f"Error in view_specific_user for admin {message.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
 
-    @dp.callback_query(F.data == "export_all_excel")
-    @admin_only
-    async def export_all_excel(callback: CallbackQuery, **kwargs):
-        """Export all users as an Excel file."""
-        try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            users = get_all_users()
-            logger.info(f"Fetched {len(users)} users for export_all_excel")
-            if not users:
-                await callback.message.answer("Foydalanuvchilar yo'q.")
-                await callback.answer()
-                conn.close()
-                return
-            columns = [
-                'ID',
-                'TG ID',
-                'Til',
-                'Ism',
-                'Familiya',
-                'Tug\'ilgan sana',
-                'Jins',
-                'Telefon',
-                'Manzil',
-                'Kurs ID',
-                'Kurs nomi'
-            ]
-            users_data = []
-            cur = conn.cursor()
-            for user in users:
-                cur.execute("SELECT name FROM courses WHERE id = ?", (user['course_id'],))
-                course_data = cur.fetchone()
-                course_name = course_data[0] if course_data else "Noma'lum"
-                users_data.append([
-                    user['id'],
-                    user['tg_id'],
-                    user['lang'],
-                    user['first_name'],
-                    user['last_name'],
-                    user['birth_date'],
-                    user['gender'],
-                    user['phone'],
-                    user['address'],
-                    user['course_id'],
-                    course_name
-                ])
-            conn.close()
-            buf = await generate_users_excel(users_data, columns)
-            await callback.message.answer_document(document=BufferedInputFile(buf.getvalue(), filename='all_users_export.xlsx'))
-            await callback.answer()
-            logger.info(f"Admin {callback.from_user.id} exported all users as Excel.")
-        except Exception as e:
-            await callback.message.answer(f"Faylni yuborishda xato: {str(e)}")
-            await callback.answer("Xato", show_alert=True)
-            logger.error(f"Error in export_all_excel for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+    async def render_pending_page(before_id: int = None, after_id: int = None):
+        """Build the text and keyboard for one page of pending payments."""
+        rows, has_older, has_newer = await pending_payments_page(before_id, after_id, PENDING_PAGE_SIZE)
+        if not rows:
+            return "Pending to'lovlar yo'q.", None
+        text = "💳 Kutilayotgan to'lovlar:\n\n" + "\n".join(
+            f"#{r['id']} — {r['first_name']} {r['last_name']}, {r['amount']:,} so'm, {r['created_at']}"
+            for r in rows
+        )
+        kb = create_inline_keyboard([(f"🧾 #{r['id']} {r['first_name']}", f"pay_view:{r['id']}") for r in rows])
+        nav = []
+        if has_newer:
+            nav.append(InlineKeyboardButton(text="⬅️ Oldingi", callback_data=f"pend_page:newer:{rows[0]['id']}"))
+        if has_older:
+            nav.append(InlineKeyboardButton(text="Keyingi ➡️", callback_data=f"pend_page:older:{rows[-1]['id']}"))
+        if nav:
+            kb.inline_keyboard.append(nav)
+        return text, kb
 
     @dp.callback_query(F.data == "adm_pending")
     @admin_only
     async def adm_pending(callback: CallbackQuery, **kwargs):
-        """List pending payments."""
+        """Show the first page of pending payments."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            rows = list_pending_payments()
-            if not rows:
-                await callback.message.answer("Pending to'lovlar yo'q.")
-                await callback.answer()
-                conn.close()
-                return
-            for r in rows[:10]:
-                buttons = [
-                    ("✅ Tasdiqlash", f"pay_approve:{r['id']}:{r['user_id']}"),
-                    ("❌ Rad etish", f"pay_reject:{r['id']}:{r['user_id']}"),
-                    ("🧾 Foydalanuvchini tahrirlash", f"edit_user:{r['user_id']}")
-                ]
-                kb = create_inline_keyboard(buttons)
-                await callback.message.answer_photo(
-                    photo=r['proof_file_id'],
-                    caption=f"Payment ID: {r['id']}\nUser: {r['first_name']} {r['last_name']}\nSumma: {r['amount']:,}\nSana: {r['created_at']}",
-                    reply_markup=kb
-                )
-            if len(rows) > 10:
-                await callback.message.answer("Ko'proq to'lovlar bor. /morepending bilan davom eting.")
+            text, kb = await render_pending_page()
+            await callback.message.answer(text, reply_markup=kb)
             await callback.answer()
             logger.info(f"Admin {callback.from_user.id} viewed pending payments.")
-            conn.close()
         except Exception as e:
             await callback.message.answer(f"Xato yuz berdi: {str(e)}")
             await callback.answer("Xato", show_alert=True)
             logger.error(f"Error in adm_pending for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
 
-    @dp.callback_query(F.data.startswith("pay_approve:"))
+    @dp.callback_query(F.data.startswith("pend_page:"))
     @admin_only
-    async def pay_approve(callback: CallbackQuery, **kwargs):
-        """Approve a payment and notify the user."""
+    async def pending_page(callback: CallbackQuery, **kwargs):
+        """Move between pages of pending payments in the same message."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            _, pid, user_id = callback.data.split(":")
-            pid = int(pid)
-            user_id = int(user_id)
-            set_payment_status(pid, "approved", reviewed_by=callback.from_user.id)
-            await callback.message.answer(f"To'lov #{pid} tasdiqlandi.")
-            user = get_user_by_tg(user_id)
-            if user:
-                lang = user['lang'] or "uz"
-                try:
-                    await callback.message.bot.send_message(
-                        user['tg_id'], 
-                        "✅ To'lovingiz tasdiqlandi. Endi kursga kirishingiz mumkin." if lang == "uz" else
-                        "✅ Ваш платеж подтвержден. Теперь вы можете приступить к курсу."
-                    )
-                    logger.info(f"Sent approval notification to user {user['tg_id']} for payment {pid}.")
-                except Exception as e:
-                    logger.error(f"Error sending approval notification to user {user['tg_id']}: {str(e)}")
+            _, direction, cursor = callback.data.split(":")
+            if direction == "older":
+                text, kb = await render_pending_page(before_id=int(cursor))
+            else:
+                text, kb = await render_pending_page(after_id=int(cursor))
+            if kb is None:
+                # Sahifadagi barcha to'lovlar ko'rib chiqilgan bo'lishi mumkin: boshidan ko'rsatiladi
+                text, kb = await render_pending_page()
+            await callback.message.edit_text(text, reply_markup=kb)
+            await callback.answer()
+        except TelegramBadRequest:
+            # Sahifa o'zgarmagan ("message is not modified")
             await callback.answer()
-            logger.info(f"Admin {callback.from_user.id} approved payment {pid}.")
-            conn.close()
         except Exception as e:
             await callback.message.answer(f"Xato yuz berdi: {str(e)}")
             await callback.answer("Xato", show_alert=True)
-            logger.error(f"Error approving payment for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+            logger.error(f"Error in pending_page for admin {callback.from_user.id}: {str(e)}")
 
-    @dp.callback_query(F.data.startswith("pay_reject:"))
+    @dp.callback_query(F.data.startswith("pay_view:"))
     @admin_only
-    async def pay_reject(callback: CallbackQuery, **kwargs):
-        """Reject a payment and notify the user."""
+    async def pay_view(callback: CallbackQuery, **kwargs):
+        """Show a payment's proof with review buttons."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            _, pid, user_id = callback.data.split(":")
-            pid = int(pid)
-            user_id = int(user_id)
-            set_payment_status(pid, "rejected", reviewed_by=callback.from_user.id)
-            await callback.message.answer(f"To'lov #{pid} rad etildi.")
-            user = get_user_by_tg(user_id)
-            if user:
-                lang = user['lang'] or "uz"
-                try:
-                    await callback.message.bot.send_message(
-                        user['tg_id'], 
-                        "❌ To'lovingiz rad etildi. Iltimos, qayta urinib ko‘ring." if lang == "uz" else
-                        "❌ Ваш платеж отклонен. Пожалуйста, попробуйте снова."
-                    )
-                    logger.info(f"Sent rejection notification to user {user['tg_id']} for payment {pid}.")
-                except Exception as e:
-                    logger.error(f"Error sending rejection notification to user {user['tg_id']}: {str(e)}")
+            payment = await get_payment(int(callback.data.split(":")[1]))
+            if not payment:
+                await callback.answer("To'lov topilmadi.", show_alert=True)
+                return
+            caption = (
+                f"Payment ID: {payment['id']}\nUser: {payment['first_name']} {payment['last_name']}\n"
+                f"Summa: {payment['amount']:,}\nSana: {payment['created_at']}\nHolat: {payment['status']}"
+            )
+            kb = review_keyboard(payment['id']) if payment['status'] == "pending" else InlineKeyboardMarkup(inline_keyboard=[])
+            kb.inline_keyboard.append(
+                [InlineKeyboardButton(text="🧾 Foydalanuvchini tahrirlash", callback_data=f"edit_user:{payment['user_id']}")]
+            )
+            await callback.message.answer_photo(photo=payment['proof_file_id'], caption=caption, reply_markup=kb)
             await callback.answer()
-            logger.info(f"Admin {callback.from_user.id} rejected payment {pid}.")
-            conn.close()
         except Exception as e:
             await callback.message.answer(f"Xato yuz berdi: {str(e)}")
             await callback.answer("Xato", show_alert=True)
-            logger.error(f"Error rejecting payment for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+            logger.error(f"Error in pay_view for admin {callback.from_user.id}: {str(e)}")
 
     @dp.callback_query(F.data == "adm_courses")
     @admin_only
     async def adm_courses(callback: CallbackQuery, **kwargs):
         """Kurslar ro'yxatini ko‘rsatish."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            rows = list_courses()
+            rows = await list_courses()
             buttons = []
             if rows:
                 text = "📚 *Kurslar ro‘yxati:*\n\n" + "\n".join([
@@ -512,39 +327,31 @@ def register_admin_handlers(dp):
             await callback.message.answer(text, reply_markup=kb, parse_mode="Markdown")
             await callback.answer()
             logger.info(f"Admin {callback.from_user.id} viewed courses.")
-            conn.close()
         except Exception as e:
             await callback.message.answer("❌ Kurslar ro‘yxatini yuklashda xatolik yuz berdi. Keyinroq urinib ko‘ring.")
             await callback.answer("Xato", show_alert=True)
             logger.error(f"Error in adm_courses for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
 
     @dp.callback_query(F.data.startswith("course_del:"))
     @admin_only
     async def delete_course_cb(callback: CallbackQuery, **kwargs):
         """Kursni ID bo‘yicha o‘chirish."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
             course_id = int(callback.data.split(":")[1])
             # Check if there are users associated with the course
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM users WHERE course_id = ?", (course_id,))
-            user_count = cur.fetchone()[0]
+            user_count = await count_course_users(course_id)
             if user_count > 0:
                 await callback.message.answer(
                     f"❌ Kursni o'chirib bo'lmaydi! {user_count} foydalanuvchi ushbu kursga bog'langan. "
                     "Avval foydalanuvchilarni o'chirish yoki boshqa kursga o'tkazish kerak."
                 )
                 await callback.answer()
-                conn.close()
                 logger.info(f"Admin {callback.from_user.id} attempted to delete course ID {course_id} but {user_count} users are associated.")
                 return
-            delete_course(course_id)
+            await delete_course(course_id)
             await callback.message.answer(f"✅ Kurs o'chirildi. ID: {course_id}")
             logger.info(f"Admin {callback.from_user.id} deleted course ID: {course_id}")
             await callback.answer()
-            conn.close()
         except sqlite3.OperationalError as e:
             if "database is locked" in str(e):
                 await callback.message.answer("❌ Ma'lumotlar bazasi band. Iltimos, keyinroq urinib ko'ring.")
@@ -552,14 +359,10 @@ def register_admin_handlers(dp):
                 await callback.message.answer(f"❌ Xato yuz berdi: {str(e)}")
             await callback.answer("Xato", show_alert=True)
             logger.error(f"Error deleting course for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
         except Exception as e:
             await callback.message.answer(f"❌ Xato yuz berdi: {str(e)}")
             await callback.answer("Xato", show_alert=True)
             logger.error(f"Error deleting course for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
 
     @dp.callback_query(F.data == "course_add")
     @admin_only
@@ -633,13 +436,12 @@ def register_admin_handlers(dp):
     async def add_course_finish(message: Message, state: FSMContext, **kwargs):
         """Finish adding a new course."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
             narx = float(message.text.strip())
             if narx < 0:
                 raise ValueError
             await state.update_data(narx=narx)
             data = await state.get_data()
-            add_course(
+            await add_course(
                 name=data["name"],
                 description=data["description"],
                 gender=data["gender"],
@@ -658,58 +460,110 @@ def register_admin_handlers(dp):
             )
             await state.clear()
             logger.info(f"Admin {message.from_user.id} added course: {data['name']}")
-            conn.close()
         except Exception as e:
             await message.answer(f"❌ Xato yuz berdi: {str(e)}")
             logger.error(f"Error in add_course_finish for admin {message.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
 
     @dp.callback_query(F.data == "adm_stats")
     @admin_only
     async def adm_stats(callback: CallbackQuery, **kwargs):
         """Show bot statistics."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            s = get_stats()
-            text = f"📊 Statistika:\n🎯 Jami foydalanuvchilar: {s['total']}\n💳 To'lov qilganlar: {s['paid']}\n"
+            s = await get_stats()
+            text = (
+                f"📊 Statistika:\n🎯 Jami foydalanuvchilar: {s['total']}\n"
+                f"💳 To'lov qilganlar: {s['paid']}\n⏳ To'lov qilmaganlar: {s['unpaid']}\n"
+                f"🧾 Cheklar: {s['payments'].get('pending', 0)} kutilmoqda, "
+                f"{s['payments'].get('approved', 0)} tasdiqlangan, {s['payments'].get('rejected', 0)} rad etilgan\n"
+            )
             if s['per_course']:
                 text += "📚 Kurslarga bo'linishi:\n"
-                cur = conn.cursor()
                 for p in s['per_course']:
-                    cur.execute("SELECT name FROM courses WHERE id = ?", (p['course_id'],))
-                    cn = cur.fetchone()
-                    name = cn[0] if cn else "Noma'lum"
-                    text += f"- {name}: {p['users_count']}\n"
+                    text += (
+                        f"- {p['course_name']}: {p['users_count']} "
+                        f"(✅ {p['paid_count']} / ⏳ {p['unpaid_count']}, joy {p['joylar_soni']}/{p['limit_count']})\n"
+                    )
+            if s['by_gender']:
+                text += "👥 Jins: " + ", ".join(f"{k or 'nomaʼlum'}: {v}" for k, v in s['by_gender'].items() if v) + "\n"
+            if s['by_lang']:
+                text += "🌐 Til: " + ", ".join(f"{k or 'nomaʼlum'}: {v}" for k, v in s['by_lang'].items() if v) + "\n"
+            if s['by_day']:
+                text += "📅 Oxirgi kunlar: " + ", ".join(f"{k[5:]}: {v}" for k, v in s['by_day'].items() if v) + "\n"
             await callback.message.answer(text)
             await callback.answer()
             logger.info(f"Admin {callback.from_user.id} viewed statistics.")
-            conn.close()
         except Exception as e:
             await callback.message.answer(f"Xato yuz berdi: {str(e)}")
             await callback.answer("Xato", show_alert=True)
             logger.error(f"Error in adm_stats for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
+
+    @dp.callback_query(F.data == "adm_analytics")
+    @admin_only
+    async def adm_analytics(callback: CallbackQuery, **kwargs):
+        """Offer the analytics periods."""
+        kb = create_inline_keyboard([(title, f"analytics:{key}") for key, (title, _, _) in PERIODS.items()], row_width=3)
+        await callback.message.answer("📈 Qaysi davr uchun analitika?", reply_markup=kb)
+        await callback.answer()
+
+    @dp.callback_query(F.data.startswith("analytics:"))
+    @admin_only
+    async def analytics_report(callback: CallbackQuery, **kwargs):
+        """Send the analytics chart and summary for a period."""
+        period = callback.data.split(":", 1)[1]
+        if period not in PERIODS:
+            await callback.answer("Noma'lum davr", show_alert=True)
+            return
+        await callback.answer("⏳ Tayyorlanmoqda...")
+        try:
+            report = await analytics.report(period)
+            await callback.message.answer_photo(
+                BufferedInputFile(report["png"], filename=f"analytics_{period}.png"),
+                caption=report["caption"],
+            )
+            logger.info(f"Admin {callback.from_user.id} viewed analytics {period}.")
+        except Exception as e:
+            await callback.message.answer(f"Xato yuz berdi: {str(e)}")
+            logger.error(f"Error in analytics_report for admin {callback.from_user.id}: {str(e)}")
+
+    @dp.callback_query(F.data == "adm_funnel")
+    @admin_only
+    async def adm_funnel(callback: CallbackQuery, **kwargs):
+        """Show per-step conversion and dwell time of the registration FSM."""
+        try:
+            report = await registration_steps(Registration.__state_names__, FUNNEL_REPORT_DAYS)
+
+            def pct(share):
+                return f"{share * 100:.0f}%" if share is not None else "-"
+
+            lines = [f"🔻 Ro'yxatdan o'tish bosqichlari (oxirgi {FUNNEL_REPORT_DAYS} kun):"]
+            for step in report["steps"]:
+                lines.append(
+                    f"• {step['state'].split(':', 1)[1]}: {step['users']} "
+                    f"({pct(step['of_first'])}, oldingidan {pct(step['of_prev'])}), "
+                    f"to'xtagan {step['stuck']}, "
+                    f"p50 {format_duration(step['p50'])} / p95 {format_duration(step['p95'])}"
+                )
+            lines.append(f"✅ Yakunlangan yoki bekor qilingan: {report['finished']}")
+            await callback.message.answer("\n".join(lines))
+            await callback.answer()
+            logger.info(f"Admin {callback.from_user.id} viewed registration funnel.")
+        except Exception as e:
+            await callback.message.answer(f"Xato yuz berdi: {str(e)}")
+            await callback.answer("Xato", show_alert=True)
+            logger.error(f"Error in adm_funnel for admin {callback.from_user.id}: {str(e)}")
 
     @dp.callback_query(F.data.startswith("edit_user:"))
     @admin_only
     async def edit_user(callback: CallbackQuery, **kwargs):
         """Edit a user's details."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
             user_id = int(callback.data.split(":")[1])
-            user = get_user_by_id(user_id)
+            user = await get_user_with_course(user_id)
             if not user:
                 await callback.message.answer("Foydalanuvchi topilmadi.")
                 await callback.answer()
-                conn.close()
                 return
-            cur = conn.cursor()
-            cur.execute("SELECT name FROM courses WHERE id = ?", (user['course_id'],))
-            course_data = cur.fetchone()
-            conn.close()
-            course_name = course_data[0] if course_data else "Noma'lum"
+            course_name = user['course_name'] or "Noma'lum"
             text = (
                 f"Foydalanuvchi ma'lumotlari:\n"
                 f"ID: {user_id}\n"
@@ -732,51 +586,185 @@ def register_admin_handlers(dp):
             await callback.message.answer(f"Xato yuz berdi: {str(e)}")
             await callback.answer("Xato", show_alert=True)
             logger.error(f"Error in edit_user for admin {callback.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
 
     @dp.message(Command("edituser"))
     @admin_only
     async def edituser_cmd(message: Message, **kwargs):
         """Edit a user's field via command."""
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
             parts = message.text.split(maxsplit=3)
             if len(parts) < 4:
                 await message.reply("Foydalanish: /edituser user_id field value\nMasalan: /edituser 1 first_name YangiIsm")
-                conn.close()
                 return
             user_id, field, value = parts[1:4]
             valid_fields = ["first_name", "last_name", "birth_date", "gender", "phone", "course_id"]
             if field not in valid_fields:
                 await message.reply(f"To'g'ri maydonni tanlang: {', '.join(valid_fields)}")
-                conn.close()
                 return
             if field == "birth_date":
                 datetime.strptime(value, "%Y-%m-%d")
             elif field == "gender" and value not in ["erkak", "ayol"]:
                 await message.reply("Jins 'erkak' yoki 'ayol' bo'lishi kerak.")
-                conn.close()
                 return
             elif field == "phone":
                 if not re.match(r"^\+998\d{9}$", value):
                     await message.reply("Telefon raqami +998 bilan boshlanib, 9 ta raqamdan iborat bo'lishi kerak.")
-                    conn.close()
                     return
             elif field == "course_id":
                 value = int(value)
-                cur = conn.cursor()
-                cur.execute("SELECT id FROM courses WHERE id = ?", (value,))
-                if not cur.fetchone():
+                if not await get_course_by_id(value):
                     await message.reply("Bunday kurs mavjud emas.")
-                    conn.close()
                     return
-            update_user_field(int(user_id), field, value)
+            if field == "course_id":
+                # Joy band qilish / tasdiqlangan joyni ko'chirish bilan birga
+                try:
+                    await reserve_course(int(user_id), value)
+                except SeatUnavailableError:
+                    await message.reply("❌ Bu kursda bo'sh joy qolmagan.")
+                    return
+                seat_sweeper.wake()
+            else:
+                await update_user_field_by_internal_id(int(user_id), field, value)
             await message.reply(f"Foydalanuvchi {user_id} uchun {field} yangilandi: {value}")
             logger.info(f"Admin {message.from_user.id} updated {field} for user {user_id} to {value}.")
-            conn.close()
         except Exception as e:
             await message.reply(f"Xato yuz berdi: {str(e)}")
             logger.error(f"Error in edituser_cmd for admin {message.from_user.id}: {str(e)}")
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
+
+    @dp.message(Command("setlimit"))
+    @admin_only
+    async def setlimit_cmd(message: Message, **kwargs):
+        """Change a course's seat limit: /setlimit course_id limit."""
+        parts = message.text.split()
+        if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+            await message.reply("Foydalanish: /setlimit course_id limit\nMasalan: /setlimit 2 40")
+            return
+        course_id, limit_count = int(parts[1]), int(parts[2])
+        try:
+            await set_course_limit(course_id, limit_count)
+        except ValueError as e:
+            await message.reply(f"❌ {str(e)}")
+            return
+        # Limit oshgan bo'lsa navbatdagilarga joy darhol beriladi
+        seat_sweeper.wake()
+        await message.reply(f"✅ Kurs {course_id} limiti: {limit_count} ta joy.")
+        logger.info(f"Admin {message.from_user.id} set course {course_id} limit to {limit_count}.")
+
+    @dp.message(Command("reconcilestats"))
+    @admin_only
+    async def reconcilestats_cmd(message: Message, **kwargs):
+        """Rebuild the statistics counters from the users and payments tables."""
+        try:
+            result = await reconcile_stats()
+        except Exception as e:
+            await message.reply(f"Xato yuz berdi: {str(e)}")
+            logger.error(f"Error in reconcilestats_cmd for admin {message.from_user.id}: {str(e)}")
+            return
+        await message.reply(
+            f"✅ Statistika qayta hisoblandi: {result['counters']} ta hisoblagich, "
+            f"{result['corrected']} tasi tuzatildi."
+        )
+        logger.info(f"Admin {message.from_user.id} reconciled stats: {result}")
+
+    @dp.message(Command("metrics"))
+    @admin_only
+    async def metrics_cmd(message: Message, **kwargs):
+        """Show the slowest routes, DB calls and Bot API methods by total time."""
+        def ms(seconds):
+            return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+        sections = (
+            ("⚙️ Handlerlar", "bot_handler_seconds"),
+            ("🗄 Baza", "bot_db_seconds"),
+            ("📡 Telegram API", "bot_telegram_api_seconds"),
+        )
+        lines = ["📏 Metrikalar (jami vaqt bo'yicha; n, o'rtacha / p95 ms):"]
+        for title, family in sections:
+            rows = metrics.top(family, limit=8)
+            lines.append(f"\n{title}:")
+            if not rows:
+                lines.append("  ma'lumot yo'q")
+            for r in rows:
+                lines.append(f"  {r['label']}: {r['count']}, {ms(r['avg'])} / {ms(r['p95'])}, jami {r['total']:.1f} s")
+        await message.answer("\n".join(lines))
+        logger.info(f"Admin {message.from_user.id} viewed metrics.")
+
+    @dp.message(Command("broadcast"))
+    @admin_only
+    async def broadcast_cmd(message: Message, state: FSMContext, **kwargs):
+        """Start a broadcast: /broadcast [course=ID] [gender=erkak|ayol] [paid=0|1] [lang=uz|ru]."""
+        filters = {"course_id": None, "gender": None, "is_paid": None, "lang": None}
+        try:
+            for arg in message.text.split()[1:]:
+                key, _, value = arg.partition("=")
+                if key == "course":
+                    filters["course_id"] = int(value)
+                elif key == "gender" and value in ("erkak", "ayol"):
+                    filters["gender"] = value
+                elif key == "paid" and value in ("0", "1"):
+                    filters["is_paid"] = int(value)
+                elif key == "lang" and value in ("uz", "ru"):
+                    filters["lang"] = value
+                else:
+                    raise ValueError(arg)
+        except ValueError:
+            await message.reply(
+                "Foydalanish: /broadcast [course=ID] [gender=erkak|ayol] [paid=0|1] [lang=uz|ru]\n"
+                "Masalan: /broadcast course=2 paid=0"
+            )
+            return
+        count = await count_broadcast_recipients(filters)
+        if not count:
+            await message.reply("Bu filtr bo'yicha foydalanuvchilar yo'q.")
+            return
+        await state.update_data(bc_filters=filters, bc_count=count)
+        await state.set_state(BroadcastStates.text)
+        await message.answer(f"👥 Qabul qiluvchilar: {count} ta.\n✍️ Yuboriladigan xabar matnini kiriting:")
+
+    @dp.message(BroadcastStates.text)
+    @admin_only
+    async def broadcast_text(message: Message, state: FSMContext, **kwargs):
+        """Get broadcast text and ask for confirmation."""
+        if not message.text:
+            await message.answer("❌ Faqat matnli xabar yuborish mumkin. Qayta kiriting:")
+            return
+        data = await state.get_data()
+        await state.update_data(bc_text=message.text)
+        await state.set_state(BroadcastStates.confirm)
+        kb = create_inline_keyboard([("✅ Yuborish", "bc_start"), ("❌ Bekor qilish", "bc_cancel")])
+        await message.answer(
+            f"📢 Xabar {data['bc_count']} ta foydalanuvchiga yuboriladi:\n\n{message.text}",
+            reply_markup=kb
+        )
+
+    @dp.callback_query(BroadcastStates.confirm, F.data.in_({"bc_start", "bc_cancel"}))
+    @admin_only
+    async def broadcast_confirm(callback: CallbackQuery, state: FSMContext, **kwargs):
+        """Launch or cancel the prepared broadcast."""
+        data = await state.get_data()
+        await state.clear()
+        await callback.message.edit_reply_markup(reply_markup=None)
+        if callback.data == "bc_cancel":
+            await callback.answer("Bekor qilindi.")
+            return
+        broadcast_id = await broadcasts.start(data["bc_text"], data["bc_filters"], callback.from_user.id)
+        await callback.message.answer(
+            f"🚀 Xabar #{broadcast_id} yuborilmoqda. Tugagach hisobot keladi.\n"
+            f"To'xtatish: /bcancel {broadcast_id}"
+        )
+        await callback.answer()
+        logger.info(f"Admin {callback.from_user.id} started broadcast {broadcast_id} with {data['bc_filters']}")
+
+    @dp.message(Command("bcancel"))
+    @admin_only
+    async def broadcast_cancel_cmd(message: Message, **kwargs):
+        """Stop a running broadcast: /bcancel <id>."""
+        parts = message.text.split()
+        if len(parts) != 2 or not parts[1].isdigit():
+            await message.reply("Foydalanish: /bcancel broadcast_id")
+            return
+        if await broadcasts.cancel(int(parts[1])):
+            await message.reply(f"⛔️ Xabar #{parts[1]} to'xtatildi.")
+            logger.info(f"Admin {message.from_user.id} cancelled broadcast {parts[1]}")
+        else:
+            await message.reply("Bunday faol xabar yo'q.")
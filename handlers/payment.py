@@ -1,22 +1,50 @@
 # payment.py
-from aiogram import Bot, F
+from aiogram import F
 from aiogram.types import Message, CallbackQuery, ContentType, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import get_user_by_tg, create_payment, get_course_by_id, set_payment_status
-from config import BOT_TOKEN, ADMIN_IDS
-import sqlite3
-bot = Bot(token=BOT_TOKEN)
+from async_db import (
+    get_user_by_tg_id, create_payment, get_course_by_id, set_payment_status, get_payment,
+    reserve_course
+)
+from database import DuplicateProofError, NoCourseError, SeatUnavailableError
+from config import ADMIN_IDS
+from i18n import t
+from outbox import outbox
+import logging
+
+logger = logging.getLogger(__name__)
+
 PAY_GROUP_ID = -1002397524134
 class PaymentStates(StatesGroup):
     await_proof = State()
 
+# To'lovni ko'rib chiqish tugmalari: pay_approve:{id} / pay_reject:{id}.
+# Eski xabarlardagi approve_{id} / reject_{id} va pay_approve:{id}:{user_id} ham qabul qilinadi.
+REVIEW_PREFIXES = ("pay_approve:", "pay_reject:", "approve_", "reject_")
+
+def review_keyboard(payment_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Tasdiqlash", callback_data=f"pay_approve:{payment_id}")],
+        [InlineKeyboardButton(text="❌ Rad etish", callback_data=f"pay_reject:{payment_id}")]
+    ])
+
+def parse_review_callback(data: str) -> tuple:
+    """Return (status, payment_id) for any supported review callback_data."""
+    if data.startswith("pay_"):
+        action, payment_id = data.split(":")[:2]
+        status = "approved" if action == "pay_approve" else "rejected"
+    else:
+        action, payment_id = data.split("_", 1)
+        status = "approved" if action == "approve" else "rejected"
+    return status, int(payment_id)
+
 async def register_payment_handlers(dp):
 
     @dp.callback_query(F.data.startswith("pay_now:"))
     async def ask_payment_proof(callback: CallbackQuery, state: FSMContext):
         tg_id = callback.from_user.id
-        user = get_user_by_tg(tg_id)
+        user = await get_user_by_tg_id(tg_id)
         if not user:
             await callback.message.answer("❌ Siz ro'yxatdan o'tmagansiz. Avval /start bilan ro'yxatdan o'ting.")
             await callback.answer()
@@ -28,12 +56,20 @@ async def register_payment_handlers(dp):
             return
 
         course_id = int(callback.data.split(":")[1])
-        course = get_course_by_id(course_id)
+        course = await get_course_by_id(course_id)
         if not course:
             await callback.message.answer("❌ Kurs topilmadi.")
             await callback.answer()
             return
 
+        # Band qilingan joy muddati uzaytiriladi (yoki muddati o'tgan bo'lsa qayta band qilinadi)
+        try:
+            await reserve_course(user['id'], course_id)
+        except SeatUnavailableError:
+            await callback.message.answer("❌ Afsuski, bu kursda bo'sh joy qolmadi.")
+            await callback.answer()
+            return
+
         await callback.message.answer(
             f"📚 Siz {course['name']} kursi uchun to‘lov qilmoqdasiz.\n\n"
             "Iltimos, to‘lov chekini yuboring.\n\n"
@@ -54,32 +90,35 @@ async def register_payment_handlers(dp):
     @dp.message(PaymentStates.await_proof, F.content_type == ContentType.PHOTO)
     async def get_payment_proof(message: Message, state: FSMContext):
         tg_id = message.from_user.id
-        user = get_user_by_tg(tg_id)
+        user = await get_user_by_tg_id(tg_id)
         if not user:
             await message.answer("❌ Siz ro'yxatdan o'tmagansiz. Avval /start bilan ro'yxatdan o'ting.")
             return
 
-        file_id = message.photo[-1].file_id
+        photo = message.photo[-1]
+        file_id = photo.file_id
         data = await state.get_data()
         course_id = data.get("course_id")
-        course = get_course_by_id(course_id)
-
-        # Bazaga saqlash
-        payment_id = create_payment(
-            user_id=user['id'],
-            amount=course['narx'],
-            method="transfer",
-            proof_file_id=file_id
-        )
+        course = await get_course_by_id(course_id)
+
+        # Bazaga saqlash (bir xil chek ikkinchi marta qabul qilinmaydi)
+        try:
+            payment_id = await create_payment(
+                user_id=user['id'],
+                amount=course['narx'],
+                method="transfer",
+                proof_file_id=file_id,
+                proof_unique_id=photo.file_unique_id
+            )
+        except DuplicateProofError as e:
+            await message.answer(f"❌ Bu chek avval yuborilgan (to'lov #{e.payment_id}). Iltimos, boshqa chek yuboring.")
+            return
 
         await message.answer("✅ Chekingiz qabul qilindi. Admin tasdiqlaguncha kuting.")
         await state.clear()
 
         # Inline tugmalar (faqat adminlar uchun)
-        kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="✅ Tasdiqlash", callback_data=f"approve_{payment_id}")],
-            [InlineKeyboardButton(text="❌ Rad etish", callback_data=f"reject_{payment_id}")]
-        ])
+        kb = review_keyboard(payment_id)
 
         caption_text = (
             f"📥 Yangi chek!\n"
@@ -89,64 +128,41 @@ async def register_payment_handlers(dp):
             f"Tg_id: {tg_id}"
         )
 
-        # Adminga yuborish
+        # Adminga yuborish (fon navbati orqali, foydalanuvchi kutmaydi)
         for admin in ADMIN_IDS:
-            try:
-                await bot.send_photo(
-                    admin,
-                    photo=file_id,
-                    caption=caption_text,
-                    reply_markup=kb
-                )
-            except Exception as e:
-                print("Adminga yuborishda xato:", e)
+            outbox.submit(admin, "send_photo", photo=file_id, caption=caption_text, reply_markup=kb)
 
         # Guruhga yuborish (lekin tugmalarni qo‘ymasdan faqat ma’lumot sifatida)
-        try:
-            await bot.send_photo(
-                PAY_GROUP_ID,
-                photo=file_id,
-                caption=caption_text
-            )
-        except Exception as e:
-            print("Guruhga yuborishda xato:", e)
+        outbox.submit(PAY_GROUP_ID, "send_photo", photo=file_id, caption=caption_text)
 
-    @dp.callback_query(F.data.startswith("approve_"))
-    async def approve_payment(callback: CallbackQuery):
+    @dp.callback_query(F.data.startswith(REVIEW_PREFIXES))
+    async def review_payment(callback: CallbackQuery):
+        """Approve or reject a payment; repeated taps are no-ops."""
         if callback.from_user.id not in ADMIN_IDS:
             await callback.answer("Siz admin emassiz.")
             return
 
-        payment_id = int(callback.data.replace("approve_", ""))
-        set_payment_status(payment_id, "approved", callback.from_user.id)
-
-        # Foydalanuvchiga xabar
-        conn = sqlite3.connect("users.db")
-        cur = conn.cursor()
-        cur.execute("SELECT u.tg_id FROM payments p JOIN users u ON p.user_id = u.id WHERE p.id = ?", (payment_id,))
-        tg_id = cur.fetchone()[0]
-        conn.close()
+        status, payment_id = parse_review_callback(callback.data)
+        try:
+            changed = await set_payment_status(payment_id, status, callback.from_user.id)
+        except SeatUnavailableError:
+            await callback.answer("❌ Kursda bo'sh joy qolmagan.", show_alert=True)
+            return
+        except NoCourseError:
+            await callback.answer("❌ Foydalanuvchi kurs tanlamagan. Avval kursini belgilang (/edituser).", show_alert=True)
+            return
+        except ValueError:
+            await callback.answer("❌ To'lov topilmadi.", show_alert=True)
+            return
 
-        await bot.send_message(tg_id, "✅ To'lov tasdiqlandi! Kursga qo'shildingiz.")
+        payment = await get_payment(payment_id)
         await callback.message.edit_reply_markup(reply_markup=None)
-        await callback.answer("Tasdiqlandi.")
-
-    @dp.callback_query(F.data.startswith("reject_"))
-    async def reject_payment(callback: CallbackQuery):
-        if callback.from_user.id not in ADMIN_IDS:
-            await callback.answer("Siz admin emassiz.")
+        if not changed:
+            await callback.answer(f"To'lov #{payment_id} allaqachon ko'rib chiqilgan ({payment['status']}).", show_alert=True)
             return
 
-        payment_id = int(callback.data.replace("reject_", ""))
-        set_payment_status(payment_id, "rejected", callback.from_user.id)
-
         # Foydalanuvchiga xabar
-        conn = sqlite3.connect("users.db")
-        cur = conn.cursor()
-        cur.execute("SELECT u.tg_id FROM payments p JOIN users u ON p.user_id = u.id WHERE p.id = ?", (payment_id,))
-        tg_id = cur.fetchone()[0]
-        conn.close()
-
-        await bot.send_message(tg_id, "❌ To'lov rad etildi. Iltimos, qayta urinib ko'ring.")
-        await callback.message.edit_reply_markup(reply_markup=None)
-        await callback.answer("Rad etildi.")
\ No newline at end of file
+        if payment['tg_id']:
+            outbox.submit(payment['tg_id'], "send_message", text=t(payment['lang'], f"payment_{status}"))
+        await callback.answer("Tasdiqlandi." if status == "approved" else "Rad etildi.")
+        logger.info(f"Admin {callback.from_user.id} set payment {payment_id} to {status}.")
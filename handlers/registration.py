@@ -1,10 +1,9 @@
 # registration.py
-import json
 import logging
 import re
-import bleach
 from datetime import datetime
-from aiogram import Bot, F
+from functools import lru_cache
+from aiogram import F
 from aiogram.filters import Command
 from aiogram.types import (
     Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton,
@@ -12,20 +11,21 @@ from aiogram.types import (
 )
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
-from database import save_user, get_user_by_tg, update_user_field, list_courses
-from config import BOT_TOKEN  # config.py dan BOT_TOKEN import qilindi
+from async_db import (
+    save_user, get_user_by_tg_id, get_user_by_internal_id, update_user_field_by_tg_id,
+    update_user_field_by_internal_id, get_course_name, list_available_courses, reserve_course,
+    list_full_courses, join_waitlist
+)
+from config import SEAT_HOLD_MINUTES
+from i18n import i18n, t, gender_label, paid_label
+from database import SeatUnavailableError
+from outbox import outbox
+from seats import seat_sweeper
 from aiogram import types
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-# Initialize bot
-bot = Bot(token=BOT_TOKEN)
-
-# Load translations
-with open("translations.json", "r", encoding="utf-8") as f:
-    TRANSLATIONS = json.load(f)
-
 # Group IDs
 REG_GROUP_ID = -1002905557734  # Foydalanuvchi ma'lumotlari uchun guruh
 PAY_GROUP_ID = -1002397524134  # To'lovlar uchun guruh (payment.py da ishlatiladi)
@@ -56,122 +56,209 @@ def create_inline_keyboard(buttons: list, row_width: int = 2) -> InlineKeyboardM
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+# Statik klaviaturalar har bir til uchun bir marta quriladi
+@lru_cache(maxsize=None)
+def language_keyboard() -> InlineKeyboardMarkup:
+    return create_inline_keyboard([
+        ("🇺🇿 O‘zbek", "lang_uz"),
+        ("🇷🇺 Кирилча", "lang_ru"),
+        (t(i18n.default, "cancel"), "cancel")
+    ])
+
+@lru_cache(maxsize=None)
+def cancel_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return create_inline_keyboard([(t(lang, "cancel"), "cancel")])
+
+@lru_cache(maxsize=None)
+def yes_no_keyboard(lang: str, prefix: str) -> InlineKeyboardMarkup:
+    return create_inline_keyboard([
+        (t(lang, "yes"), f"{prefix}_yes"),
+        (t(lang, "no"), f"{prefix}_no"),
+        (t(lang, "cancel"), "cancel")
+    ])
+
+@lru_cache(maxsize=None)
+def gender_keyboard(lang: str) -> InlineKeyboardMarkup:
+    return create_inline_keyboard([
+        (t(lang, "gender_male"), "gender_erkak"),
+        (t(lang, "gender_female"), "gender_ayol"),
+        (t(lang, "cancel"), "cancel")
+    ])
+
+@lru_cache(maxsize=None)
+def phone_keyboard(lang: str) -> ReplyKeyboardMarkup:
+    return ReplyKeyboardMarkup(
+        keyboard=[[KeyboardButton(text=t(lang, "share_phone"), request_contact=True)]],
+        resize_keyboard=True
+    )
+
+@lru_cache(maxsize=None)
+def edit_fields_keyboard(lang: str) -> InlineKeyboardMarkup:
+    fields = (
+        "first_name", "last_name", "birth_date", "gender", "phone",
+        "address", "passport_front", "passport_back", "course"
+    )
+    buttons = [(t(lang, field), f"edit_{field}") for field in fields]
+    buttons.append((t(lang, "cancel"), "cancel"))
+    return create_inline_keyboard(buttons)
+
+def profile_keyboard(lang: str, course_id, is_paid, course_name: str, extra: list = ()) -> InlineKeyboardMarkup:
+    """Profile actions: `extra` buttons, then choose course / pay now as the state allows, then cancel."""
+    buttons = list(extra)
+    if not course_id or not is_paid:
+        buttons.append((t(lang, "choose_course"), "choose_course"))
+    if course_id and not is_paid:
+        buttons.append((f"{t(lang, 'pay_now')} ({course_name})", f"pay_now:{course_id}"))
+    buttons.append((t(lang, "cancel"), "cancel"))
+    return create_inline_keyboard(buttons)
+
+def render_course_list(courses: list, lang: str) -> tuple:
+    """Course selection text and keyboard."""
+    parts = [t(lang, "choose_course") + "\n\n"]
+    buttons = []
+    for course in courses:
+        available = course['limit_count'] - course['joylar_soni'] - (course['held'] or 0)
+        parts.append(
+            f"📚 *{course['name']}*\n"
+            f"{t(lang, 'course_description')}: {course['description']}\n"
+            f"{t(lang, 'course_gender')}: {gender_label(lang, course['gender'])}\n"
+            f"{t(lang, 'start_date')}: {course['boshlanish_sanasi']}\n"
+            f"{t(lang, 'seats_available')}: {available}/{course['limit_count']}\n"
+            f"{t(lang, 'price')}: {course['narx']} UZS\n\n"
+        )
+        buttons.append((course['name'], f"course_{course['id']}"))
+    buttons.append((t(lang, "cancel"), "cancel"))
+    return "".join(parts), create_inline_keyboard(buttons, row_width=1)
+
+def waitlist_keyboard(courses: list, lang: str) -> InlineKeyboardMarkup:
+    """`wait_{course_id}` buttons for full courses."""
+    buttons = [
+        (t(lang, "waitlist_button", course=course["name"]), f"wait_{course['id']}")
+        for course in courses
+    ]
+    buttons.append((t(lang, "cancel"), "cancel"))
+    return create_inline_keyboard(buttons, row_width=1)
+
+async def notify_waitlist_promoted(promoted: list) -> None:
+    """Tell promoted waitlist users that a seat is held for them and refresh their group post."""
+    for entry in promoted:
+        lang = i18n.lang(entry["lang"])
+        course_name = await get_course_name(entry["course_id"], str(entry["course_id"]))
+        kb = create_inline_keyboard([
+            (f"{t(lang, 'pay_now')} ({course_name})", f"pay_now:{entry['course_id']}")
+        ])
+        outbox.submit(
+            entry["tg_id"], "send_message",
+            text=t(lang, "waitlist_promoted", course=course_name, minutes=SEAT_HOLD_MINUTES),
+            reply_markup=kb
+        )
+        user = await get_user_by_internal_id(entry["user_id"])
+        if user:
+            send_or_edit_reg_to_group(user, course_name, user["registration_message_id"])
+
+@lru_cache(maxsize=None)
+def _html_cleaner():
+    # bleach (html5lib bilan) birinchi kiritishda yuklanadi, bot ishga tushishini sekinlashtirmaydi
+    from bleach.sanitizer import Cleaner
+    return Cleaner(tags=[], strip=True)
+
 def sanitize_input(text: str) -> str:
     """Sanitize user input to prevent malicious data."""
-    return bleach.clean(text, tags=[], strip=True).strip()
+    return _html_cleaner().clean(text).strip()
 
-async def send_or_edit_reg_to_group(user: dict, course_name: str, edit_message_id: int = None):
-    """Send or edit user registration data to the group with photos."""
+def send_or_edit_reg_to_group(user: dict, course_name: str, edit_message_id: int = None) -> None:
+    """Queue sending/editing the user's registration post in the group.
 
-    lang = user.get("lang", "uz")
+    Runs in the background through the outbox; when a new post is created its
+    message id is saved to `users.registration_message_id`.
+    """
+
+    lang = i18n.lang(user.get("lang"))
 
     text = (
         f"📋 *Foydalanuvchi ma'lumotlari:*\n"
         f"**Ism:** {user.get('first_name','')}\n"
         f"**Familiya:** {user.get('last_name','')}\n"
         f"**Tug'ilgan sana:** {user.get('birth_date','')}\n"
-        f"**Jins:** {TRANSLATIONS[lang]['gender_male'] if user.get('gender') == 'erkak' else TRANSLATIONS[lang]['gender_female']}\n"
+        f"**Jins:** {gender_label(lang, user.get('gender'))}\n"
         f"**Telefon:** {user.get('phone','')}\n"
         f"**Manzil:** {user.get('address','')}\n"
         f"**Kurs:** {course_name}\n"
         f"**TG ID:** {user.get('tg_id','')}\n"
         f"**Registratsiya vaqti:** {user.get('registered_at','')}\n"
-        f"**To'lov holati:** {TRANSLATIONS[lang]['paid'] if user.get('is_paid') else TRANSLATIONS[lang]['not_paid']}"
+        f"**To'lov holati:** {paid_label(lang, user.get('is_paid'))}"
     )
 
-    try:
-        passport_front = user.get("passport_front")
-        passport_back = user.get("passport_back")
-
-        # Agar rasm bo'lsa
-        if passport_front or passport_back:
-            media = []
-            if passport_front:
-                media.append(types.InputMediaPhoto(media=passport_front, caption=text, parse_mode="Markdown"))
-            if passport_back:
-                # caption faqat birinchi rasmga qo'yiladi
-                media.append(types.InputMediaPhoto(media=passport_back))
-
-            # Edit qilinmaydi, faqat yangi yuboriladi
-            msgs = await bot.send_media_group(chat_id=REG_GROUP_ID, media=media)
-            logger.info(f"Sent media group for user {user.get('tg_id')}")
-            return msgs[0].message_id  # birinchi xabar ID qaytariladi
-
-        else:
-            # faqat matn yuboriladi
-            if edit_message_id:
-                await bot.edit_message_text(
-                    text=text,
-                    chat_id=REG_GROUP_ID,
-                    message_id=edit_message_id,
-                    parse_mode="Markdown"
-                )
-                logger.info(f"Updated group message {edit_message_id} for user {user.get('tg_id')}")
-            else:
-                message = await bot.send_message(
-                    chat_id=REG_GROUP_ID,
-                    text=text,
-                    parse_mode="Markdown"
-                )
-                logger.info(f"Sent new group message for user {user.get('tg_id')}")
-                return message.message_id
-
-    except Exception as e:
-        logger.error(f"Error sending/editing message to group for user {user.get('tg_id')}: {str(e)}")
-        raise
+    tg_id = user.get("tg_id")
+
+    async def save_message_id(result):
+        # send_media_group ro'yxat qaytaradi: birinchi xabar ID si saqlanadi
+        message = result[0] if isinstance(result, list) else result
+        await update_user_field_by_tg_id(tg_id, "registration_message_id", message.message_id)
+        logger.info(f"Sent group post {message.message_id} for user {tg_id}")
+
+    passport_front = user.get("passport_front")
+    passport_back = user.get("passport_back")
+
+    # Agar rasm bo'lsa
+    if passport_front or passport_back:
+        media = []
+        if passport_front:
+            media.append(types.InputMediaPhoto(media=passport_front, caption=text, parse_mode="Markdown"))
+        if passport_back:
+            # caption faqat birinchi rasmga qo'yiladi
+            media.append(types.InputMediaPhoto(media=passport_back))
+
+        # Edit qilinmaydi, faqat yangi yuboriladi
+        outbox.submit(REG_GROUP_ID, "send_media_group", on_success=save_message_id, media=media)
+    elif edit_message_id:
+        # faqat matn yuboriladi
+        outbox.submit(
+            REG_GROUP_ID, "edit_message_text",
+            text=text, message_id=edit_message_id, parse_mode="Markdown"
+        )
+        logger.info(f"Queued group message {edit_message_id} update for user {tg_id}")
+    else:
+        outbox.submit(REG_GROUP_ID, "send_message", on_success=save_message_id, text=text, parse_mode="Markdown")
 
 def register_handlers(dp):
+    seat_sweeper.on_promoted = notify_waitlist_promoted
+
     @dp.message(Command("start"))
     async def start_registration(message: Message, state: FSMContext):
-        user = get_user_by_tg(message.from_user.id)
+        user = await get_user_by_tg_id(message.from_user.id)
         if user:
             course_id = user['course_id']
             is_paid = user['is_paid']
-            lang = user['lang'] if user['lang'] else "uz"
-            course_display = next((c['name'] for c in list_courses() if c['id'] == course_id), "Kurs tanlanmagan")
-            buttons = [
-                (TRANSLATIONS[lang]["view_profile"], "view_profile"),
-                (TRANSLATIONS[lang]["edit_profile"], "edit_profile")
-            ]
-            if not course_id or not is_paid:
-                buttons.append((TRANSLATIONS[lang]["choose_course"], "choose_course"))
-            if course_id and not is_paid:
-                buttons.append((f"{TRANSLATIONS[lang]['pay_now']} ({course_display})", f"pay_now:{course_id}"))
-            buttons.append((TRANSLATIONS[lang]["cancel"], "cancel"))
-            kb = create_inline_keyboard(buttons)
+            lang = i18n.lang(user['lang'])
+            course_display = await get_course_name(course_id, "Kurs tanlanmagan")
+            kb = profile_keyboard(lang, course_id, is_paid, course_display, extra=(
+                (t(lang, "view_profile"), "view_profile"),
+                (t(lang, "edit_profile"), "edit_profile")
+            ))
             await message.answer(
-                TRANSLATIONS[lang]["profile_summary"].format(
+                t(lang, "profile_summary", 
                     first_name=user['first_name'],
                     last_name=user['last_name'],
                     course=course_display,
-                    payment_status=TRANSLATIONS[lang]["paid"] if is_paid else TRANSLATIONS[lang]["not_paid"]
+                    payment_status=paid_label(lang, is_paid)
                 ),
                 reply_markup=kb, parse_mode="Markdown"
             )
             logger.info(f"User {message.from_user.id} accessed profile.")
             return
 
-        buttons = [
-            ("🇺🇿 O‘zbek", "lang_uz"),
-            ("🇷🇺 Кирилча", "lang_ru"),
-            (TRANSLATIONS["uz"]["cancel"], "cancel")
-        ]
-        kb = create_inline_keyboard(buttons)
-        await message.answer(TRANSLATIONS["uz"]["choose_language"], reply_markup=kb)
+        kb = language_keyboard()
+        await message.answer(t("uz", "choose_language"), reply_markup=kb)
         await state.set_state(Registration.lang)
         logger.info(f"User {message.from_user.id} started registration.")
 
     @dp.callback_query(Registration.lang, F.data.startswith("lang_"))
     async def set_language(callback: CallbackQuery, state: FSMContext):
-        lang = callback.data.replace("lang_", "")
+        lang = i18n.lang(callback.data.replace("lang_", ""))
         await state.update_data(lang=lang)
-        buttons = [
-            (TRANSLATIONS[lang]["yes"], "reg_yes"),
-            (TRANSLATIONS[lang]["no"], "reg_no"),
-            (TRANSLATIONS[lang]["cancel"], "cancel")
-        ]
-        kb = create_inline_keyboard(buttons)
-        await callback.message.answer(TRANSLATIONS[lang]["register_prompt"], reply_markup=kb)
+        kb = yes_no_keyboard(lang, "reg")
+        await callback.message.answer(t(lang, "register_prompt"), reply_markup=kb)
         await state.set_state(Registration.confirm)
         await callback.answer()
         logger.info(f"User {callback.from_user.id} selected language: {lang}")
@@ -179,18 +266,17 @@ def register_handlers(dp):
     @dp.callback_query(Registration.confirm)
     async def confirm_registration(callback: CallbackQuery, state: FSMContext):
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         if callback.data == "reg_no":
-            await callback.message.answer(TRANSLATIONS[lang]["registration_canceled"])
+            await callback.message.answer(t(lang, "registration_canceled"))
             await state.clear()
             await callback.answer()
             logger.info(f"User {callback.from_user.id} canceled registration.")
             return
         elif callback.data == "reg_yes":
-            buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-            kb = create_inline_keyboard(buttons)
-            await callback.message.answer(TRANSLATIONS[lang]["enter_first_name"], reply_markup=kb)
+            kb = cancel_keyboard(lang)
+            await callback.message.answer(t(lang, "enter_first_name"), reply_markup=kb)
             await state.set_state(Registration.first_name)
             await callback.answer()
 
@@ -198,16 +284,15 @@ def register_handlers(dp):
     async def get_first_name(message: Message, state: FSMContext):
         first_name = sanitize_input(message.text)
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         if not first_name or len(first_name) < 2 or not first_name.isalpha():
-            await message.answer(TRANSLATIONS[lang]["invalid_first_name"])
+            await message.answer(t(lang, "invalid_first_name"))
             return
 
         await state.update_data(first_name=first_name)
-        buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-        kb = create_inline_keyboard(buttons)
-        await message.answer(TRANSLATIONS[lang]["enter_last_name"], reply_markup=kb)
+        kb = cancel_keyboard(lang)
+        await message.answer(t(lang, "enter_last_name"), reply_markup=kb)
         await state.set_state(Registration.last_name)
         logger.info(f"User {message.from_user.id} entered first name: {first_name}")
 
@@ -215,23 +300,22 @@ def register_handlers(dp):
     async def get_last_name(message: Message, state: FSMContext):
         last_name = sanitize_input(message.text)
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         if not last_name or len(last_name) < 2 or not last_name.isalpha():
-            await message.answer(TRANSLATIONS[lang]["invalid_last_name"])
+            await message.answer(t(lang, "invalid_last_name"))
             return
 
         await state.update_data(last_name=last_name)
-        buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-        kb = create_inline_keyboard(buttons)
-        await message.answer(TRANSLATIONS[lang]["enter_birth_date"], reply_markup=kb)
+        kb = cancel_keyboard(lang)
+        await message.answer(t(lang, "enter_birth_date"), reply_markup=kb)
         await state.set_state(Registration.birth_date)
         logger.info(f"User {message.from_user.id} entered last name: {last_name}")
     @dp.message(Registration.birth_date)
     async def get_birth_date(message: Message, state: FSMContext):
         birth_date_text = message.text.strip()
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         try:
             # YYYY.MM.DD formatini tekshirish
@@ -250,16 +334,11 @@ def register_handlers(dp):
             await state.update_data(birth_date=birth_date_text)
 
         except ValueError:
-            await message.answer(TRANSLATIONS[lang]["invalid_birth_date"] + " (Masalan: 2005.07.18)")
+            await message.answer(t(lang, "invalid_birth_date") + " (Masalan: 2005.07.18)")
             return
 
-        buttons = [
-            (TRANSLATIONS[lang]["gender_male"], "gender_erkak"),
-            (TRANSLATIONS[lang]["gender_female"], "gender_ayol"),
-            (TRANSLATIONS[lang]["cancel"], "cancel")
-        ]
-        kb = create_inline_keyboard(buttons)
-        await message.answer(TRANSLATIONS[lang]["choose_gender"], reply_markup=kb)
+        kb = gender_keyboard(lang)
+        await message.answer(t(lang, "choose_gender"), reply_markup=kb)
         await state.set_state(Registration.gender)
 
         logger.info(f"User {message.from_user.id} entered birth date: {birth_date_text}")
@@ -269,22 +348,11 @@ def register_handlers(dp):
         gender = callback.data.replace("gender_", "")
         await state.update_data(gender=gender)
         data = await state.get_data()
-        lang = data.get("lang", "uz")
-
-        phone_kb = ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(
-                text=TRANSLATIONS[lang]["share_phone"],
-                request_contact=True
-            )]],
-            resize_keyboard=True
-        )
-        buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-        inline_kb = create_inline_keyboard(buttons)
-        await callback.message.answer(
-            TRANSLATIONS[lang]["enter_phone"],
-            reply_markup=phone_kb
-        )
-        await callback.message.answer(TRANSLATIONS[lang]["or_type_phone"], reply_markup=inline_kb)
+        lang = i18n.lang(data.get("lang"))
+
+        inline_kb = cancel_keyboard(lang)
+        await callback.message.answer(t(lang, "enter_phone"), reply_markup=phone_keyboard(lang))
+        await callback.message.answer(t(lang, "or_type_phone"), reply_markup=inline_kb)
         await state.set_state(Registration.phone)
         await callback.answer()
         logger.info(f"User {callback.from_user.id} selected gender: {gender}")
@@ -302,17 +370,16 @@ def register_handlers(dp):
             phone_number = f"+998{phone_number[1:]}"
         
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         phone_pattern = r"^\+998\d{9}$"
         if not re.match(phone_pattern, phone_number):
-            await message.answer(TRANSLATIONS[lang]["invalid_phone"])
+            await message.answer(t(lang, "invalid_phone"))
             return
 
         await state.update_data(phone=phone_number)
-        buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-        kb = create_inline_keyboard(buttons)
-        await message.answer(TRANSLATIONS[lang]["enter_address"], reply_markup=kb)
+        kb = cancel_keyboard(lang)
+        await message.answer(t(lang, "enter_address"), reply_markup=kb)
         await state.set_state(Registration.address)
         logger.info(f"User {message.from_user.id} entered phone: {phone_number}")
 
@@ -320,16 +387,15 @@ def register_handlers(dp):
     async def get_address(message: Message, state: FSMContext):
         address = sanitize_input(message.text)
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         if not address or len(address) < 5:
-            await message.answer(TRANSLATIONS[lang]["invalid_address"])
+            await message.answer(t(lang, "invalid_address"))
             return
 
         await state.update_data(address=address)
-        buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-        kb = create_inline_keyboard(buttons)
-        await message.answer(TRANSLATIONS[lang]["upload_passport_front"], reply_markup=kb)
+        kb = cancel_keyboard(lang)
+        await message.answer(t(lang, "upload_passport_front"), reply_markup=kb)
         await state.set_state(Registration.passport_front)
         logger.info(f"User {message.from_user.id} entered address: {address}")
 
@@ -339,10 +405,9 @@ def register_handlers(dp):
         file_id = photo.file_id
         await state.update_data(passport_front=file_id)
         data = await state.get_data()
-        lang = data.get("lang", "uz")
-        buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-        kb = create_inline_keyboard(buttons)
-        await message.answer(TRANSLATIONS[lang]["upload_passport_back"], reply_markup=kb)
+        lang = i18n.lang(data.get("lang"))
+        kb = cancel_keyboard(lang)
+        await message.answer(t(lang, "upload_passport_back"), reply_markup=kb)
         await state.set_state(Registration.passport_back)
         logger.info(f"User {message.from_user.id} uploaded passport front: {file_id}")
 
@@ -352,25 +417,20 @@ def register_handlers(dp):
         file_id = photo.file_id
         await state.update_data(passport_back=file_id)
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
-        confirm_text = TRANSLATIONS[lang]["confirm_data"].format(
+        confirm_text = t(lang, "confirm_data", 
             first_name=data["first_name"],
             last_name=data["last_name"],
             birth_date=data["birth_date"],
-            gender=TRANSLATIONS[lang]["gender_male"] if data["gender"] == "erkak" else TRANSLATIONS[lang]["gender_female"],
+            gender=gender_label(lang, data["gender"]),
             phone=data["phone"],
             address=data["address"],
             course=""
         )
-        buttons = [
-            (TRANSLATIONS[lang]["yes"], "data_yes"),
-            (TRANSLATIONS[lang]["no"], "data_no"),
-            (TRANSLATIONS[lang]["cancel"], "cancel")
-        ]
-        kb = create_inline_keyboard(buttons)
+        kb = yes_no_keyboard(lang, "data")
         await message.answer(
-            f"{confirm_text}\n\n{TRANSLATIONS[lang]['confirm_prompt']}",
+            f"{confirm_text}\n\n{t(lang, 'confirm_prompt')}",
             reply_markup=kb,
             parse_mode="Markdown"
         )
@@ -381,16 +441,11 @@ def register_handlers(dp):
     async def confirm_data(callback: CallbackQuery, state: FSMContext):
         choice = callback.data.replace("data_", "")
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         if choice == "no":
-            buttons = [
-                ("🇺🇿 O‘zbek", "lang_uz"),
-                ("🇷🇺 Русский", "lang_ru"),
-                (TRANSLATIONS[lang]["cancel"], "cancel")
-            ]
-            kb = create_inline_keyboard(buttons)
-            await callback.message.answer(TRANSLATIONS[lang]["restart_registration"], reply_markup=kb)
+            kb = language_keyboard()
+            await callback.message.answer(t(lang, "restart_registration"), reply_markup=kb)
             await state.set_state(Registration.lang)
             await callback.answer()
             logger.info(f"User {callback.from_user.id} chose to restart registration.")
@@ -414,49 +469,36 @@ def register_handlers(dp):
                 "paid_at": None,
                 "registration_message_id": None
             }
-            save_user(user_data)
-            user = get_user_by_tg(callback.from_user.id)
+            await save_user(user_data)
+            user = await get_user_by_tg_id(callback.from_user.id)
             course_name = "Kurs tanlanmagan"
-            message_id = await send_or_edit_reg_to_group(user, course_name)
-            update_user_field(callback.from_user.id, "registration_message_id", message_id)
-            logger.info(f"User {callback.from_user.id} saved to database and sent to group.")
+            send_or_edit_reg_to_group(user, course_name)
+            logger.info(f"User {callback.from_user.id} saved to database and queued for group.")
         except Exception as e:
             await callback.message.answer(
-                TRANSLATIONS[lang]["error"].format(error=str(e))
+                t(lang, "error", error=str(e))
             )
             await callback.answer(show_alert=True)
             logger.error(f"Error saving user {callback.from_user.id}: {str(e)}")
             return
 
         user_gender = data.get("gender", "hammasi")
-        courses = [
-            course for course in list_courses()
-            if (course['gender'] == "hammasi" or course['gender'] == user_gender)
-            and course['joylar_soni'] < course['limit_count']
-        ]
+        courses = await list_available_courses(user_gender)
         if not courses:
-            await callback.message.answer(TRANSLATIONS[lang]["no_courses_available"] + "\nKeyinroq /start bilan qayting va kurs tanlang.")
+            full_courses = await list_full_courses(user_gender)
+            if full_courses:
+                await callback.message.answer(
+                    t(lang, "no_courses_available") + "\n\n" + t(lang, "waitlist_offer"),
+                    reply_markup=waitlist_keyboard(full_courses, lang)
+                )
+            else:
+                await callback.message.answer(t(lang, "no_courses_available") + "\nKeyinroq /start bilan qayting va kurs tanlang.")
             await state.clear()
             await callback.answer()
             logger.info(f"No courses available for user {callback.from_user.id} with gender {user_gender}.")
             return
 
-        course_text = TRANSLATIONS[lang]["choose_course"] + "\n\n"
-        buttons = []
-        for course in courses:
-            available = course['limit_count'] - course['joylar_soni']
-            course_text += (
-                f"📚 *{course['name']}*\n"
-                f"{TRANSLATIONS[lang]['course_description']}: {course['description']}\n"
-                f"{TRANSLATIONS[lang]['course_gender']}: {TRANSLATIONS[lang]['gender_all'] if course['gender'] == 'hammasi' else TRANSLATIONS[lang]['gender_male'] if course['gender'] == 'erkak' else TRANSLATIONS[lang]['gender_female']}\n"
-                f"{TRANSLATIONS[lang]['start_date']}: {course['boshlanish_sanasi']}\n"
-                f"{TRANSLATIONS[lang]['seats_available']}: {available}/{course['limit_count']}\n"
-                f"{TRANSLATIONS[lang]['price']}: {course['narx']} UZS\n\n"
-            )
-            buttons.append((course['name'], f"course_{course['id']}"))
-
-        buttons.append((TRANSLATIONS[lang]["cancel"], "cancel"))
-        kb = create_inline_keyboard(buttons, row_width=1)
+        course_text, kb = render_course_list(courses, lang)
         await callback.message.answer(course_text, reply_markup=kb, parse_mode="Markdown")
         await state.set_state(Registration.quran_course)
         await callback.answer()
@@ -464,41 +506,29 @@ def register_handlers(dp):
 
     @dp.callback_query(F.data == "choose_course")
     async def choose_course_prompt(callback: CallbackQuery, state: FSMContext):
-        user = get_user_by_tg(callback.from_user.id)
+        user = await get_user_by_tg_id(callback.from_user.id)
         if not user:
-            await callback.message.answer(TRANSLATIONS["uz"]["user_not_found"])
+            await callback.message.answer(t("uz", "user_not_found"))
             await callback.answer()
             return
 
-        lang = user['lang'] if user['lang'] else "uz"
+        lang = i18n.lang(user['lang'])
         user_gender = user['gender']
-        courses = [
-            course for course in list_courses()
-            if (course['gender'] == "hammasi" or course['gender'] == user_gender)
-            and course['joylar_soni'] < course['limit_count']
-        ]
+        courses = await list_available_courses(user_gender)
         if not courses:
-            await callback.message.answer(TRANSLATIONS[lang]["no_courses_available"])
+            full_courses = await list_full_courses(user_gender)
+            if full_courses:
+                await callback.message.answer(
+                    t(lang, "no_courses_available") + "\n\n" + t(lang, "waitlist_offer"),
+                    reply_markup=waitlist_keyboard(full_courses, lang)
+                )
+            else:
+                await callback.message.answer(t(lang, "no_courses_available"))
             await callback.answer()
             logger.info(f"No courses available for user {callback.from_user.id} with gender {user_gender}.")
             return
 
-        course_text = TRANSLATIONS[lang]["choose_course"] + "\n\n"
-        buttons = []
-        for course in courses:
-            available = course['limit_count'] - course['joylar_soni']
-            course_text += (
-                f"📚 *{course['name']}*\n"
-                f"{TRANSLATIONS[lang]['course_description']}: {course['description']}\n"
-                f"{TRANSLATIONS[lang]['course_gender']}: {TRANSLATIONS[lang]['gender_all'] if course['gender'] == 'hammasi' else TRANSLATIONS[lang]['gender_male'] if course['gender'] == 'erkak' else TRANSLATIONS[lang]['gender_female']}\n"
-                f"{TRANSLATIONS[lang]['start_date']}: {course['boshlanish_sanasi']}\n"
-                f"{TRANSLATIONS[lang]['seats_available']}: {course['limit_count']-available}/{course['limit_count']}\n"
-                f"{TRANSLATIONS[lang]['price']}: {course['narx']} UZS\n\n"
-            )
-            buttons.append((course['name'], f"course_{course['id']}"))
-
-        buttons.append((TRANSLATIONS[lang]["cancel"], "cancel"))
-        kb = create_inline_keyboard(buttons, row_width=1)
+        course_text, kb = render_course_list(courses, lang)
         await callback.message.answer(course_text, reply_markup=kb, parse_mode="Markdown")
         await state.set_state(Registration.quran_course)
         await callback.answer()
@@ -507,26 +537,37 @@ def register_handlers(dp):
     @dp.callback_query(Registration.quran_course, F.data.startswith("course_"))
     async def choose_course(callback: CallbackQuery, state: FSMContext):
         course_id = int(callback.data.replace("course_", ""))
-        user = get_user_by_tg(callback.from_user.id)
+        user = await get_user_by_tg_id(callback.from_user.id)
         if not user:
-            await callback.message.answer(TRANSLATIONS["uz"]["user_not_found"])
+            await callback.message.answer(t("uz", "user_not_found"))
             await callback.answer()
             return
 
-        lang = user['lang'] if user['lang'] else "uz"
+        lang = i18n.lang(user['lang'])
         try:
-            update_user_field(callback.from_user.id, "course_id", course_id)
-            course_name = next((c['name'] for c in list_courses() if c['id'] == course_id), str(course_id))
-            user = get_user_by_tg(callback.from_user.id)
+            try:
+                await reserve_course(user['id'], course_id)
+            except SeatUnavailableError:
+                course_name = await get_course_name(course_id, str(course_id))
+                await callback.message.answer(
+                    t(lang, "course_full"),
+                    reply_markup=waitlist_keyboard([{"id": course_id, "name": course_name}], lang)
+                )
+                await callback.answer()
+                logger.info(f"User {callback.from_user.id} tried full course {course_id}.")
+                return
+            course_name = await get_course_name(course_id, str(course_id))
+            user = await get_user_by_tg_id(callback.from_user.id)
             reg_message_id = user['registration_message_id']
-            await send_or_edit_reg_to_group(user, course_name, reg_message_id)
+            send_or_edit_reg_to_group(user, course_name, reg_message_id)
             buttons = [
-                (f"{TRANSLATIONS[lang]['pay_now']} ({course_name})", f"pay_now:{course_id}"),
-                (TRANSLATIONS[lang]["cancel"], "cancel")
+                (f"{t(lang, 'pay_now')} ({course_name})", f"pay_now:{course_id}"),
+                (t(lang, "cancel"), "cancel")
             ]
             kb = create_inline_keyboard(buttons)
             await callback.message.answer(
-                TRANSLATIONS[lang]["course_selected"].format(course=course_name),
+                t(lang, "course_selected", course=course_name) + "\n\n"
+                + t(lang, "seat_held", minutes=SEAT_HOLD_MINUTES),
                 reply_markup=kb,
                 parse_mode="Markdown"
             )
@@ -535,71 +576,80 @@ def register_handlers(dp):
             logger.info(f"User {callback.from_user.id} selected course: {course_id} and updated group post.")
         except Exception as e:
             await callback.message.answer(
-                TRANSLATIONS[lang]["error"].format(error=str(e))
+                t(lang, "error", error=str(e))
             )
             await callback.answer(show_alert=True)
             logger.error(f"Error updating course for user {callback.from_user.id}: {str(e)}")
 
+    @dp.callback_query(F.data.startswith("wait_"))
+    async def join_course_waitlist(callback: CallbackQuery, state: FSMContext):
+        course_id = int(callback.data.replace("wait_", ""))
+        user = await get_user_by_tg_id(callback.from_user.id)
+        if not user:
+            await callback.message.answer(t("uz", "user_not_found"))
+            await callback.answer()
+            return
+
+        lang = i18n.lang(user['lang'])
+        try:
+            position = await join_waitlist(user['id'], course_id)
+            course_name = await get_course_name(course_id, str(course_id))
+            await callback.message.edit_reply_markup(reply_markup=None)
+            await callback.message.answer(
+                t(lang, "waitlist_joined", course=course_name, position=position)
+            )
+            await state.clear()
+            await callback.answer()
+            # Joy allaqachon bo'shagan bo'lsa, darhol beriladi
+            seat_sweeper.wake()
+            logger.info(f"User {callback.from_user.id} joined waitlist for course {course_id} at {position}.")
+        except Exception as e:
+            await callback.message.answer(
+                t(lang, "error", error=str(e))
+            )
+            await callback.answer(show_alert=True)
+            logger.error(f"Error joining waitlist for user {callback.from_user.id}: {str(e)}")
+
     @dp.callback_query(F.data == "view_profile")
     async def view_profile(callback: CallbackQuery):
-        user = get_user_by_tg(callback.from_user.id)
+        user = await get_user_by_tg_id(callback.from_user.id)
         if not user:
-            await callback.message.answer(TRANSLATIONS["uz"]["user_not_found"])
+            await callback.message.answer(t("uz", "user_not_found"))
             await callback.answer()
             return
 
         course_id = user['course_id']
         is_paid = user['is_paid']
-        lang = user['lang'] if user['lang'] else "uz"
-        course_name = next((c['name'] for c in list_courses() if c['id'] == course_id), TRANSLATIONS[lang]["no_course"])
+        lang = i18n.lang(user['lang'])
+        course_name = await get_course_name(course_id, t(lang, "no_course"))
         text = (
-            f"📋 *{TRANSLATIONS[lang]['profile_info']}:*\n"
-            f"**{TRANSLATIONS[lang]['first_name']}:** {user['first_name']}\n"
-            f"**{TRANSLATIONS[lang]['last_name']}:** {user['last_name']}\n"
-            f"**{TRANSLATIONS[lang]['birth_date']}:** {user['birth_date']}\n"
-            f"**{TRANSLATIONS[lang]['gender']}:** {TRANSLATIONS[lang]['gender_male'] if user['gender'] == 'erkak' else TRANSLATIONS[lang]['gender_female']}\n"
-            f"**{TRANSLATIONS[lang]['phone']}:** {user['phone']}\n"
-            f"**{TRANSLATIONS[lang]['address']}:** {user['address']}\n"
-            f"**{TRANSLATIONS[lang]['course']}:** {course_name}\n"
-            f"**{TRANSLATIONS[lang]['payment_status']}:** {TRANSLATIONS[lang]['paid'] if is_paid else TRANSLATIONS[lang]['not_paid']}"
+            f"📋 *{t(lang, 'profile_info')}:*\n"
+            f"**{t(lang, 'first_name')}:** {user['first_name']}\n"
+            f"**{t(lang, 'last_name')}:** {user['last_name']}\n"
+            f"**{t(lang, 'birth_date')}:** {user['birth_date']}\n"
+            f"**{t(lang, 'gender')}:** {gender_label(lang, user['gender'])}\n"
+            f"**{t(lang, 'phone')}:** {user['phone']}\n"
+            f"**{t(lang, 'address')}:** {user['address']}\n"
+            f"**{t(lang, 'course')}:** {course_name}\n"
+            f"**{t(lang, 'payment_status')}:** {paid_label(lang, is_paid)}"
         )
-        buttons = [
-            (TRANSLATIONS[lang]["edit_profile"], "edit_profile"),
-        ]
-        if not course_id or not is_paid:
-            buttons.append((TRANSLATIONS[lang]["choose_course"], "choose_course"))
-        if course_id and not is_paid:
-            buttons.append((f"{TRANSLATIONS[lang]['pay_now']} ({course_name})", f"pay_now:{course_id}"))
-        buttons.append((TRANSLATIONS[lang]["cancel"], "cancel"))
-        kb = create_inline_keyboard(buttons)
+        kb = profile_keyboard(lang, course_id, is_paid, course_name, extra=((t(lang, "edit_profile"), "edit_profile"),))
         await callback.message.answer(text, reply_markup=kb, parse_mode="Markdown")
         await callback.answer()
         logger.info(f"User {callback.from_user.id} viewed profile.")
 
     @dp.callback_query(F.data == "edit_profile")
     async def start_edit(callback: CallbackQuery, state: FSMContext):
-        user = get_user_by_tg(callback.from_user.id)
+        user = await get_user_by_tg_id(callback.from_user.id)
         if not user:
-            await callback.message.answer(TRANSLATIONS["uz"]["user_not_found"])
+            await callback.message.answer(t("uz", "user_not_found"))
             await callback.answer()
             return
 
-        lang = user['lang'] if user['lang'] else "uz"
+        lang = i18n.lang(user['lang'])
         await state.update_data(user_id=user['id'], lang=lang)
-        buttons = [
-            (TRANSLATIONS[lang]["first_name"], "edit_first_name"),
-            (TRANSLATIONS[lang]["last_name"], "edit_last_name"),
-            (TRANSLATIONS[lang]["birth_date"], "edit_birth_date"),
-            (TRANSLATIONS[lang]["gender"], "edit_gender"),
-            (TRANSLATIONS[lang]["phone"], "edit_phone"),
-            (TRANSLATIONS[lang]["address"], "edit_address"),
-            (TRANSLATIONS[lang]["passport_front"], "edit_passport_front"),
-            (TRANSLATIONS[lang]["passport_back"], "edit_passport_back"),
-            (TRANSLATIONS[lang]["course"], "edit_course"),
-            (TRANSLATIONS[lang]["cancel"], "cancel")
-        ]
-        kb = create_inline_keyboard(buttons)
-        await callback.message.answer(TRANSLATIONS[lang]["choose_field"], reply_markup=kb)
+        kb = edit_fields_keyboard(lang)
+        await callback.message.answer(t(lang, "choose_field"), reply_markup=kb)
         await state.set_state(EditProfile.field)
         await callback.answer()
         logger.info(f"User {callback.from_user.id} started editing profile.")
@@ -609,42 +659,37 @@ def register_handlers(dp):
         field = callback.data.replace("edit_", "")
         await state.update_data(field=field)
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
 
         if field == "gender":
-            buttons = [
-                (TRANSLATIONS[lang]["gender_male"], "gender_erkak"),
-                (TRANSLATIONS[lang]["gender_female"], "gender_ayol"),
-                (TRANSLATIONS[lang]["cancel"], "cancel")
-            ]
-            kb = create_inline_keyboard(buttons)
-            await callback.message.answer(TRANSLATIONS[lang]["choose_gender"], reply_markup=kb)
+            kb = gender_keyboard(lang)
+            await callback.message.answer(t(lang, "choose_gender"), reply_markup=kb)
             await state.set_state(EditProfile.new_value)
         elif field == "course":
-            user = get_user_by_tg(callback.from_user.id)
+            user = await get_user_by_tg_id(callback.from_user.id)
             user_gender = user['gender'] if user else "hammasi"
-            courses = [
-                course for course in list_courses()
-                if (course['gender'] == "hammasi" or course['gender'] == user_gender)
-                and course['joylar_soni'] < course['limit_count']
-            ]
-            buttons = [(course['name'], f"course_{course['id']}") for course in courses] + [(TRANSLATIONS[lang]["cancel"], "cancel")]
+            courses = await list_available_courses(user_gender)
+            if not courses:
+                await callback.message.answer(t(lang, "no_courses_available"))
+                await state.clear()
+                await callback.answer()
+                return
+            # Tanlangan kurs reserve_course orqali yoziladi (joy band qilish bilan birga)
+            buttons = [(course['name'], f"course_{course['id']}") for course in courses] + [(t(lang, "cancel"), "cancel")]
             kb = create_inline_keyboard(buttons, row_width=1)
-            await callback.message.answer(TRANSLATIONS[lang]["choose_course"], reply_markup=kb)
+            await callback.message.answer(t(lang, "choose_course"), reply_markup=kb)
             await state.set_state(EditProfile.new_value)
         elif field in ("passport_front", "passport_back"):
-            buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-            kb = create_inline_keyboard(buttons)
+            kb = cancel_keyboard(lang)
             await callback.message.answer(
-                TRANSLATIONS[lang].get(f"upload_{field}", TRANSLATIONS[lang]["upload_new_photo"]),
+                t(lang, f"upload_{field}" if i18n.has(f"upload_{field}") else "upload_new_photo"),
                 reply_markup=kb
             )
             await state.set_state(EditProfile.new_value)
         else:
-            buttons = [(TRANSLATIONS[lang]["cancel"], "cancel")]
-            kb = create_inline_keyboard(buttons)
+            kb = cancel_keyboard(lang)
             await callback.message.answer(
-                TRANSLATIONS[lang].get(f"enter_{field}", TRANSLATIONS[lang]["enter_new_value"]),
+                t(lang, f"enter_{field}" if i18n.has(f"enter_{field}") else "enter_new_value"),
                 reply_markup=kb
             )
             await state.set_state(EditProfile.new_value)
@@ -653,7 +698,7 @@ def register_handlers(dp):
     @dp.message(EditProfile.new_value)
     async def update_field(message: Message, state: FSMContext):
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
         field = data["field"]
         user_id = data["user_id"]
         if message.photo and field in ("passport_front", "passport_back"):
@@ -664,7 +709,7 @@ def register_handlers(dp):
         if field == "first_name" or field == "last_name":
             new_value = sanitize_input(new_value)
             if not new_value or len(new_value) < 2 or not new_value.isalpha():
-                await message.answer(TRANSLATIONS[lang][f"invalid_{field}"])
+                await message.answer(t(lang, f"invalid_{field}"))
                 return
         elif field == "birth_date":
             try:
@@ -672,81 +717,79 @@ def register_handlers(dp):
                 if birth_date > datetime.now():
                     raise ValueError("Future date")
             except ValueError:
-                await message.answer(TRANSLATIONS[lang]["invalid_birth_date"])
+                await message.answer(t(lang, "invalid_birth_date"))
                 return
         elif field == "phone":
             phone_pattern = r"^\+998\d{9}$"
             if not re.match(phone_pattern, new_value):
-                await message.answer(TRANSLATIONS[lang]["invalid_phone"])
+                await message.answer(t(lang, "invalid_phone"))
                 return
         elif field == "address":
             new_value = sanitize_input(new_value)
             if not new_value or len(new_value) < 5:
-                await message.answer(TRANSLATIONS[lang]["invalid_address"])
+                await message.answer(t(lang, "invalid_address"))
                 return
         elif field in ("gender", "course"):
-            await message.answer(TRANSLATIONS[lang]["use_buttons"])
+            await message.answer(t(lang, "use_buttons"))
             return
 
         try:
-            update_user_field(user_id, field, new_value)
-            user = get_user_by_tg(user_id)
+            await update_user_field_by_internal_id(user_id, field, new_value)
+            user = await get_user_by_internal_id(user_id)
             course_id = user['course_id']
             is_paid = user['is_paid']
-            course_name = next((c['name'] for c in list_courses() if c['id'] == course_id), TRANSLATIONS[lang]["no_course"])
+            course_name = await get_course_name(course_id, t(lang, "no_course"))
             reg_message_id = user['registration_message_id']
-            await send_or_edit_reg_to_group(user, course_name, reg_message_id)
-            buttons = [
-                (TRANSLATIONS[lang]["choose_course"], "choose_course") if not course_id or not is_paid else None,
-                (f"{TRANSLATIONS[lang]['pay_now']} ({course_name})", f"pay_now:{course_id}") if course_id and not is_paid else None,
-                (TRANSLATIONS[lang]["cancel"], "cancel")
-            ]
-            buttons = [b for b in buttons if b]
-            kb = create_inline_keyboard(buttons)
-            await message.answer(TRANSLATIONS[lang]["field_updated"], reply_markup=kb)
+            send_or_edit_reg_to_group(user, course_name, reg_message_id)
+            kb = profile_keyboard(lang, course_id, is_paid, course_name)
+            await message.answer(t(lang, "field_updated"), reply_markup=kb)
             await state.clear()
             logger.info(f"User {message.from_user.id} updated {field} to {new_value} and updated group post.")
         except Exception as e:
-            await message.answer(TRANSLATIONS[lang]["error"].format(error=str(e)))
+            await message.answer(t(lang, "error", error=str(e)))
             logger.error(f"Error updating {field} for user {message.from_user.id}: {str(e)}")
 
     @dp.callback_query(EditProfile.new_value, F.data.startswith(("gender_", "course_")))
     async def update_choice_field(callback: CallbackQuery, state: FSMContext):
         data = await state.get_data()
-        lang = data.get("lang", "uz")
+        lang = i18n.lang(data.get("lang"))
         field = data["field"]
         user_id = data["user_id"]
         new_value = callback.data.replace(f"{field}_", "") if field == "gender" else int(callback.data.replace("course_", ""))
 
         try:
-            update_user_field(user_id, field if field != "course" else "course_id", new_value)
-            user = get_user_by_tg(user_id)
+            if field == "course":
+                try:
+                    await reserve_course(user_id, new_value)
+                except SeatUnavailableError:
+                    await callback.message.answer(t(lang, "course_full"))
+                    await callback.answer()
+                    return
+                # Eski kursdagi joy bo'shagan bo'lishi mumkin: navbatdagilarga
+                seat_sweeper.wake()
+            else:
+                await update_user_field_by_internal_id(user_id, field, new_value)
+            user = await get_user_by_internal_id(user_id)
             course_id = user['course_id']
             is_paid = user['is_paid']
-            course_name = next((c['name'] for c in list_courses() if c['id'] == course_id), TRANSLATIONS[lang]["no_course"])
+            course_name = await get_course_name(course_id, t(lang, "no_course"))
             reg_message_id = user['registration_message_id']
-            await send_or_edit_reg_to_group(user, course_name, reg_message_id)
-            buttons = [
-                (TRANSLATIONS[lang]["choose_course"], "choose_course") if not course_id or not is_paid else None,
-                (f"{TRANSLATIONS[lang]['pay_now']} ({course_name})", f"pay_now:{course_id}") if course_id and not is_paid else None,
-                (TRANSLATIONS[lang]["cancel"], "cancel")
-            ]
-            buttons = [b for b in buttons if b]
-            kb = create_inline_keyboard(buttons)
-            await callback.message.answer(TRANSLATIONS[lang]["field_updated"], reply_markup=kb)
+            send_or_edit_reg_to_group(user, course_name, reg_message_id)
+            kb = profile_keyboard(lang, course_id, is_paid, course_name)
+            await callback.message.answer(t(lang, "field_updated"), reply_markup=kb)
             await state.clear()
             await callback.answer()
             logger.info(f"User {callback.from_user.id} updated {field} to {new_value} and updated group post.")
         except Exception as e:
-            await callback.message.answer(TRANSLATIONS[lang]["error"].format(error=str(e)))
+            await callback.message.answer(t(lang, "error", error=str(e)))
             await callback.answer(show_alert=True)
             logger.error(f"Error updating {field} for user {callback.from_user.id}: {str(e)}")
 
     @dp.callback_query(F.data == "cancel")
     async def cancel_action(callback: CallbackQuery, state: FSMContext):
         data = await state.get_data()
-        lang = data.get("lang", "uz")
-        await callback.message.answer(TRANSLATIONS[lang]["registration_canceled"])
+        lang = i18n.lang(data.get("lang"))
+        await callback.message.answer(t(lang, "registration_canceled"))
         await state.clear()
         await callback.answer()
         logger.info(f"User {callback.from_user.id} canceled action.")
\ No newline at end of file
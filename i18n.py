@@ -0,0 +1,105 @@
+# i18n.py
+"""Localized texts loaded once from `translations.json`.
+
+The file is validated at import: every language is checked against the
+default one (`uz`). Missing keys fall back to the default text with a warning.
+A template whose placeholders differ from the default raises ValueError at
+startup instead of a KeyError in the middle of a conversation. Templates are
+split at load time: static texts are returned as is and only texts with
+placeholders go through `str.format`.
+
+    from i18n import t
+    t(lang, "course_selected", course=name)
+"""
+import json
+import logging
+import os
+import string
+from typing import Any, Callable, Dict, FrozenSet, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANG = "uz"
+TRANSLATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "translations.json")
+
+
+def _fields(text: str) -> FrozenSet[str]:
+    return frozenset(name for _, name, _, _ in string.Formatter().parse(text) if name)
+
+
+class Translations:
+    def __init__(self, raw: Dict[str, Dict[str, str]], default: str = DEFAULT_LANG) -> None:
+        if default not in raw:
+            raise ValueError(f"Default language '{default}' is missing in translations")
+        self.default = default
+        self.languages = tuple(raw)
+        base = raw[default]
+        base_fields = {key: _fields(text) for key, text in base.items()}
+
+        self._static: Dict[str, Dict[str, str]] = {}
+        self._templates: Dict[str, Dict[str, Callable[..., str]]] = {}
+        for lang, texts in raw.items():
+            missing = base.keys() - texts.keys()
+            if missing:
+                logger.warning(f"Translations '{lang}': {len(missing)} keys fall back to '{default}': {sorted(missing)}")
+            extra = texts.keys() - base.keys()
+            if extra:
+                logger.warning(f"Translations '{lang}': keys missing in '{default}': {sorted(extra)}")
+
+            static, templates = {}, {}
+            for key in base.keys() | texts.keys():
+                text = texts.get(key, base.get(key))
+                fields = _fields(text)
+                if key in base_fields and fields != base_fields[key]:
+                    raise ValueError(
+                        f"Translations '{lang}.{key}': placeholders {sorted(fields)} "
+                        f"differ from '{default}' {sorted(base_fields[key])}"
+                    )
+                if fields:
+                    templates[key] = text.format
+                else:
+                    static[key] = text
+            self._static[lang] = static
+            self._templates[lang] = templates
+        self._reported: Set[str] = set()
+
+    @classmethod
+    def load(cls, path: str = TRANSLATIONS_PATH) -> "Translations":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def lang(self, lang: Optional[str]) -> str:
+        """Normalize a stored language code; unknown or empty codes map to the default."""
+        return lang if lang in self._static else self.default
+
+    def has(self, key: str) -> bool:
+        return key in self._static[self.default] or key in self._templates[self.default]
+
+    def t(self, lang: Optional[str], key: str, **kwargs: Any) -> str:
+        lang = lang if lang in self._static else self.default
+        text = self._static[lang].get(key)
+        if text is not None:
+            return text
+        template = self._templates[lang].get(key)
+        if template is not None:
+            return template(**kwargs)
+        if key not in self._reported:
+            self._reported.add(key)
+            logger.warning(f"Missing translation key: {key}")
+        return key
+
+
+i18n = Translations.load()
+t = i18n.t
+
+
+def gender_label(lang: Optional[str], gender: Optional[str]) -> str:
+    if gender == "erkak":
+        return t(lang, "gender_male")
+    if gender == "ayol":
+        return t(lang, "gender_female")
+    return t(lang, "gender_all")
+
+
+def paid_label(lang: Optional[str], is_paid: Any) -> str:
+    return t(lang, "paid" if is_paid else "not_paid")
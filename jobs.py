@@ -0,0 +1,115 @@
+# jobs.py
+"""Background job queue for slow admin work (exports).
+
+A job is identified by a key; submitting a key that is already queued or
+running returns the existing job, so two admins asking for the same export
+share one run. Concurrency is capped with a semaphore. Progress reported from
+worker threads is forwarded to the event loop and passed to an optional
+`on_progress` coroutine at most once per `progress_interval` seconds; a job
+calls `stop_progress()` before sending its final result so a late progress
+update cannot overwrite it.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, key: str) -> None:
+        self.key = key
+        self.status = "queued"  # queued | running | done | failed
+        self.done = 0
+        self.total: Optional[int] = None
+        # (chat_id, progress message_id) - natija kimga yuborilishi kerak
+        self.subscribers: List[Tuple[int, int]] = []
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._reporter: Optional[asyncio.Task] = None
+        # on_progress bajarilayotganda band: stop_progress uni o'rtasida to'xtatmaydi
+        self._reporting = asyncio.Lock()
+
+    def subscribe(self, chat_id: int, message_id: int) -> None:
+        self.subscribers.append((chat_id, message_id))
+
+    def report(self, done: int, total: Optional[int] = None) -> None:
+        """Thread-safe progress update (may be called from a worker thread)."""
+        self._loop.call_soon_threadsafe(self._set_progress, done, total)
+
+    async def stop_progress(self) -> None:
+        """Stop progress updates; waits for an update that is already being sent."""
+        if self._reporter is None:
+            return
+        async with self._reporting:
+            self._reporter.cancel()
+        await asyncio.gather(self._reporter, return_exceptions=True)
+        self._reporter = None
+
+    def _set_progress(self, done: int, total: Optional[int]) -> None:
+        self.done = done
+        if total is not None:
+            self.total = total
+        self._changed.set()
+
+
+JobRunner = Callable[[Job], Awaitable[None]]
+ProgressHook = Callable[[Job], Awaitable[None]]
+
+
+class JobQueue:
+    def __init__(self, max_concurrency: int, progress_interval: float = 2.0) -> None:
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._progress_interval = progress_interval
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def get(self, key: str) -> Optional[Job]:
+        return self._jobs.get(key)
+
+    def submit(self, key: str, run: JobRunner,
+               on_progress: Optional[ProgressHook] = None) -> Tuple[Job, bool]:
+        """Return (job, created). If `key` is already queued/running, its job is reused."""
+        job = self._jobs.get(key)
+        if job is not None:
+            return job, False
+        job = Job(key)
+        self._jobs[key] = job
+        task = asyncio.create_task(self._execute(job, run, on_progress))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job, True
+
+    async def _report_progress(self, job: Job, on_progress: ProgressHook) -> None:
+        while True:
+            await job._changed.wait()
+            job._changed.clear()
+            async with job._reporting:
+                try:
+                    await on_progress(job)
+                except Exception as e:
+                    logger.warning(f"Progress update for job {job.key} failed: {e}")
+            await asyncio.sleep(self._progress_interval)
+
+    async def _execute(self, job: Job, run: JobRunner,
+                       on_progress: Optional[ProgressHook]) -> None:
+        try:
+            async with self._semaphore:
+                job.status = "running"
+                if on_progress:
+                    job._reporter = asyncio.create_task(self._report_progress(job, on_progress))
+                await run(job)
+                job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            logger.error(f"Job {job.key} failed: {e}")
+        finally:
+            if job._reporter:
+                job._reporter.cancel()
+            self._jobs.pop(job.key, None)
+
+    async def close(self) -> None:
+        """Cancel all jobs and wait for them (exports also wait for their writer thread)."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
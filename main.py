@@ -2,14 +2,30 @@
 import asyncio
 import logging
 import os
+import signal
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.dispatcher.event.handler import HandlerObject
 from aiogram.types import BotCommand
 from dotenv import load_dotenv
+from config import (
+    FSM_FLUSH_INTERVAL, FSM_TTL_HOURS, FUNNEL_RETENTION_DAYS, RUN_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBAPP_HOST, WEBAPP_PORT, UPDATE_CONCURRENCY, SHUTDOWN_DRAIN_TIMEOUT,
+    TELEGRAM_CONN_LIMIT, TELEGRAM_KEEPALIVE, TELEGRAM_DNS_TTL, TELEGRAM_TIMEOUT,
+    METRICS_HOST, METRICS_PORT
+)
 from database import init_db
+from metrics import metrics
+from middlewares import ApiTimingMiddleware, ConcurrencyLimitMiddleware, HandlerTimingMiddleware
+from outbox import outbox
+from analytics import analytics
+from broadcast import broadcasts
+from seats import seat_sweeper
+from storage import SQLiteStorage
+import async_db
 from handlers.registration import register_handlers as reg_register
 from handlers.payment import register_payment_handlers
-from handlers.admin import register_admin_handlers
+from handlers.admin import export_jobs, register_admin_handlers
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,6 +36,25 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 
+# Ulanishlar qayta ishlatilsin: keep-alive va DNS keshi. aiogramda bu TCPConnector
+# parametrlari uchun ochiq sozlama yo'q, ular _connector_init ga qo'shiladi
+# (aiogram 3.21 da tekshirilgan, requirements.txt da qotirilgan - yangilanganda qayta tekshiring)
+class KeepAliveSession(AiohttpSession):
+    def __init__(self, keepalive_timeout: float, ttl_dns_cache: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._connector_init.update(keepalive_timeout=keepalive_timeout, ttl_dns_cache=ttl_dns_cache)
+
+# Jarayondagi yagona Bot: handlerlar uni dispatcherdan `bot` sifatida oladi
+def create_bot() -> Bot:
+    session = KeepAliveSession(
+        keepalive_timeout=TELEGRAM_KEEPALIVE,
+        ttl_dns_cache=TELEGRAM_DNS_TTL,
+        limit=TELEGRAM_CONN_LIMIT,
+        timeout=TELEGRAM_TIMEOUT,
+    )
+    session.middleware(ApiTimingMiddleware())
+    return Bot(token=BOT_TOKEN, session=session)
+
 async def set_default_commands(bot: Bot) -> None:
     commands = [
         BotCommand(command="start", description="⚪️ Botni ishga tushirish"),
@@ -28,22 +63,120 @@ async def set_default_commands(bot: Bot) -> None:
     await bot.set_my_commands(commands)
     logger.info("Default commands set successfully.")
 
+# Prometheus matn formatidagi latency histogrammalari
+async def metrics_endpoint(request):
+    from aiohttp import web
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+async def run_polling(dp: Dispatcher, bot: Bot, limiter: ConcurrencyLimitMiddleware) -> None:
+    await bot.delete_webhook()
+    runner = None
+    if METRICS_PORT:
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/metrics", metrics_endpoint)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        logger.info(f"Metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    # Ishlayotgan handlerlar FSM storage yopilishidan (dp.fsm.close) oldin tugashi kerak:
+    # drain shutdown ro'yxatining boshiga qo'yiladi
+    async def drain_updates() -> None:
+        await limiter.drain(SHUTDOWN_DRAIN_TIMEOUT)
+
+    dp.shutdown.handlers.insert(0, HandlerObject(callback=drain_updates))
+    logger.info("Bot is starting (polling)...")
+    try:
+        # Sessiyani main() yopadi: outbox navbati bo'shagandan keyin
+        await dp.start_polling(bot, polling_timeout=10, close_bot_session=False)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+# SIGINT/SIGTERM gacha yangilanishlarni aiohttp orqali qabul qiladi, so'ng ishlayotgan handlerlarni kutadi
+async def run_webhook(dp: Dispatcher, bot: Bot, limiter: ConcurrencyLimitMiddleware) -> None:
+    from aiohttp import web
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+    class RequestHandler(SimpleRequestHandler):
+        # polling'dagi close_bot_session=False o'rniga: sessiyani main() outbox'dan keyin yopadi
+        async def close(self) -> None:
+            pass
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "mode": "webhook", "in_flight": limiter.in_flight})
+
+    app = web.Application()
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    RequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    await bot.set_webhook(
+        f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Bot is starting (webhook on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH})...")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Shutting down: no new updates, draining in-flight handlers...")
+        await site.stop()
+        await limiter.drain(SHUTDOWN_DRAIN_TIMEOUT)
+        await runner.cleanup()
+
 async def main() -> None:
+    bot = None
     try:
         init_db()
-        bot = Bot(token=BOT_TOKEN)
-        dp = Dispatcher(storage=MemoryStorage())
+        bot = create_bot()
+        dp = Dispatcher(storage=SQLiteStorage(
+            flush_interval=FSM_FLUSH_INTERVAL,
+            ttl=FSM_TTL_HOURS * 3600,
+            track_states=("Registration",),
+            track_retention=FUNNEL_RETENTION_DAYS * 86400,
+        ))
+        limiter = ConcurrencyLimitMiddleware(UPDATE_CONCURRENCY)
+        dp.update.outer_middleware(limiter)
+        timing = HandlerTimingMiddleware()
+        dp.message.middleware(timing)
+        dp.callback_query.middleware(timing)
         register_admin_handlers(dp)
 
         reg_register(dp)
         await register_payment_handlers(dp)  # Assuming synchronous; use await if async
         await set_default_commands(bot)
+        outbox.start(bot)
+        await broadcasts.resume_all()
+        seat_sweeper.start()
 
-        logger.info("Bot is starting...")
-        await dp.start_polling(bot, polling_timeout=10)
+        if RUN_MODE == "webhook":
+            await run_webhook(dp, bot, limiter)
+        else:
+            await run_polling(dp, bot, limiter)
     except Exception as e:
         logger.error(f"Failed to start bot: {str(e)}")
         raise
+    finally:
+        await seat_sweeper.stop()
+        await broadcasts.stop()
+        analytics.shutdown()
+        # Eksport threadlari pooldagi ulanishni ishlatadi: ular to'xtab bo'lguncha kutiladi
+        await export_jobs.close()
+        await outbox.stop(SHUTDOWN_DRAIN_TIMEOUT)
+        if bot is not None:
+            await bot.session.close()
+        async_db.shutdown()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+# metrics.py
+"""In-memory latency histograms in the Prometheus text format.
+
+Three families are recorded:
+
+* `bot_handler_seconds{route=...}` - update handlers, by callback data prefix
+  (`pay_approve:`, `course_`), command (`/start`) or FSM state;
+* `bot_db_seconds{func=...}` - blocking DB calls run through `async_db.run`;
+* `bot_telegram_api_seconds{method=...}` - Bot API requests.
+
+`observe()` is thread-safe (DB timings are recorded from worker threads).
+`render()` produces the `/metrics` HTTP response; `top()` feeds the admin
+`/metrics` command.
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FAMILIES = {
+    "bot_handler_seconds": ("route", "Update handler latency"),
+    "bot_db_seconds": ("func", "Blocking database call latency"),
+    "bot_telegram_api_seconds": ("method", "Telegram Bot API request latency"),
+}
+COUNTERS = {
+    "bot_handler_errors_total": ("route", "Update handlers that raised"),
+    "bot_telegram_api_errors_total": ("method", "Telegram Bot API requests that failed"),
+}
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        # oxirgi katak: +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate from the buckets with linear interpolation (as Prometheus does)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._counters: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, family: str, label: str, seconds: float) -> None:
+        with self._lock:
+            hist = self._histograms.get((family, label))
+            if hist is None:
+                hist = self._histograms[(family, label)] = Histogram(self.buckets)
+            hist.observe(seconds)
+
+    def inc(self, counter: str, label: str) -> None:
+        with self._lock:
+            self._counters[(counter, label)] = self._counters.get((counter, label), 0) + 1
+
+    def top(self, family: str, limit: int = 10) -> List[Dict[str, object]]:
+        """Labels of a family by total time spent, largest first."""
+        with self._lock:
+            rows = [
+                {
+                    "label": label,
+                    "count": h.count,
+                    "total": h.sum,
+                    "avg": h.sum / h.count,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                }
+                for (fam, label), h in self._histograms.items()
+                if fam == family and h.count
+            ]
+        rows.sort(key=lambda r: r["total"], reverse=True)
+        return rows[:limit]
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for family, (label_name, help_text) in FAMILIES.items():
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} histogram")
+                for (fam, label), h in sorted(self._histograms.items()):
+                    if fam != family:
+                        continue
+                    value = _escape(label)
+                    cumulative = 0
+                    for bound, n in zip(self.buckets, h.counts):
+                        cumulative += n
+                        lines.append(f'{family}_bucket{{{label_name}="{value}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{family}_bucket{{{label_name}="{value}",le="+Inf"}} {h.count}')
+                    lines.append(f'{family}_sum{{{label_name}="{value}"}} {h.sum:.6f}')
+                    lines.append(f'{family}_count{{{label_name}="{value}"}} {h.count}')
+            for counter, (label_name, help_text) in COUNTERS.items():
+                lines.append(f"# HELP {counter} {help_text}")
+                lines.append(f"# TYPE {counter} counter")
+                for (name, label), n in sorted(self._counters.items()):
+                    if name == counter:
+                        lines.append(f'{counter}{{{label_name}="{_escape(label)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Registry()
@@ -0,0 +1,116 @@
+# middlewares.py
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Outer update middleware: at most `limit` updates are processed at once.
+
+    Updates above the limit wait for a free slot. The middleware also counts
+    in-flight updates so shutdown can wait for them with `drain()`.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self._semaphore = asyncio.Semaphore(limit)
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self._in_flight += 1
+        self._idle.clear()
+        try:
+            async with self._semaphore:
+                return await handler(event, data)
+        finally:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait until no update is being processed. Returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._in_flight} updates still in flight after {timeout}s")
+            return False
+
+
+# Bot ro'yxatdan o'tkazgan buyruqlar (handlers/*: Command(...)). Boshqa "/..." matnlar
+# foydalanuvchi kiritgan ixtiyoriy matn: ular label bo'lmaydi
+COMMAND_ROUTES = frozenset({
+    "/start", "/admin", "/edituser", "/setlimit", "/reconcilestats", "/metrics", "/broadcast", "/bcancel",
+})
+
+
+def route_of(event: TelegramObject, data: Dict[str, Any]) -> str:
+    """Low-cardinality name of what an update triggers: callback data prefix
+    (`pay_approve:`, `course_`), a registered command (`/start`) or the current
+    FSM state."""
+    if isinstance(event, CallbackQuery):
+        cb = event.data or ""
+        i = cb.find(":")
+        return cb[:i + 1] if i >= 0 else cb.rstrip("0123456789-")
+    if isinstance(event, Message):
+        text = event.text or ""
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0].split("@", 1)[0]
+            if command in COMMAND_ROUTES:
+                return command
+        return data.get("raw_state") or "message"
+    return type(event).__name__
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Inner middleware: records handler latency in `bot_handler_seconds` by route."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        route = route_of(event, data)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.inc("bot_handler_errors_total", route)
+            raise
+        finally:
+            metrics.observe("bot_handler_seconds", route, time.perf_counter() - started)
+
+
+class ApiTimingMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: records every Bot API request in `bot_telegram_api_seconds`."""
+
+    async def __call__(self, make_request: Callable[..., Awaitable[Any]], bot: Any, method: Any) -> Any:
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            metrics.inc("bot_telegram_api_errors_total", name)
+            raise
+        finally:
+            metrics.observe("bot_telegram_api_seconds", name, time.perf_counter() - started)
@@ -0,0 +1,306 @@
+# migrations.py
+"""Versioned schema migrations for the bot's SQLite database.
+
+Every step in `MIGRATIONS` runs once, in order, inside its own transaction,
+and its version is recorded in `schema_version`. A routine restart only reads
+`MAX(version)`, so startup no longer depends on the size of the tables.
+
+Databases created before versioning already contain part of this schema, so
+the steps up to `BASELINE_VERSION` are written to be idempotent (IF NOT
+EXISTS, column checks). New steps are appended with the next version number
+and are never edited once released.
+"""
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    cur = conn.execute(f"PRAGMA table_info({table})")
+    return any(r[1] == column for r in cur.fetchall())
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> None:
+    if not _column_exists(conn, table, column):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+# -----------------------------
+# Migratsiya qadamlari
+# -----------------------------
+
+def _m001_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            description TEXT,
+            gender TEXT CHECK(gender IN ('erkak', 'ayol', 'hammasi')) DEFAULT 'hammasi',
+            boshlanish_sanasi TEXT,
+            limit_count INTEGER DEFAULT 0,
+            joylar_soni INTEGER DEFAULT 0,
+            narx REAL DEFAULT 0.0,
+            created_at TEXT DEFAULT (datetime('now'))
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tg_id INTEGER UNIQUE,
+            lang TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            birth_date TEXT,             -- YYYY-MM-DD
+            gender TEXT,
+            phone TEXT,
+            address TEXT,                -- manzil
+            passport_front TEXT,         -- passport oldi rasmi
+            passport_back TEXT,          -- passport orqa rasmi
+            course_id INTEGER,
+            registered_at TEXT DEFAULT (datetime('now')),
+            is_paid INTEGER DEFAULT 0,   -- 0 yoki 1
+            paid_at TEXT,
+            registration_message_id INTEGER,
+            FOREIGN KEY(course_id) REFERENCES courses(id)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            method TEXT,
+            proof_file_id TEXT,
+            status TEXT CHECK(status IN ('pending','approved','rejected')) DEFAULT 'pending',
+            created_at TEXT DEFAULT (datetime('now')),
+            reviewed_by INTEGER,
+            reviewed_at TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """
+    )
+
+
+def _m002_legacy_columns(conn: sqlite3.Connection) -> None:
+    # Eski kodda age bo'lgan: endi birth_date ishlatiladi
+    _add_column(conn, "users", "birth_date", "TEXT")
+    _add_column(conn, "users", "registration_message_id", "INTEGER")
+    # registered_at, created_at defaultlari yo'q bo'lgan eski bazalar uchun (bir marta)
+    conn.execute("UPDATE users SET registered_at = datetime('now') WHERE registered_at IS NULL")
+    conn.execute("UPDATE payments SET created_at = datetime('now') WHERE created_at IS NULL")
+    conn.execute("UPDATE courses SET created_at = datetime('now') WHERE created_at IS NULL")
+
+
+def _m003_indexes(conn: sqlite3.Connection) -> None:
+    # (course_id, is_paid) kurs bo'yicha sanash va to'lov holati bo'linishini qoplaydi
+    conn.execute("DROP INDEX IF EXISTS idx_users_course_id")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_course_paid ON users(course_id, is_paid)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_gender ON users(gender)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_id ON payments(user_id)")
+
+
+def _m004_fsm_storage(conn: sqlite3.Connection) -> None:
+    # FSM holatlari (aiogram storage): kalit -> holat + ixcham JSON data
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage(updated_at)")
+
+
+def _m005_broadcasts(conn: sqlite3.Connection) -> None:
+    # Ommaviy xabarlar (broadcast): filtrlar va davom ettirish uchun progress
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            course_id INTEGER,
+            gender TEXT,
+            is_paid INTEGER,
+            lang TEXT,
+            status TEXT CHECK(status IN ('running','done','cancelled')) DEFAULT 'running',
+            last_user_id INTEGER DEFAULT 0,
+            delivered INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_by INTEGER,
+            created_at TEXT DEFAULT (datetime('now')),
+            finished_at TEXT
+        )
+        """
+    )
+
+
+def _m006_seat_holds(conn: sqlite3.Connection) -> None:
+    # courses.held: band qilingan (hali tasdiqlanmagan) joylar soni.
+    # expires_at NULL - chek admin ko'rib chiqishini kutmoqda (muddati o'tmaydi)
+    _add_column(conn, "courses", "held", "INTEGER DEFAULT 0")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS seat_holds (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+            course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+            expires_at REAL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_seat_holds_expires_at ON seat_holds(expires_at)")
+
+
+def _m007_waitlist(conn: sqlite3.Connection) -> None:
+    # Kutish navbati: to'lgan kurs uchun, har bir foydalanuvchida ko'pi bilan bitta
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL UNIQUE REFERENCES users(id) ON DELETE CASCADE,
+            course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+            created_at TEXT DEFAULT (datetime('now'))
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_waitlist_course_id ON waitlist(course_id)")
+
+
+def _m008_payment_proof_unique(conn: sqlite3.Connection) -> None:
+    # Bir xil chekni (Telegram file_unique_id) qayta yuborishni aniqlash uchun
+    _add_column(conn, "payments", "proof_unique_id", "TEXT")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_proof_unique_id "
+        "ON payments(proof_unique_id) WHERE proof_unique_id IS NOT NULL"
+    )
+
+
+def _m009_payments_status_id(conn: sqlite3.Connection) -> None:
+    # (status, id) kutilayotgan to'lovlarni id bo'yicha sahifalashni qoplaydi
+    conn.execute("DROP INDEX IF EXISTS idx_payments_status")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_status_id ON payments(status, id)")
+
+
+# stats_counters qatorlari (metric, key, qiymat) jadvallardan hisoblanganda. _m010 va
+# database.reconcile_stats() shu bitta ta'rifdan foydalanadi
+STATS_SOURCE_SQL = """
+    SELECT 'users', 'total', COUNT(*) FROM users
+    UNION ALL SELECT 'users', 'paid', COUNT(*) FROM users WHERE is_paid = 1
+    UNION ALL SELECT 'course', CAST(course_id AS TEXT), COUNT(*) FROM users
+              WHERE course_id IS NOT NULL GROUP BY course_id
+    UNION ALL SELECT 'course_paid', CAST(course_id AS TEXT), COUNT(*) FROM users
+              WHERE course_id IS NOT NULL AND is_paid = 1 GROUP BY course_id
+    UNION ALL SELECT 'gender', COALESCE(gender, ''), COUNT(*) FROM users GROUP BY 2
+    UNION ALL SELECT 'lang', COALESCE(lang, ''), COUNT(*) FROM users GROUP BY 2
+    UNION ALL SELECT 'day', COALESCE(substr(registered_at, 1, 10), ''), COUNT(*) FROM users GROUP BY 2
+    UNION ALL SELECT 'payments', COALESCE(status, ''), COUNT(*) FROM payments GROUP BY 2
+"""
+
+
+def _m010_stats_counters(conn: sqlite3.Connection) -> None:
+    # Statistika hisoblagichlari: (metric, key) -> qiymat; yozuvlar bilan bir tranzaksiyada yangilanadi
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            metric TEXT NOT NULL,
+            key TEXT NOT NULL DEFAULT '',
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, key)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute("DELETE FROM stats_counters")
+    conn.execute(f"INSERT INTO stats_counters (metric, key, value) {STATS_SOURCE_SQL}")
+
+
+def _m011_analytics_indexes(conn: sqlite3.Connection) -> None:
+    # Analitika vaqt oralig'i bo'yicha o'qiydi: ro'yxatdan o'tish va chek yuborish vaqtlari
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_registered_at ON users(registered_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_created_at ON payments(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_payments_reviewed_at ON payments(reviewed_at)")
+
+
+def _m012_funnel_events(conn: sqlite3.Connection) -> None:
+    # FSM holatlari orasidagi o'tishlar (faqat qo'shiladi): ro'yxatdan o'tish voronkasi uchun
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS funnel_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            prev_state TEXT,
+            state TEXT,
+            at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_funnel_events_at ON funnel_events(at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_funnel_events_user_id ON funnel_events(user_id, id)")
+
+
+# (versiya, nom, qadam) - faqat oxiriga qo'shiladi
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "base tables", _m001_base_tables),
+    (2, "legacy columns and defaults", _m002_legacy_columns),
+    (3, "users/payments indexes", _m003_indexes),
+    (4, "fsm storage", _m004_fsm_storage),
+    (5, "broadcasts", _m005_broadcasts),
+    (6, "seat holds", _m006_seat_holds),
+    (7, "waitlist", _m007_waitlist),
+    (8, "payment proof unique id", _m008_payment_proof_unique),
+    (9, "payments (status, id) index", _m009_payments_status_id),
+    (10, "stats counters", _m010_stats_counters),
+    (11, "analytics indexes", _m011_analytics_indexes),
+    (12, "funnel events", _m012_funnel_events),
+]
+
+# Versiyalashdan oldingi bazalarda shu versiyagacha bo'lgan sxema qisman mavjud bo'lishi mumkin
+BASELINE_VERSION = 9
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply pending migrations on an autocommit connection; returns the resulting version."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT DEFAULT (datetime('now'))
+        )
+        """
+    )
+    version = current_version(conn)
+    if version >= MIGRATIONS[-1][0]:
+        return version
+
+    for number, name, step in MIGRATIONS:
+        if number <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Boshqa jarayon shu orada qo'llagan bo'lishi mumkin
+            if current_version(conn) >= number:
+                conn.execute("COMMIT")
+                continue
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (number, name))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        version = number
+        logger.info(f"Applied schema migration {number}: {name}")
+    return version
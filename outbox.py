@@ -0,0 +1,198 @@
+# outbox.py
+"""Rate-limited outbound message dispatcher.
+
+Handlers call `outbox.submit(chat_id, "send_message", text=...)` and return
+immediately; worker tasks perform the Bot API calls in the background.
+
+Rate limiting follows Telegram's published limits: a global token bucket
+(about 30 messages/s per bot) and a per-chat one (1 message/s in private chats,
+20 messages/min in groups). A per-chat slot is reserved when a request is first
+picked up, and the request is re-queued until that slot comes due. This keeps
+per-chat order without stalling workers on slow chats. `RetryAfter` pushes the
+chat's schedule back by the time Telegram asks for; network and 5xx errors are
+retried with backoff; 403 and 400 fail the request at once.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from config import OUTBOX_GLOBAL_RATE, OUTBOX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+PRIVATE_CHAT_INTERVAL = 1.0      # 1 xabar / soniya
+GROUP_CHAT_INTERVAL = 60 / 20    # 20 xabar / daqiqa
+MAX_RETRIES = 3
+
+SuccessHook = Callable[[Any], Awaitable[None]]
+
+
+class TokenBucket:
+    """Reservation-style token bucket: `reserve()` returns when the caller may send."""
+
+    def __init__(self, interval: float, burst: int = 1) -> None:
+        self.interval = interval
+        self.burst = burst
+        self._next = 0.0
+
+    def reserve(self, weight: int = 1) -> float:
+        now = time.monotonic()
+        # `burst` ta xabargacha oldindan to'planishi mumkin
+        start = max(self._next, now - self.interval * (self.burst - 1))
+        self._next = start + self.interval * weight
+        return max(start, now)
+
+    def push_back(self, until: float) -> None:
+        self._next = max(self._next, until)
+
+
+class _Request:
+    __slots__ = ("chat_id", "method", "kwargs", "weight", "future", "on_success", "not_before", "attempts")
+
+    def __init__(self, chat_id: int, method: str, kwargs: Dict[str, Any], weight: int,
+                 future: asyncio.Future, on_success: Optional[SuccessHook]) -> None:
+        self.chat_id = chat_id
+        self.method = method
+        self.kwargs = kwargs
+        self.weight = weight
+        self.future = future
+        self.on_success = on_success
+        self.not_before: Optional[float] = None
+        self.attempts = 0
+
+
+class OutboundDispatcher:
+    def __init__(self, workers: int = 8, global_rate: float = 30.0) -> None:
+        self.workers = workers
+        self._global = TokenBucket(1 / global_rate, burst=int(global_rate))
+        self._chats: Dict[int, TokenBucket] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+        self.bot: Optional[Bot] = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self, bot: Bot) -> None:
+        self.bot = bot
+        self._queue = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            interval = PRIVATE_CHAT_INTERVAL if chat_id > 0 else GROUP_CHAT_INTERVAL
+            bucket = self._chats[chat_id] = TokenBucket(interval)
+        return bucket
+
+    def submit(self, chat_id: int, method: str, on_success: Optional[SuccessHook] = None,
+               **kwargs: Any) -> asyncio.Future:
+        """Queue `bot.<method>(chat_id=chat_id, **kwargs)`; returns a future with the API result."""
+        if self._queue is None:
+            raise RuntimeError("Outbound dispatcher is not started")
+        future = asyncio.get_running_loop().create_future()
+        # natijani hech kim kutmasa ham xato "never retrieved" bo'lib qolmasin
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        weight = len(kwargs.get("media") or ()) or 1
+        self._pending += 1
+        self._idle.clear()
+        self._queue.put_nowait(_Request(chat_id, method, kwargs, weight, future, on_success))
+        return future
+
+    def _finish(self, request: _Request, result: Any = None, error: Optional[BaseException] = None) -> None:
+        if not request.future.done():
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(result)
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+
+    def _requeue(self, request: _Request, at: float) -> None:
+        delay = max(0.0, at - time.monotonic())
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, request)
+
+    async def _worker(self) -> None:
+        while True:
+            request = await self._queue.get()
+            try:
+                await self._process(request)
+            except Exception as e:  # kutilmagan xato workerni o'ldirmasin
+                logger.error(f"Outbox worker error for chat {request.chat_id}: {str(e)}")
+                self._finish(request, error=e)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, request: _Request) -> None:
+        now = time.monotonic()
+        if request.not_before is None:
+            request.not_before = self._chat_bucket(request.chat_id).reserve(request.weight)
+        if request.not_before > now:
+            self._requeue(request, request.not_before)
+            return
+
+        delay = self._global.reserve(request.weight) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        request.attempts += 1
+        try:
+            result = await getattr(self.bot, request.method)(chat_id=request.chat_id, **request.kwargs)
+        except TelegramRetryAfter as e:
+            until = time.monotonic() + e.retry_after
+            self._chat_bucket(request.chat_id).push_back(until)
+            logger.warning(f"Flood limit for chat {request.chat_id}: retry after {e.retry_after}s")
+            request.not_before = until
+            self._requeue(request, until)
+            return
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            self.failed += 1
+            logger.warning(f"{request.method} to {request.chat_id} failed: {str(e)}")
+            self._finish(request, error=e)
+            return
+        except (TelegramNetworkError, TelegramServerError) as e:
+            if request.attempts < MAX_RETRIES:
+                request.not_before = time.monotonic() + 2 ** request.attempts
+                self._requeue(request, request.not_before)
+                return
+            self.failed += 1
+            logger.error(f"{request.method} to {request.chat_id} failed after {request.attempts} attempts: {str(e)}")
+            self._finish(request, error=e)
+            return
+
+        self.sent += 1
+        self._finish(request, result=result)
+        if request.on_success is not None:
+            try:
+                await request.on_success(result)
+            except Exception as e:
+                logger.error(f"Outbox on_success hook failed for chat {request.chat_id}: {str(e)}")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Wait up to `timeout` seconds for queued messages, then stop the workers."""
+        if self._idle is not None and self._pending:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Outbox stopped with {self._pending} undelivered messages")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+outbox = OutboundDispatcher(workers=OUTBOX_WORKERS, global_rate=OUTBOX_GLOBAL_RATE)
@@ -0,0 +1,96 @@
+# seats.py
+"""Background release of expired seat holds and waitlist promotion.
+
+A seat is held in `seat_holds` when a user picks a course (see
+`database.reserve_course`). Unpaid holds expire after `SEAT_HOLD_MINUTES`;
+this task returns them to the course when the earliest hold expires (checked
+at least every `interval` seconds) and then gives free seats to the next users
+in the course waitlist, in batches. `wake()` runs a pass right away, e.g.
+after an admin raises a course limit or a user moves to another course.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import async_db
+from config import SEAT_SWEEP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+PromotedHook = Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+
+class SeatSweeper:
+    def __init__(self, interval: float = 60.0, batch_size: int = 50) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        # Navbatdan joy olganlarni xabardor qilish (handlers.registration o'rnatadi)
+        self.on_promoted: Optional[PromotedHook] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._worker())
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def sweep(self) -> int:
+        released = await async_db.release_expired_holds()
+        if released:
+            logger.info(f"Released {len(released)} expired seat holds")
+        return len(released)
+
+    async def promote(self) -> int:
+        total = 0
+        while True:
+            promoted = await async_db.promote_waitlist(self.batch_size)
+            if not promoted:
+                return total
+            total += len(promoted)
+            logger.info(f"Promoted {len(promoted)} users from the waitlist")
+            if self.on_promoted is not None:
+                try:
+                    await self.on_promoted(promoted)
+                except Exception as e:
+                    logger.error(f"Waitlist promotion hook failed: {str(e)}")
+            if len(promoted) < self.batch_size:
+                return total
+
+    async def _next_pass_in(self) -> float:
+        # Joy bo'shashi bilan navbatdagi foydalanuvchi darhol ko'tariladi
+        try:
+            expires_at = await async_db.next_hold_expiry()
+        except Exception as e:
+            logger.error(f"Reading next seat hold expiry failed: {str(e)}")
+            return self.interval
+        if expires_at is None:
+            return self.interval
+        return min(self.interval, max(1.0, expires_at - time.time()))
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+                await self.promote()
+            except Exception as e:
+                logger.error(f"Seat hold sweep failed: {str(e)}")
+            timeout = await self._next_pass_in()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+seat_sweeper = SeatSweeper(interval=SEAT_SWEEP_INTERVAL)
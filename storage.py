@@ -0,0 +1,179 @@
+# storage.py
+"""aiogram FSM storage persisted in the bot's SQLite database.
+
+State and data live in memory for the hot path and are written to the
+`fsm_storage` table in batches every `flush_interval` seconds (and on close),
+so a restart does not lose in-progress registrations. Records that have not
+been touched for `ttl` seconds are treated as abandoned and purged; clean
+records idle for `memory_idle` seconds are dropped from memory (they are
+reloaded from SQLite on the next update).
+
+State changes inside the groups listed in `track_states` are also queued as
+(user_id, prev_state, state, at) and appended to `funnel_events` in the same
+batch write, so the registration funnel costs one list append per transition.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+import async_db
+import database
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(data: Mapping[str, Any]) -> Optional[str]:
+    if not data:
+        return None
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class _Record:
+    __slots__ = ("state", "data", "touched")
+
+    def __init__(self, state: Optional[str], data: Dict[str, Any], touched: float) -> None:
+        self.state = state
+        self.data = data
+        self.touched = touched
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, flush_interval: float = 1.0, ttl: float = 72 * 3600,
+                 sweep_interval: float = 3600, memory_idle: float = 600,
+                 track_states: Sequence[str] = (), track_retention: float = 90 * 86400) -> None:
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.memory_idle = memory_idle
+        # Kuzatiladigan StatesGroup nomlari, masalan ("Registration",)
+        self.track_prefixes = tuple(f"{name}:" for name in track_states)
+        self.track_retention = track_retention
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._records: Dict[str, _Record] = {}
+        self._dirty: Set[str] = set()
+        self._transitions: List[Tuple[int, Optional[str], Optional[str], float]] = []
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    # --- ichki ---
+
+    def _ensure_worker(self) -> None:
+        # close()dan keyin yangi worker ishga tushmaydi: uni hech kim flush qilmaydi
+        if self._closed:
+            logger.warning("FSM storage is closed; late state changes will not be saved.")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._worker())
+
+    async def _record(self, key: StorageKey) -> _Record:
+        k = self.key_builder.build(key)
+        record = self._records.get(k)
+        if record is not None:
+            return record
+        row = await async_db.run(database.fsm_load, k)
+        record = self._records.get(k)  # await paytida boshqa handler yaratgan bo'lishi mumkin
+        if record is not None:
+            return record
+        now = time.time()
+        if row and row[2] >= now - self.ttl:
+            record = _Record(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+        else:
+            record = _Record(None, {}, now)
+        self._records[k] = record
+        self._ensure_worker()
+        return record
+
+    def _touch(self, key: StorageKey, record: _Record) -> None:
+        record.touched = time.time()
+        self._dirty.add(self.key_builder.build(key))
+
+    def _tracked(self, state: Optional[str]) -> bool:
+        return state is not None and state.startswith(self.track_prefixes)
+
+    async def flush(self) -> None:
+        """Write all dirty records and queued state transitions in one transaction."""
+        async with self._flush_lock:
+            if not self._dirty and not self._transitions:
+                return
+            keys, self._dirty = self._dirty, set()
+            events, self._transitions = self._transitions, []
+            rows, deleted = [], []
+            for k in keys:
+                record = self._records.get(k)
+                if record is None or (record.state is None and not record.data):
+                    deleted.append(k)
+                else:
+                    rows.append((k, record.state, _dumps(record.data), record.touched))
+            try:
+                await async_db.run(database.fsm_save_many, rows, deleted, events)
+            except Exception:
+                self._dirty |= keys
+                self._transitions[:0] = events
+                raise
+
+    def _evict_idle(self, older_than: float) -> None:
+        for k in [k for k, r in self._records.items() if r.touched < older_than and k not in self._dirty]:
+            del self._records[k]
+
+    async def _worker(self) -> None:
+        last_evict = last_sweep = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                now = time.monotonic()
+                if now - last_evict >= min(self.memory_idle, 60):
+                    last_evict = now
+                    self._evict_idle(time.time() - self.memory_idle)
+                if now - last_sweep >= self.sweep_interval:
+                    last_sweep = now
+                    purged = await async_db.run(database.fsm_purge_expired, time.time() - self.ttl)
+                    if purged:
+                        logger.info(f"Purged {purged} abandoned FSM records.")
+                    if self.track_prefixes:
+                        await async_db.run(database.funnel_purge, time.time() - self.track_retention)
+            except Exception as e:
+                logger.error(f"FSM storage flush failed: {str(e)}")
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        new_state = state.state if isinstance(state, State) else state
+        if new_state != record.state and (self._tracked(new_state) or self._tracked(record.state)):
+            self._transitions.append((key.user_id, record.state, new_state, time.time()))
+        record.state = new_state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(
+                f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            )
+        record = await self._record(key)
+        record.data = data.copy()
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()